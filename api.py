@@ -0,0 +1,228 @@
+"""
+HTTP API для розпізнавання інгредієнтів та генерації рецептів без Gradio-інтерфейсу.
+
+Запуск кількох процесів:
+    python api.py
+    # або
+    uvicorn api:app --host 0.0.0.0 --port 8000 --workers 4
+
+Довгі завдання можна поставити в чергу (POST /api/jobs) та обробляти окремими
+процесами-воркерами (python jobs.py).
+"""
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+import logging
+import os
+
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from image_ingest import prepare_image_bytes
+from jobs import create_store, create_worker_pool, is_webhook_allowed, webhook_hosts
+from services import (
+    ingredient_recognizer, recipe_generator, validate_image, prescreen_image, difficulty_map,
+    max_image_edge, jpeg_quality, max_images_per_request, batch_concurrency
+)
+import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class RecipeResponse(BaseModel):
+    ingredients: List[str]
+    difficulty: str
+    compatible: Optional[bool] = None
+    recipe: Optional[Dict[str, Any]] = None
+    message: Optional[str] = None
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    attempts: int = 0
+    result: Optional[RecipeResponse] = None
+    error: Optional[str] = None
+
+job_store = create_store()
+
+# Кількість воркерів черги в процесі API (0 - лише окремі процеси `python jobs.py`)
+api_job_workers = int(os.getenv("API_JOB_WORKERS", 0))
+
+# Хости, на які дозволено надсилати webhook (JOB_WEBHOOK_HOSTS)
+allowed_webhook_hosts = webhook_hosts()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    pool = None
+    if api_job_workers > 0:
+        pool = create_worker_pool(job_store, api_job_workers)
+        pool.start()
+    try:
+        yield
+    finally:
+        if pool is not None:
+            await pool.stop()
+
+app = FastAPI(title="Генератор рецептів", version="1.0", lifespan=lifespan)
+
+async def _read_images(images: List[UploadFile]) -> List[bytes]:
+    """
+    Validate uploaded photos and prepare the bytes sent to Gemini.
+
+    Uploads are read straight from the spooled multipart files: the header check
+    does not decode pixels, the pre-screen decodes only a small draft copy, and the
+    payload is read once (or decoded once when it has to be downscaled) in a worker
+    thread so the event loop stays free.
+
+    Args:
+        images: Uploaded photos
+
+    Returns:
+        Prepared JPEG bytes of each photo
+    """
+    if not images:
+        raise HTTPException(status_code=400, detail="Будь ласка, завантажте зображення продуктів.")
+    if len(images) > max_images_per_request:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Можна завантажити не більше {max_images_per_request} зображень за один раз."
+        )
+
+    prepared_images = []
+    for image in images:
+        with metrics.stage("validation"):
+            is_valid, message, _ = await run_in_threadpool(validate_image, image.file)
+        if is_valid:
+            with metrics.stage("prescreen"):
+                is_valid, message = await run_in_threadpool(prescreen_image, image.file)
+        if not is_valid:
+            raise HTTPException(status_code=400, detail=f"{image.filename}: {message}")
+        with metrics.stage("encoding"):
+            prepared = await run_in_threadpool(prepare_image_bytes, image.file, max_image_edge, jpeg_quality)
+        metrics.record_bytes("image_upload", prepared.original_bytes)
+        metrics.record_bytes("image_sent", prepared.bytes_sent)
+        prepared_images.append(prepared.image_bytes)
+    return prepared_images
+
+@app.post("/api/recipes", response_model=RecipeResponse)
+async def create_recipe(
+    images: List[UploadFile] = File(..., description="Фото продуктів у форматі JPEG"),
+    difficulty: str = Form("Середній", description="Легкий, Середній або Важкий")
+) -> RecipeResponse:
+    """Розпізнати інгредієнти на фото та згенерувати рецепт."""
+    if difficulty not in difficulty_map:
+        raise HTTPException(status_code=400, detail="Складність має бути: Легкий, Середній або Важкий.")
+
+    request_context = metrics.start_request()
+    outcome = "error"
+    try:
+        image_bytes = await _read_images(images)
+
+        try:
+            with metrics.stage("recognition"):
+                if len(image_bytes) == 1:
+                    ingredients = await ingredient_recognizer.recognize_from_image_bytes(image_bytes[0])
+                else:
+                    ingredients = await ingredient_recognizer.recognize_many(image_bytes, max_concurrency=batch_concurrency)
+        except Exception as e:
+            logger.error(f"Помилка розпізнавання інгредієнтів: {str(e)}")
+            raise HTTPException(status_code=502, detail="Не вдалося розпізнати інгредієнти. Спробуйте пізніше.")
+
+        if not ingredients:
+            outcome = "no_ingredients"
+            return RecipeResponse(
+                ingredients=[],
+                difficulty=difficulty,
+                message="На зображенні не вдалося розпізнати жодних продуктів харчування."
+            )
+
+        with metrics.stage("generation"):
+            recipe_data = await recipe_generator.generate_recipes(ingredients, difficulty_map[difficulty])
+
+        recipes = recipe_data.get("recipes") or []
+        outcome = "ok" if recipes else "no_recipe"
+        return RecipeResponse(
+            ingredients=ingredients,
+            difficulty=difficulty,
+            compatible=recipe_data.get("compatible"),
+            recipe=recipes[0] if recipes else None,
+            message=recipe_data.get("message")
+        )
+    except HTTPException as e:
+        if e.status_code == 400:
+            outcome = "invalid_input"
+        raise
+    finally:
+        metrics.finish_request(outcome, request_context)
+
+@app.post("/api/jobs", response_model=JobResponse, status_code=202)
+async def submit_job(
+    images: List[UploadFile] = File(..., description="Фото продуктів у форматі JPEG"),
+    difficulty: str = Form("Середній", description="Легкий, Середній або Важкий"),
+    webhook_url: Optional[str] = Form(None, description="URL, на який буде надіслано результат")
+) -> JobResponse:
+    """Поставити завдання в чергу та одразу повернути його ідентифікатор."""
+    if difficulty not in difficulty_map:
+        raise HTTPException(status_code=400, detail="Складність має бути: Легкий, Середній або Важкий.")
+    if not images:
+        raise HTTPException(status_code=400, detail="Будь ласка, завантажте зображення продуктів.")
+    if len(images) > max_images_per_request:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Можна завантажити не більше {max_images_per_request} зображень за один раз."
+        )
+    if webhook_url and not is_webhook_allowed(webhook_url, allowed_webhook_hosts):
+        raise HTTPException(status_code=400, detail="webhook_url має бути https-адресою з дозволеного списку хостів.")
+
+    # Тут лише перевірка заголовків і швидка перевірка вмісту; зменшення фото та виклики моделей виконують воркери
+    raw_images = []
+    for image in images:
+        is_valid, message, _ = await run_in_threadpool(validate_image, image.file)
+        if is_valid:
+            is_valid, message = await run_in_threadpool(prescreen_image, image.file)
+        if not is_valid:
+            raise HTTPException(status_code=400, detail=f"{image.filename}: {message}")
+        raw_images.append(await image.read())
+
+    job_id = await run_in_threadpool(job_store.submit, raw_images, difficulty, webhook_url)
+    return JobResponse(job_id=job_id, status="queued")
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str) -> JobResponse:
+    """Отримати стан завдання та його результат."""
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Завдання не знайдено або термін зберігання результату минув.")
+    return JobResponse(
+        job_id=job_id,
+        status=job["status"],
+        attempts=job["attempts"],
+        result=job["result"],
+        error=job["error"]
+    )
+
+@app.get("/health")
+async def health() -> Dict[str, str]:
+    return {"status": "ok"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint() -> str:
+    return metrics.render()
+
+# Gradio-інтерфейс можна змонтувати в той самий застосунок (MOUNT_GRADIO=1)
+if os.getenv("MOUNT_GRADIO", "0") == "1":
+    import gradio as gr
+    from app import demo
+
+    app = gr.mount_gradio_app(app, demo, path="/ui")
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "api:app",
+        host=os.getenv("API_HOST", "0.0.0.0"),
+        port=int(os.getenv("API_PORT", 8000)),
+        workers=int(os.getenv("API_WORKERS", 1))
+    )
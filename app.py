@@ -1,212 +1,324 @@
-import gradio as gr
-import numpy as np
-import PIL
-import io
+import asyncio
 import logging
 import os
-import imghdr
-from dotenv import load_dotenv
-from ingredient_recognition import IngredientRecognizer
-from recipe_generator import RecipeGenerator
-from openai import OpenAI
+import time
+from image_ingest import current_rss_mb, prepare_image_bytes
+from recognition_cache import image_digest
+from services import (
+    ingredient_recognizer, recipe_generator, recognition_cache, recipe_cache, speculator,
+    validate_image, prescreen_image, difficulty_map, max_image_edge, jpeg_quality, max_images_per_request,
+    batch_concurrency, streaming_enabled, speculation_enabled
+)
+import metrics
 
 # Налаштування логування
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Завантаження змінних середовища з .env файлу
-load_dotenv()
+# Ліміт одночасних запитів користувачів до інтерфейсу
+app_concurrency_limit = int(os.getenv("APP_CONCURRENCY_LIMIT", 32))
 
-# Перевірка наявності API ключів
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-openai_api_key = os.getenv("OPENAI_API_KEY")
-
-if not gemini_api_key:
-    logger.error("GEMINI_API_KEY не знайдено в .env файлі")
-    raise ValueError("GEMINI_API_KEY не знайдено. Додайте ключ у .env файл")
-
-if not openai_api_key:
-    logger.error("OPENAI_API_KEY не знайдено в .env файлі")
-    raise ValueError("OPENAI_API_KEY не знайдено. Додайте ключ у .env файл")
-
-openai_client = OpenAI(api_key=openai_api_key)
-
-# Ініціалізація класів для розпізнавання інгредієнтів та генерації рецептів
-ingredient_recognizer = IngredientRecognizer(api_key=gemini_api_key)  # Gemini для розпізнавання
-recipe_generator = RecipeGenerator(openai_client)  # o4-mini для генерації рецептів
-
-# Функція для перевірки зображення
-def validate_image(image_path):
-    if image_path is None:
-        return False, "Будь ласка, завантажте зображення продуктів.", None
-    img_type = imghdr.what(image_path)
-    if img_type not in ("jpeg", "jpg"):
-        return False, "Зображення має бути у форматі JPEG (.jpg, .jpeg).", None
-    file_size = os.path.getsize(image_path)
-    if file_size > 5 * 1024 * 1024:
-        return False, f"Розмір зображення ({file_size/1024/1024:.2f} MB) перевищує 5 MB.", None
-    img = PIL.Image.open(image_path)
-    width, height = img.size
-    if not ((width >= 720 and height >= 1280) or (width >= 1280 and height >= 720)):
-        return False, f"Розмір зображення ({width}x{height}) менший за 720×1280 або 1280×720.", None
-    return True, "Зображення відповідає вимогам.", img
+def format_recipe_markdown(recipe_data: dict, partial: bool = False) -> tuple[str, str]:
+    """
+    Format recipe data returned by RecipeGenerator as markdown.
+    
+    Args:
+        recipe_data: Recipe data dictionary (complete or partially streamed)
+        partial: Whether the data is still being streamed
+    
+    Returns:
+        Tuple of (title, recipe content)
+    """
+    # Перевіряємо, чи інгредієнти сумісні
+    if recipe_data.get("compatible") == False:
+        # Якщо інгредієнти несумісні, виводимо просте повідомлення
+        message = recipe_data.get("message", "" if partial else "З цих інгредієнтів неможливо створити смачну страву. Спробуйте завантажити фото з іншими продуктами.")
+        return "# Несумісні інгредієнти", f"{message}"
+    
+    # Якщо рецепти знайдені, форматуємо їх
+    if recipe_data.get("recipes"):
+        recipe = recipe_data["recipes"][0]
+        if not isinstance(recipe, dict) or (partial and "name" not in recipe):
+            return "# Рецепт", ""
+        recipe_text = f"## {recipe.get('name', 'Рецепт')}\n\n"
+        
+        if partial and "ingredients" not in recipe:
+            return "# Рецепт", recipe_text
+        
+        recipe_text += "### Інгредієнти:\n"
+        for ingredient in recipe.get('ingredients', []):
+            recipe_text += f"* {ingredient}\n"
+        
+        if partial and "instructions" not in recipe:
+            return "# Рецепт", recipe_text
+        
+        recipe_text += "\n### Інструкції:\n"
+        instructions = recipe.get('instructions', 'Інструкції відсутні')
+        
+        
+        if "\\n" in instructions:
+            instructions = instructions.replace("\\n", "\n")
+        
+        # Поки інструкції ще генеруються, показуємо лише завершені кроки
+        if partial and "total_time" not in recipe:
+            recipe_text += instructions.rpartition("\n")[0]
+            return "# Рецепт", recipe_text
+            
+        recipe_text += instructions
+        
+        # Форматування інформації про рецепт
+        recipe_text += "\n\n### Інформація:\n"
+        recipe_text += f"* **Загальний час приготування:** {recipe.get('total_time', 0)} хвилин\n"
+        recipe_text += f"* **Кількість порцій:** {recipe.get('servings', 2)}\n"
+        
+        # Додаємо поради з подачі, якщо є
+        if recipe.get('serving_suggestions'):
+            recipe_text += f"\n### Подача:\n{recipe.get('serving_suggestions')}"
+        
+        # Додаємо інформацію про невикористані інгредієнти, якщо такі є
+        unused_ingredients = recipe.get('unused_ingredients', [])
+        if unused_ingredients and len(unused_ingredients) > 0:
+            # Використовуємо повідомлення з пояснення, якщо воно є
+            if recipe_data.get("message"):
+                recipe_text += f"\n\n### Примітка:\n{recipe_data.get('message')}"
+        
+        return "# Рецепт", recipe_text
+    elif partial:
+        return "# Генерація рецепту...", ""
+    else:
+        # Якщо рецепт не знайдено, виводимо повідомлення
+        message = recipe_data.get("message", "На жаль, з цих інгредієнтів неможливо створити повноцінний рецепт.")
+        return "# Результат аналізу", f"{message}"
 
-async def recipe_generation(image_path: str, difficulty: str) -> tuple[str, str, str]:
+async def recipe_generation(image_paths, difficulty: str, session: dict = None):
     """
     Advanced recipe generation that first recognizes ingredients with Gemini and then generates recipes with o4-mini.
     
     Args:
-        image: Uploaded image of food ingredients
+        image_paths: Uploaded image (or list of images) of food ingredients
         difficulty: Difficulty level of the recipe
+        session: Per-user session state holding the last recognized ingredients and speculative results (optional)
     
-    Returns:
-        Tuple of (title, ingredients list, recipe content)
+    Yields:
+        Tuple of (title, ingredients list, recipe content); in streaming mode partial
+        recipe content is yielded as it is generated
     """
+    request_context = metrics.start_request()
+    outcome = "cancelled"
     try:
         # Перевірити, чи обрана складність
         if not difficulty:
-            return "# Помилка", "", "Будь ласка, виберіть складність рецепту."
+            outcome = "invalid_input"
+            yield "# Помилка", "", "Будь ласка, виберіть складність рецепту."
+            return
 
-        # Перевірити валідність зображення
-        is_valid, message, image = validate_image(image_path)
-        if not is_valid:
-            return "# Помилка", "", message
+        if isinstance(image_paths, str):
+            image_paths = [image_paths]
+        if not image_paths:
+            image_paths = [None]
+        if len(image_paths) > max_images_per_request:
+            outcome = "invalid_input"
+            yield "# Помилка", "", f"Можна завантажити не більше {max_images_per_request} зображень за один раз."
+            return
         
-        # Перетворити зображення в байти для Gemini
-        buffered = io.BytesIO()
-        image.save(buffered, format="JPEG", quality=95)
-        image_bytes = buffered.getvalue()
+        # Перевірити валідність кожного зображення
+        for image_path in image_paths:
+            with metrics.stage("validation"):
+                is_valid, message, _ = await asyncio.to_thread(validate_image, image_path)
+            if is_valid:
+                # Темні, розмиті фото та фото без продуктів відхиляються без виклику Gemini
+                with metrics.stage("prescreen"):
+                    is_valid, message = await asyncio.to_thread(prescreen_image, image_path)
+            if not is_valid:
+                if len(image_paths) > 1:
+                    message = f"{os.path.basename(image_path)}: {message}"
+                outcome = "invalid_input"
+                yield "# Помилка", "", message
+                return
         
-        logger.info("Розпізнавання інгредієнтів...")
-        ingredients = await ingredient_recognizer.recognize_from_image_bytes(image_bytes)
+        yield "# Розпізнавання інгредієнтів...", "", ""
+        
+        # Підготувати байти для Gemini: зменшити велике фото або передати оригінал без змін
+        # (декодування і стиснення виконуються в окремому потоці, щоб не блокувати цикл подій)
+        images = []
+        for image_path in image_paths:
+            rss_before = current_rss_mb()
+            with metrics.stage("encoding"):
+                prepared = await asyncio.to_thread(
+                    prepare_image_bytes, image_path, max_edge=max_image_edge, quality=jpeg_quality
+                )
+            rss_after = current_rss_mb()
+            # Різниця RSS до і після підготовки фото (у процесі з кількома запитами - наближено)
+            rss_delta = f" ({rss_after - rss_before:+.1f} MB під час підготовки)" if None not in (rss_before, rss_after) else ""
+            images.append(prepared.image_bytes)
+            metrics.record_bytes("image_upload", prepared.original_bytes)
+            metrics.record_bytes("image_sent", prepared.bytes_sent)
+            logger.info(
+                f"Зображення {prepared.original_size[0]}x{prepared.original_size[1]} ({prepared.original_bytes} байт) -> "
+                f"{prepared.sent_size[0]}x{prepared.sent_size[1]} ({prepared.bytes_sent} байт), "
+                f"пам'ять процесу: {rss_after} MB{rss_delta}"
+            )
+        
+        images_key = ",".join(image_digest(image_bytes) for image_bytes in images)
+        if session is not None and session.get("images_key") == images_key:
+            # Ті самі фото, що й у попередньому запиті цієї сесії - повторне розпізнавання не потрібне
+            ingredients = session["ingredients"]
+        else:
+            logger.info(f"Розпізнавання інгредієнтів на {len(images)} зображеннях...")
+            with metrics.stage("recognition"):
+                if len(images) == 1:
+                    ingredients = await ingredient_recognizer.recognize_from_image_bytes(images[0])
+                else:
+                    # Фото розпізнаються паралельно, а результати об'єднуються в один список
+                    ingredients = await ingredient_recognizer.recognize_many(images, max_concurrency=batch_concurrency)
+            logger.info(f"Кеш розпізнавання: {recognition_cache.stats.as_dict()}")
+            
+            if session is not None:
+                speculator.discard(session)
+                session["images_key"] = images_key
+                session["ingredients"] = ingredients
         
         # Перевірка чи розпізнані продукти
         if not ingredients or len(ingredients) == 0:
-            return "# Не знайдено продуктів", "", "На зображенні не вдалося розпізнати жодних продуктів харчування. Будь ласка, завантажте інше фото з чітко видимими продуктами."
+            outcome = "no_ingredients"
+            yield "# Не знайдено продуктів", "", "На зображенні не вдалося розпізнати жодних продуктів харчування. Будь ласка, завантажте інше фото з чітко видимими продуктами."
+            return
         
         ingredients_text = "## Розпізнані інгредієнти:\n" + ", ".join(ingredients)
         logger.info(f"Розпізнані інгредієнти: {ingredients}")
         
-        difficulty_map = {
-            "Легкий": "легкий",
-            "Середній": "середній",
-            "Важкий": "складний"
-        }
-        
         logger.info(f"Генерація рецепту для інгредієнтів зі складністю {difficulty}...")
+        yield "# Генерація рецепту...", ingredients_text, ""
         
         # Генеруємо рецепт з перевіркою сумісності інгредієнтів
-        modified_recipe_data = await recipe_generator.generate_recipes(ingredients, difficulty_map.get(difficulty, "середній"))
-        
-        # Перевіряємо, чи інгредієнти сумісні
-        if modified_recipe_data.get("compatible") == False:
-            # Якщо інгредієнти несумісні, виводимо просте повідомлення
-            message = modified_recipe_data.get("message", "З цих інгредієнтів неможливо створити смачну страву. Спробуйте завантажити фото з іншими продуктами.")
-            return "# Несумісні інгредієнти", ingredients_text, f"{message}"
-        
-        # Якщо рецепти знайдені, форматуємо їх
-        if modified_recipe_data.get("recipes"):
-            recipe = modified_recipe_data["recipes"][0]  
-            recipe_text = f"## {recipe.get('name', 'Рецепт')}\n\n"
-            
-            recipe_text += "### Інгредієнти:\n"
-            for ingredient in recipe.get('ingredients', []):
-                recipe_text += f"* {ingredient}\n"
-            
-            recipe_text += "\n### Інструкції:\n"
-            instructions = recipe.get('instructions', 'Інструкції відсутні')
-            
-            
-            if "\\n" in instructions:
-                instructions = instructions.replace("\\n", "\n")
-                
-            recipe_text += instructions
-            
-            # Форматування інформації про рецепт
-            recipe_text += "\n\n### Інформація:\n"
-            recipe_text += f"* **Загальний час приготування:** {recipe.get('total_time', 0)} хвилин\n"
-            recipe_text += f"* **Кількість порцій:** {recipe.get('servings', 2)}\n"
-            
-            # Додаємо поради з подачі, якщо є
-            if recipe.get('serving_suggestions'):
-                recipe_text += f"\n### Подача:\n{recipe.get('serving_suggestions')}"
-            
-            # Додаємо інформацію про невикористані інгредієнти, якщо такі є
-            unused_ingredients = recipe.get('unused_ingredients', [])
-            if unused_ingredients and len(unused_ingredients) > 0:
-                # Використовуємо повідомлення з пояснення, якщо воно є
-                if modified_recipe_data.get("message"):
-                    recipe_text += f"\n\n### Примітка:\n{modified_recipe_data.get('message')}"
-            
-            return "# Рецепт", ingredients_text, recipe_text
+        recipe_difficulty = difficulty_map.get(difficulty, "середній")
+        generation_started = time.perf_counter()
+        modified_recipe_data = None
+        if speculation_enabled and session is not None:
+            # Рецепт міг бути вже згенерований у фоні після попереднього запиту
+            modified_recipe_data = await speculator.take(session, ingredients, recipe_difficulty)
+        if modified_recipe_data is not None:
+            logger.info("Використано спекулятивно згенерований рецепт")
+        elif streaming_enabled:
+            # Показуємо рецепт частинами по мірі генерації
+            modified_recipe_data = {}
+            async for modified_recipe_data in recipe_generator.stream_recipes(ingredients, recipe_difficulty):
+                with metrics.stage("formatting"):
+                    title, recipe_text = format_recipe_markdown(modified_recipe_data, partial=True)
+                yield title, ingredients_text, recipe_text
         else:
-            # Якщо рецепт не знайдено, виводимо повідомлення
-            message = modified_recipe_data.get("message", "На жаль, з цих інгредієнтів неможливо створити повноцінний рецепт.")
-            return "# Результат аналізу", ingredients_text, f"{message}"
+            modified_recipe_data = await recipe_generator.generate_recipes(ingredients, recipe_difficulty)
+        metrics.record_duration("generation", time.perf_counter() - generation_started)
+        logger.info(f"Кеш рецептів: {recipe_cache.stats.as_dict()}")
+        
+        if speculation_enabled and session is not None and modified_recipe_data.get("recipes"):
+            other_difficulties = [d for d in difficulty_map.values() if d != recipe_difficulty]
+            speculator.schedule(session, ingredients, other_difficulties)
+            logger.info(f"Спекулятивна генерація: {speculator.stats.as_dict()}")
+        
+        with metrics.stage("formatting"):
+            title, recipe_text = format_recipe_markdown(modified_recipe_data)
+        outcome = "ok" if modified_recipe_data.get("recipes") else "no_recipe"
+        yield title, ingredients_text, recipe_text
     
     except Exception as e:
         logger.error(f"Помилка в процесі генерації рецепту: {str(e)}")
-        return "# Помилка", "", f"Сталася помилка при генерації рецепту: {str(e)}"
+        outcome = "error"
+        yield "# Помилка", "", f"Сталася помилка при генерації рецепту: {str(e)}"
+    finally:
+        metrics.finish_request(outcome, request_context)
 
 def clear_outputs():
     """Функція для очищення всіх полів інтерфейсу"""
     return None, None, "", "", ""
 
 # Функція для створення інтерфейсу Gradio
-with gr.Blocks() as demo:
-    gr.Markdown("# Генератор рецептів")
-    
-    with gr.Row():
-        with gr.Column():
-            image_input = gr.Image(
-                label="Зображення продуктів",
-                type="filepath",
-                sources=["upload"],
-                image_mode="RGB"
-            )
+def build_demo():
+    """
+    Build the Gradio interface.
+
+    Gradio is imported here rather than at module level, so processes that only
+    need recipe_generation (the HTTP API, job workers, benchmarks) start quickly.
+
+    Returns:
+        The queued gr.Blocks app
+    """
+    import gradio as gr
+
+    with gr.Blocks() as demo:
+        gr.Markdown("# Генератор рецептів")
+        session_state = gr.State({})
+        
+        with gr.Row():
+            with gr.Column():
+                image_input = gr.File(
+                    label="Зображення продуктів (холодильник, комора, стіл...)",
+                    type="filepath",
+                    file_count="multiple",
+                    file_types=[".jpg", ".jpeg"]
+                )
             
-            gr.Markdown("""
-            **Вимоги до зображень:**
-            - Формат JPEG (.jpg, .jpeg)
-            - Розмір не менше 720×1280 або 1280×720 пікселів
-            - Розмір файлу не більше 5 MB
-            """)
+                gr.Markdown(f"""
+                **Вимоги до зображень:**
+                - Від 1 до {max_images_per_request} фото за один раз
+                - Формат JPEG (.jpg, .jpeg)
+                - Розмір не менше 720×1280 або 1280×720 пікселів
+                - Розмір файлу не більше 5 MB
+                """)
             
-            difficulty = gr.Radio(
-                ["Легкий", "Середній", "Важкий"], 
-                label="Складність рецепту"
-            )
-            submit_button = gr.Button("Розпізнати інгредієнти та згенерувати рецепт", variant="primary")
-            clear_button = gr.Button("Очистити все")
+                difficulty = gr.Radio(
+                    ["Легкий", "Середній", "Важкий"], 
+                    label="Складність рецепту"
+                )
+                submit_button = gr.Button("Розпізнати інгредієнти та згенерувати рецепт", variant="primary")
+                clear_button = gr.Button("Очистити все")
         
-        with gr.Column():
-            title_output = gr.Markdown("# Рецепт")
-            ingredients_output = gr.Markdown()
-            recipe_output = gr.Markdown()
-    
-    submit_button.click(
-        fn=recipe_generation,
-        inputs=[image_input, difficulty],
-        outputs=[title_output, ingredients_output, recipe_output]
-    )
-    
-    clear_button.click(
-        fn=clear_outputs,
-        inputs=[],
-        outputs=[image_input, difficulty, title_output, ingredients_output, recipe_output]
-    )
+            with gr.Column():
+                title_output = gr.Markdown("# Рецепт")
+                ingredients_output = gr.Markdown()
+                recipe_output = gr.Markdown()
+        
+        submit_button.click(
+            fn=recipe_generation,
+            inputs=[image_input, difficulty, session_state],
+            outputs=[title_output, ingredients_output, recipe_output],
+            concurrency_limit=app_concurrency_limit
+        )
+        
+        clear_button.click(
+            fn=clear_outputs,
+            inputs=[],
+            outputs=[image_input, difficulty, title_output, ingredients_output, recipe_output]
+        )
 
-    gr.Markdown("""
-    ### Як користуватися:
-    1. Завантажте фотографію наявних продуктів (JPEG формат)
-    2. Виберіть бажаний рівень складності рецепту
-    3. Натисніть кнопку для розпізнавання інгредієнтів та генерації рецепту
-    4. Отримайте список розпізнаних інгредієнтів та рецепт (якщо можливо його створити)
-    
-    ### Примітка:
-    Система автоматично підбирає найкращу комбінацію інгредієнтів для створення смачної страви.<br> 
-    Не всі розпізнані інгредієнти будуть використані у рецепті - програма вибере логічне поєднання продуктів.
-    """)
+        gr.Markdown("""
+        ### Як користуватися:
+        1. Завантажте одну або кілька фотографій наявних продуктів (JPEG формат)
+        2. Виберіть бажаний рівень складності рецепту
+        3. Натисніть кнопку для розпізнавання інгредієнтів та генерації рецепту
+        4. Отримайте список розпізнаних інгредієнтів та рецепт (якщо можливо його створити)
+        
+        ### Примітка:
+        Система автоматично підбирає найкращу комбінацію інгредієнтів для створення смачної страви.<br> 
+        Не всі розпізнані інгредієнти будуть використані у рецепті - програма вибере логічне поєднання продуктів.
+        """)
+
+    demo.queue(default_concurrency_limit=app_concurrency_limit)
+    return demo
+
+_demo = None
+
+def __getattr__(name):
+    # `from app import demo` and `gradio app.py` build the interface on first access
+    global _demo
+    if name == "demo":
+        if _demo is None:
+            _demo = build_demo()
+        return _demo
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
-    demo.launch(server_name="127.0.0.1", server_port=7861)
\ No newline at end of file
+    # Метрики у форматі Prometheus на окремому порту
+    if metrics.enabled() and os.getenv("METRICS_PORT"):
+        metrics.start_http_server(int(os.getenv("METRICS_PORT")))
+    build_demo().launch(server_name="127.0.0.1", server_port=7861)
\ No newline at end of file
@@ -0,0 +1,272 @@
+"""
+Load test of the full recipe_generation pipeline against in-process provider fakes.
+
+Example:
+    python benchmarks/bench_pipeline.py --requests 200 --concurrency 32 \\
+        --gemini-latency lognormal:1.5:0.3 --openai-latency lognormal:4:0.4 --output result.json
+
+The result is a JSON document with throughput, latency percentiles, time to
+first content, peak RSS, a per-stage latency breakdown and the number of requests
+that ended without a recipe, by the final title shown to the user.
+"""
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fakes import FakeAsyncOpenAI, FakeBehaviour, FakeGeminiModel, parse_latency  # noqa: E402
+
+# Title of a response that ends with a recipe; any other final title (errors, incompatible
+# or unrecognized ingredients, no recipe) counts as an error
+RECIPE_TITLE = "# Рецепт"
+
+_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("bench_stages", default=None)
+
+def _record(stage: str, seconds: float) -> None:
+    stages = _stages.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+def _timed(stage: str, fn: Callable) -> Callable:
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _record(stage, time.perf_counter() - start)
+    return wrapper
+
+def _timed_async(stage: str, fn: Callable) -> Callable:
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            _record(stage, time.perf_counter() - start)
+    return wrapper
+
+def _timed_async_gen(stage: str, fn: Callable) -> Callable:
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            async for item in fn(*args, **kwargs):
+                yield item
+        finally:
+            _record(stage, time.perf_counter() - start)
+    return wrapper
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    return {
+        "p50": round(pick(0.50) * 1000, 2),
+        "p95": round(pick(0.95) * 1000, 2),
+        "p99": round(pick(0.99) * 1000, 2),
+        "mean": round(statistics.fmean(ordered) * 1000, 2),
+        "max": round(ordered[-1] * 1000, 2),
+    }
+
+def make_images(count: int, width: int, height: int, directory: str) -> List[str]:
+    """
+    Write distinct synthetic JPEG photos so caches and request coalescing do not hide provider latency.
+
+    Args:
+        count: Number of images
+        width: Image width in pixels
+        height: Image height in pixels
+        directory: Directory for the files
+
+    Returns:
+        Paths of the written images
+    """
+    from PIL import Image
+
+    paths = []
+    for i in range(count):
+        rng = random.Random(i)
+        base = Image.new("RGB", (width // 8, height // 8),
+                         (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        noise = Image.frombytes("RGB", base.size, rng.randbytes(base.size[0] * base.size[1] * 3))
+        img = Image.blend(base, noise, 0.5).resize((width, height), Image.BILINEAR)
+        path = os.path.join(directory, f"bench_{i}.jpg")
+        buffered = io.BytesIO()
+        img.save(buffered, format="JPEG", quality=90)
+        with open(path, "wb") as f:
+            f.write(buffered.getvalue())
+        paths.append(path)
+    return paths
+
+def load_app(args: argparse.Namespace) -> Any:
+    """
+    Import app.py with dummy credentials and replace the provider clients with fakes.
+
+    Args:
+        args: Parsed command line arguments
+
+    Returns:
+        The imported app module
+    """
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    if not args.with_cache:
+        os.environ["RECOGNITION_CACHE_SIZE"] = "0"
+        os.environ["RECIPE_CACHE_SIZE"] = "0"
+    os.environ["RECIPE_STREAMING"] = "0" if args.no_streaming else "1"
+    os.environ["SPECULATIVE_PRECOMPUTE"] = "0"
+
+    import app
+
+    gemini_responses = openai_responses = None
+    if args.gemini_responses:
+        with open(args.gemini_responses, encoding="utf-8") as f:
+            gemini_responses = json.load(f)
+    if args.openai_responses:
+        with open(args.openai_responses, encoding="utf-8") as f:
+            openai_responses = json.load(f)
+
+    app.ingredient_recognizer.model = FakeGeminiModel(
+        FakeBehaviour(latency=parse_latency(args.gemini_latency), error_rate=args.gemini_error_rate,
+                      on_call=lambda _, delay: _record("gemini_call", delay)),
+        responses=gemini_responses
+    )
+    app.recipe_generator.client = FakeAsyncOpenAI(
+        FakeBehaviour(latency=parse_latency(args.openai_latency), error_rate=args.openai_error_rate,
+                      on_call=lambda _, delay: _record("openai_call", delay)),
+        responses=openai_responses,
+        chunk_delay=args.chunk_delay
+    )
+
+    app.validate_image = _timed("validation", app.validate_image)
+    app.prepare_image_bytes = _timed("encoding", app.prepare_image_bytes)
+    app.format_recipe_markdown = _timed("formatting", app.format_recipe_markdown)
+
+    recognizer, generator = app.ingredient_recognizer, app.recipe_generator
+    # recognize_many calls recognize_from_image_bytes, so only the outermost call is timed
+    if args.photos_per_request > 1:
+        recognizer.recognize_many = _timed_async("recognition", recognizer.recognize_many)
+    else:
+        recognizer.recognize_from_image_bytes = _timed_async("recognition", recognizer.recognize_from_image_bytes)
+    generator.generate_recipes = _timed_async("generation", generator.generate_recipes)
+    generator.stream_recipes = _timed_async_gen("generation", generator.stream_recipes)
+
+    # Per-request INFO logs would dominate the measurement
+    logging.getLogger().setLevel(logging.WARNING)
+    return app
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    app = load_app(args)
+    from image_ingest import peak_rss_mb
+
+    with tempfile.TemporaryDirectory() as directory:
+        width, height = (int(v) for v in args.image_size.lower().split("x"))
+        images = make_images(args.images, width, height, directory)
+
+        latencies: List[float] = []
+        first_content: List[float] = []
+        stage_samples: Dict[str, List[float]] = {}
+        outcomes: Dict[str, int] = {}
+        next_request = 0
+
+        async def one_request(index: int) -> None:
+            stages: Dict[str, float] = {}
+            _stages.set(stages)
+            paths = [images[(index + k) % len(images)] for k in range(args.photos_per_request)]
+            start = time.perf_counter()
+            first = None
+            title = ""
+            async for title, _, recipe_text in app.recipe_generation(paths, args.difficulty):
+                # Failed generations end with an explanation instead of a recipe, so only
+                # recipe text counts as content
+                if first is None and recipe_text and title == RECIPE_TITLE:
+                    first = time.perf_counter() - start
+            latencies.append(time.perf_counter() - start)
+            if first is not None:
+                first_content.append(first)
+            outcomes[title] = outcomes.get(title, 0) + 1
+            for stage, seconds in stages.items():
+                stage_samples.setdefault(stage, []).append(seconds)
+
+        async def worker() -> None:
+            nonlocal next_request
+            while next_request < args.requests:
+                index = next_request
+                next_request += 1
+                await one_request(index)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "photos_per_request": args.photos_per_request,
+            "image_size": args.image_size,
+            "gemini_latency": args.gemini_latency,
+            "openai_latency": args.openai_latency,
+            "gemini_error_rate": args.gemini_error_rate,
+            "openai_error_rate": args.openai_error_rate,
+            "streaming": not args.no_streaming,
+            "with_cache": args.with_cache,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(args.requests / elapsed, 3) if elapsed else None,
+        "errors": args.requests - outcomes.get(RECIPE_TITLE, 0),
+        "outcomes": dict(sorted(outcomes.items())),
+        "latency_ms": _percentiles(latencies),
+        "time_to_first_content_ms": _percentiles(first_content),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages_ms": {stage: _percentiles(values) for stage, values in sorted(stage_samples.items())},
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100, help="total number of requests")
+    parser.add_argument("--concurrency", type=int, default=16, help="number of simulated concurrent users")
+    parser.add_argument("--images", type=int, default=50, help="number of distinct synthetic photos")
+    parser.add_argument("--image-size", default="1920x1080", help="size of the synthetic photos")
+    parser.add_argument("--photos-per-request", type=int, default=1, help="photos uploaded per request")
+    parser.add_argument("--difficulty", default="Легкий", choices=["Легкий", "Середній", "Важкий"])
+    parser.add_argument("--gemini-latency", default="lognormal:1.5:0.3", help="latency distribution of Gemini calls")
+    parser.add_argument("--openai-latency", default="lognormal:1.0:0.3",
+                        help="latency distribution of o4-mini calls (time to first token)")
+    parser.add_argument("--chunk-delay", type=float, default=0.005, help="delay between streamed chunks")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-responses", help="JSON file with a list of canned ingredient lists")
+    parser.add_argument("--openai-responses", help="JSON file with a list of canned recipe dictionaries")
+    parser.add_argument("--no-streaming", action="store_true", help="use the non-streaming generation path")
+    parser.add_argument("--with-cache", action="store_true", help="keep the recognition and recipe caches enabled")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON result to this file instead of stdout")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    result = asyncio.run(run(args))
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Lookup latency of the local recipe store with a large synthetic recipe set.
+
+Example:
+    python benchmarks/bench_recipe_store.py --recipes 100000 --queries 1000
+
+Synthetic recipes draw most ingredients from a small pool of common products,
+which makes posting lists long and is close to the worst case for the index.
+"""
+from typing import Any, Dict, List
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from recipe_store import RecipeStore  # noqa: E402
+
+COMMON = [
+    "яйця", "твердий сир", "цибуля", "помідори", "шинка", "молоко", "картопля", "куряче філе", "сметана",
+    "огірки", "рис", "гриби", "морква", "капуста", "буряк", "часник", "свинина", "яловичина", "риба", "гречка",
+    "макарони", "кабачки", "баклажани", "масло", "кефір", "борошно", "яблука", "банани", "лимони", "зелень",
+]
+DIFFICULTIES = ["легкий", "середній", "складний"]
+
+def make_recipes(count: int, rare: int, rng: random.Random) -> List[Dict[str, Any]]:
+    products = COMMON + [f"продукт {i}" for i in range(rare)]
+    recipes = []
+    for i in range(count):
+        ingredients = rng.sample(COMMON, rng.randint(2, 6)) + [rng.choice(products)]
+        recipes.append({
+            "name": f"Страва {i}",
+            "ingredients": [f"100 г {name}" for name in ingredients] + ["сіль", "перець"],
+            "difficulty": rng.choice(DIFFICULTIES),
+        })
+    return recipes
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipes", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--rare", type=int, default=400, help="number of rare products in the pool")
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    store = RecipeStore(threshold=args.threshold, learn=False)
+    started = time.perf_counter()
+    store.add_many(make_recipes(args.recipes, args.rare, rng))
+    build = time.perf_counter() - started
+
+    queries = [(rng.sample(COMMON, rng.randint(4, 12)), rng.choice(DIFFICULTIES)) for _ in range(args.queries)]
+    timings = []
+    for ingredients, difficulty in queries:
+        started = time.perf_counter()
+        store.find(ingredients, difficulty)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+
+    def pick(q: float) -> float:
+        return round(timings[min(len(timings) - 1, int(q * len(timings)))] * 1000, 3)
+
+    print(json.dumps({
+        "recipes": len(store),
+        "build_s": round(build, 2),
+        "lookup_ms": {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(timings[-1] * 1000, 3)},
+        "hit_rate": store.stats.as_dict()["hit_rate"],
+    }, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Cold start benchmark: time to import the app entry points in a fresh interpreter.
+
+Example:
+    python benchmarks/bench_startup.py --repeat 5 --output startup.json
+
+Each module is imported in a new process (with dummy API keys), so the numbers
+include everything a freshly scaled replica pays before it can serve its first
+request. The result is a JSON document with wall-clock import times and the
+slowest imports reported by `python -X importtime`.
+"""
+from typing import Any, Dict, List
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_TARGETS = ["services", "api", "app", "app:build_demo"]
+
+def _script(target: str) -> str:
+    module, _, call = target.partition(":")
+    lines = [
+        "import time",
+        "start = time.perf_counter()",
+        f"import {module}",
+    ]
+    if call:
+        lines.append(f"{module}.{call}()")
+    lines.append("print(time.perf_counter() - start)")
+    return "\n".join(lines)
+
+def _environment() -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault("GEMINI_API_KEY", "benchmark")
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    return env
+
+def parse_importtime(stderr: str, top: int) -> List[Dict[str, Any]]:
+    """
+    Extract the imports with the largest cumulative time from `-X importtime` output.
+
+    Only top-level modules and their direct imports are kept, which is where
+    heavy third-party packages (gradio, the provider SDKs) show up.
+
+    Args:
+        stderr: Standard error of the interpreter run with -X importtime
+        top: Number of entries to return
+
+    Returns:
+        Entries with the module name and its cumulative import time in milliseconds
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        name = parts[2].rstrip()
+        # Nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth > 1:
+            continue
+        entries.append({"module": name.strip(), "depth": depth, "cumulative_ms": round(int(parts[1]) / 1000, 2)})
+    entries.sort(key=lambda entry: entry["cumulative_ms"], reverse=True)
+    return entries[:top]
+
+def measure(target: str, repeat: int, top: int) -> Dict[str, Any]:
+    """
+    Import a module in fresh interpreters and time it.
+
+    Args:
+        target: Module name, optionally followed by ":function" to call after importing
+        repeat: Number of fresh processes to time
+        top: Number of slowest imports to report
+
+    Returns:
+        Timing summary for the target
+    """
+    env = _environment()
+    script = _script(target)
+    times = []
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env,
+                                   capture_output=True, text=True)
+        if completed.returncode != 0:
+            return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"}
+        times.append(float(completed.stdout.strip().splitlines()[-1]))
+
+    profiled = subprocess.run([sys.executable, "-X", "importtime", "-c", script], cwd=ROOT, env=env,
+                              capture_output=True, text=True)
+    return {
+        "import_ms": {
+            "min": round(min(times) * 1000, 2),
+            "median": round(statistics.median(times) * 1000, 2),
+            "max": round(max(times) * 1000, 2),
+        },
+        "slowest_imports": parse_importtime(profiled.stderr, top),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("targets", nargs="*", default=DEFAULT_TARGETS,
+                        help="modules to import, optionally as module:function to also call a builder")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh processes per target")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports to report")
+    parser.add_argument("--output", help="write the JSON result to this file instead of stdout")
+    args = parser.parse_args()
+
+    result = {
+        "python": sys.version.split()[0],
+        "repeat": args.repeat,
+        "targets": {target: measure(target, args.repeat, args.top) for target in args.targets},
+    }
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+In-process stand-ins for the Gemini and OpenAI clients used by the benchmarks.
+
+The fakes mimic the small part of each SDK the app relies on
+(GenerativeModel.generate_content_async and AsyncOpenAI.chat.completions.create,
+streaming included) with configurable latency, error rate and canned responses.
+"""
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+import asyncio
+import json
+import random
+
+DEFAULT_INGREDIENTS = [
+    "4 шт яйця", "масло", "твердий сир", "цибуля", "3 шт помідори", "шинка",
+    "молоко", "2 шт картопля", "куряче філе", "сметана", "огірок", "рис",
+]
+
+DEFAULT_RECIPE = {
+    "compatible": True,
+    "recipes": [
+        {
+            "name": "Омлет з сиром та шинкою",
+            "ingredients": ["3 шт яйця", "50 г твердого сиру", "50 г шинки", "1 ст.л. масла", "сіль", "перець"],
+            "instructions": "1. Збийте яйця з сіллю та перцем (2 хв).\n"
+                            "2. Наріжте шинку кубиками, натріть сир (3 хв).\n"
+                            "3. Розігрійте масло на сковороді на середньому вогні (1 хв).\n"
+                            "4. Обсмажте шинку (2 хв), залийте яйцями та готуйте під кришкою (5 хв).\n"
+                            "5. Посипте сиром і залиште під кришкою до розплавлення (1 хв).",
+            "total_time": 15,
+            "servings": 2,
+            "difficulty": "легкий",
+            "serving_suggestions": "Подавайте гарячим зі свіжими овочами.",
+            "unused_ingredients": ["цибуля", "помідори"],
+        }
+    ],
+    "message": "Цибуля та помідори не використані, щоб зберегти класичний смак омлету.",
+}
+
+class FakeProviderError(Exception):
+    """Raised by the fakes to simulate a failed provider call."""
+
+    def __init__(self, message: str, status_code: int = 503):
+        super().__init__(message)
+        self.status_code = status_code
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Build a latency sampler from a textual specification.
+
+    Supported forms (seconds): "fixed:0.5", "uniform:0.2:1.5", "lognormal:0.8:0.4"
+    (median and sigma), "normal:1.0:0.2".
+
+    Args:
+        spec: Latency distribution specification
+
+    Returns:
+        Function returning one latency sample in seconds
+    """
+    kind, *params = spec.split(":")
+    values = [float(p) for p in params]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal":
+        import math
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+@dataclass
+class FakeBehaviour:
+    latency: Callable[[], float] = field(default_factory=lambda: parse_latency("fixed:0"))
+    error_rate: float = 0.0
+    calls: int = 0
+    errors: int = 0
+    on_call: Optional[Callable[[str, float], None]] = None
+
+    async def simulate(self, stage: str) -> float:
+        self.calls += 1
+        delay = self.latency()
+        await asyncio.sleep(delay)
+        if self.on_call:
+            self.on_call(stage, delay)
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            raise FakeProviderError(f"Simulated {stage} failure")
+        return delay
+
+class FakeGeminiModel:
+    def __init__(self, behaviour: FakeBehaviour, responses: Optional[List[List[str]]] = None,
+                 ingredients_per_image: int = 6):
+        """
+        Initialize a stand-in for google.generativeai.GenerativeModel.
+
+        Args:
+            behaviour: Latency and error configuration
+            responses: Canned ingredient lists to choose from (random subsets of defaults if omitted)
+            ingredients_per_image: Size of the random ingredient subsets
+        """
+        self.behaviour = behaviour
+        self.responses = responses
+        self.ingredients_per_image = ingredients_per_image
+
+    async def generate_content_async(self, contents: Any = None, generation_config: Any = None, **kwargs) -> Any:
+        await self.behaviour.simulate("recognition")
+        if self.responses:
+            ingredients = random.choice(self.responses)
+        else:
+            ingredients = random.sample(DEFAULT_INGREDIENTS, self.ingredients_per_image)
+        text = ", ".join(ingredients)
+        usage = SimpleNamespace(prompt_token_count=1600, candidates_token_count=len(text) // 3,
+                                total_token_count=1600 + len(text) // 3, cached_content_token_count=0)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+class _FakeStream:
+    def __init__(self, text: str, chunk_size: int, chunk_delay: float, usage: Any):
+        self.text = text
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.usage = usage
+
+    def __aiter__(self) -> AsyncIterator[Any]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[Any]:
+        for start in range(0, len(self.text), self.chunk_size):
+            if self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            delta = SimpleNamespace(content=self.text[start:start + self.chunk_size])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+        yield SimpleNamespace(choices=[], usage=self.usage)
+
+class _FakeCompletions:
+    def __init__(self, owner: "FakeAsyncOpenAI"):
+        self.owner = owner
+
+    async def create(self, stream: bool = False, **params) -> Any:
+        owner = self.owner
+        await owner.behaviour.simulate("generation")
+        recipe = random.choice(owner.responses) if owner.responses else DEFAULT_RECIPE
+        text = json.dumps(recipe, ensure_ascii=False)
+        usage = SimpleNamespace(prompt_tokens=900, completion_tokens=len(text) // 3,
+                                total_tokens=900 + len(text) // 3,
+                                prompt_tokens_details=SimpleNamespace(cached_tokens=0))
+        if stream:
+            return _FakeStream(text, owner.chunk_size, owner.chunk_delay, usage)
+        message = SimpleNamespace(content=text)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+class FakeAsyncOpenAI:
+    def __init__(self, behaviour: FakeBehaviour, responses: Optional[List[Dict[str, Any]]] = None,
+                 chunk_size: int = 12, chunk_delay: float = 0.005):
+        """
+        Initialize a stand-in for openai.AsyncOpenAI.
+
+        Args:
+            behaviour: Latency (time to first token) and error configuration
+            responses: Canned recipe dictionaries to choose from (DEFAULT_RECIPE if omitted)
+            chunk_size: Characters per streamed chunk
+            chunk_delay: Delay between streamed chunks in seconds
+        """
+        self.behaviour = behaviour
+        self.responses = responses
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.chat = SimpleNamespace(completions=_FakeCompletions(self))
@@ -0,0 +1,2 @@
+# The modules live in the repository root; with this file there, pytest puts the
+# root on sys.path, so both `pytest` and `python -m pytest` can import them.
@@ -0,0 +1,162 @@
+from dataclasses import dataclass
+from typing import BinaryIO, Optional, Tuple, Union
+import io
+import logging
+import os
+import sys
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_EDGE = 1536
+DEFAULT_JPEG_QUALITY = 90
+
+ImageSource = Union[str, bytes, BinaryIO]
+
+@dataclass
+class ImageInfo:
+    format: str
+    width: int
+    height: int
+    file_size: int
+
+@dataclass
+class IngestResult:
+    image_bytes: bytes
+    original_size: Tuple[int, int]
+    sent_size: Tuple[int, int]
+    original_bytes: int
+    resized: bool
+
+    @property
+    def bytes_sent(self) -> int:
+        return len(self.image_bytes)
+
+def _open(source: ImageSource):
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+    return source
+
+def _source_size(source: ImageSource) -> int:
+    if isinstance(source, bytes):
+        return len(source)
+    if isinstance(source, str):
+        return os.path.getsize(source)
+    position = source.tell()
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(position)
+    return size
+
+def _read_all(source: ImageSource) -> bytes:
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read()
+    source.seek(0)
+    return source.read()
+
+def inspect_image(source: ImageSource) -> ImageInfo:
+    """
+    Read the format and dimensions of an image from its header without decoding pixels.
+
+    Args:
+        source: Path, raw bytes or binary file object of the image
+
+    Returns:
+        Image format, dimensions and file size
+    """
+    with Image.open(_open(source)) as img:
+        width, height = img.size
+        image_format = img.format or ""
+    if not isinstance(source, (str, bytes)):
+        source.seek(0)
+    return ImageInfo(format=image_format, width=width, height=height, file_size=_source_size(source))
+
+def prepare_image_bytes(source: ImageSource, max_edge: int = DEFAULT_MAX_EDGE,
+                        quality: int = DEFAULT_JPEG_QUALITY) -> IngestResult:
+    """
+    Produce the JPEG bytes sent to the recognition model.
+
+    Images that already fit within max_edge are passed through untouched. Larger
+    JPEGs are decoded in draft mode, so the decoder performs DCT scaling and never
+    materializes the full-resolution bitmap, then downscaled to max_edge.
+
+    Args:
+        source: Path, raw bytes or binary file object of a JPEG image
+        max_edge: Maximum length of the longer image side in pixels
+        quality: JPEG quality used when the image has to be re-encoded
+
+    Returns:
+        Prepared image bytes with size information
+    """
+    original_bytes = _source_size(source)
+    with Image.open(_open(source)) as img:
+        width, height = img.size
+        if max(width, height) <= max_edge:
+            resized = None
+        else:
+            scale = max_edge / max(width, height)
+            target = (max(1, round(width * scale)), max(1, round(height * scale)))
+            img.draft("RGB", target)
+            resized = ImageOps.exif_transpose(img.convert("RGB"))
+            resized.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    if resized is None:
+        return IngestResult(
+            image_bytes=_read_all(source),
+            original_size=(width, height),
+            sent_size=(width, height),
+            original_bytes=original_bytes,
+            resized=False
+        )
+
+    buffered = io.BytesIO()
+    resized.save(buffered, format="JPEG", quality=quality)
+    return IngestResult(
+        image_bytes=buffered.getvalue(),
+        original_size=(width, height),
+        sent_size=resized.size,
+        original_bytes=original_bytes,
+        resized=True
+    )
+
+def current_rss_mb() -> Optional[float]:
+    """
+    Current resident set size of the current process.
+
+    Unlike peak_rss_mb, this goes down again when memory is freed, so the difference
+    between two readings shows what a single request holds.
+
+    Returns:
+        RSS in megabytes, or None where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident set size over the lifetime of the current process.
+
+    The value never goes down, so it describes the process (e.g. a whole benchmark
+    run), not an individual request; see current_rss_mb.
+
+    Returns:
+        Peak RSS in megabytes, or None where the platform does not report it
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
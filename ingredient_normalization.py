@@ -0,0 +1,266 @@
+"""
+Parsing and normalization of recognized ingredients.
+
+Recognizer output such as "5 шт яєць", "2 шт яйця" or "твердого сиру" is turned into
+structured Ingredient(name, quantity, unit) items with a canonical name, and items that
+refer to the same product are merged. Word forms are resolved through dictionaries that
+are compiled once at import, and parsed items are memoized, so normalizing a typical
+list takes a few microseconds.
+
+Only exact dictionary forms are rewritten in the name shown to users and sent to the
+model. Matching by word stem is used only for Ingredient.key, where a false match
+("сирий" -> "сир") can at worst merge two items, but never changes what is displayed.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+import re
+
+# Canonical name -> other word forms and synonyms that should map to it
+_LEMMAS: Dict[str, Tuple[str, ...]] = {
+    "яйця": ("яйце", "яєць", "яйцями", "яйцях", "яйцю", "яйцем", "яйка", "яєчка"),
+    "помідори": ("помідор", "помідора", "помідорів", "помідорами", "томат", "томати", "томатів"),
+    "огірки": ("огірок", "огірка", "огірків", "огірками"),
+    "картопля": ("картоплі", "картоплю", "картоплею", "картопель", "картоплина", "картоплини", "картоплин"),
+    "цибуля": ("цибулі", "цибулю", "цибулею", "цибулина", "цибулини"),
+    "морква": ("моркви", "моркву", "морквою", "морквина", "морквини"),
+    "часник": ("часнику", "часником"),
+    "капуста": ("капусти", "капусту", "капустою"),
+    "буряк": ("буряка", "буряки", "буряків", "буряком"),
+    "кабачки": ("кабачок", "кабачка", "кабачків"),
+    "баклажани": ("баклажан", "баклажана", "баклажанів"),
+    "перець": ("перцю", "перцем", "перці", "перців"),
+    "гриби": ("гриб", "гриба", "грибів", "грибами", "печериці", "печериць"),
+    "зелень": ("зелені",),
+    "яблука": ("яблуко", "яблук", "яблуками"),
+    "банани": ("банан", "банана", "бананів"),
+    "лимони": ("лимон", "лимона", "лимонів"),
+    "апельсини": ("апельсин", "апельсина", "апельсинів"),
+    "сир": ("сиру", "сиром", "сири"),
+    "масло": ("масла", "маслом"),
+    "олія": ("олії", "олію", "олією"),
+    "молоко": ("молока", "молоком"),
+    "сметана": ("сметани", "сметану", "сметаною"),
+    "кефір": ("кефіру",),
+    "йогурт": ("йогурту",),
+    "вершки": ("вершків", "вершками"),
+    "борошно": ("борошна", "мука", "муки"),
+    "цукор": ("цукру",),
+    "сіль": ("солі",),
+    "рис": ("рису",),
+    "гречка": ("гречки", "гречку"),
+    "макарони": ("макаронів", "макаронами"),
+    "хліб": ("хліба",),
+    "курятина": ("курка", "курки", "курку", "курятини"),
+    "свинина": ("свинини", "свинину"),
+    "яловичина": ("яловичини", "яловичину"),
+    "індичатина": ("індичка", "індички", "індичку", "індичатини"),
+    "риба": ("риби", "рибу"),
+    "шинка": ("шинки", "шинку"),
+    "ковбаса": ("ковбаси", "ковбасу"),
+    "сосиски": ("сосиска", "сосисок"),
+    "філе": (),
+    "твердий": ("твердого", "тверді", "твердим"),
+    "м'який": ("м'якого", "м'які"),
+    "кисломолочний": ("кисломолочного",),
+    "куряче": ("курячого", "курячому"),
+    "вершкове": ("вершкового",),
+    "соняшникова": ("соняшникової",),
+    "пшеничний": ("пшеничного",),
+}
+
+# Whole names that mean the same product
+_SYNONYMS: Dict[str, str] = {
+    "творог": "кисломолочний сир",
+    "сир кисломолочний": "кисломолочний сир",
+    "вершкове масло": "масло",
+    "соняшникова олія": "олія",
+    "куряча грудка": "куряче філе",
+    "філе куряче": "куряче філе",
+    "сир твердий": "твердий сир",
+}
+
+# Unit spellings -> canonical unit
+_UNITS: Dict[str, str] = {
+    "шт": "шт", "штука": "шт", "штуки": "шт", "штук": "шт",
+    "г": "г", "гр": "г", "грам": "г", "грами": "г", "грамів": "г",
+    "кг": "кг", "кілограм": "кг", "кілограми": "кг", "кілограмів": "кг",
+    "мл": "мл", "л": "л", "літр": "л", "літри": "л", "літрів": "л",
+    "ст.л": "ст.л.", "ст. л": "ст.л.", "стл": "ст.л.",
+    "ч.л": "ч.л.", "ч. л": "ч.л.", "чл": "ч.л.",
+    "уп": "уп", "упаковка": "уп", "упаковки": "уп", "пачка": "уп", "пачки": "уп",
+}
+
+# Units merged by converting to a common base unit
+_BASE_UNITS: Dict[str, Tuple[str, float]] = {"кг": ("г", 1000.0), "л": ("мл", 1000.0)}
+
+_ENDINGS = tuple(sorted(
+    ("ого", "ому", "ими", "ами", "ями", "ові", "еві", "ий", "ій", "их", "им", "ої",
+     "ах", "ях", "ів", "їв", "ей", "ом", "ем", "ою", "ею",
+     "а", "я", "и", "і", "ї", "у", "ю", "о", "е", "ь"),
+    key=len, reverse=True
+))
+
+_QUANTITY_RE = re.compile(
+    r"^(?P<quantity>\d+(?:[.,]\d+)?)?\s*"
+    r"(?P<unit>" + "|".join(re.escape(unit).replace(r"\ ", r"\s*") for unit in sorted(_UNITS, key=len, reverse=True)) + r")?"
+    r"\.?\s+(?P<name>.+)$"
+)
+_STRIP_CHARS = " \t\r\n.,;:-–—•*\"'«»`"
+# A name has at least one letter
+_NAME_RE = re.compile(r"[^\W\d_]")
+
+def _stem(word: str) -> str:
+    if len(word) > 4:
+        for ending in _ENDINGS:
+            if word.endswith(ending) and len(word) - len(ending) >= 3:
+                return word[:-len(ending)]
+    return word
+
+def _compile_lemmas() -> Tuple[Dict[str, str], Dict[str, str]]:
+    by_form: Dict[str, str] = {}
+    by_stem: Dict[str, str] = {}
+    for lemma, forms in _LEMMAS.items():
+        for form in (lemma,) + forms:
+            by_form[form] = lemma
+            by_stem.setdefault(_stem(form), lemma)
+    return by_form, by_stem
+
+_LEMMA_BY_FORM, _LEMMA_BY_STEM = _compile_lemmas()
+
+def _lemmatize(text: str) -> str:
+    return " ".join(_LEMMA_BY_FORM.get(word, word) for word in text.split())
+
+def _key_word(word: str) -> str:
+    lemma = _LEMMA_BY_FORM.get(word)
+    if lemma is None:
+        # Inflected forms missing from the dictionary still match the product by stem
+        lemma = _LEMMA_BY_STEM.get(_stem(word), word)
+    return lemma
+
+# Synonyms are looked up after lemmatization, so their keys go through it too
+_SYNONYM_BY_NAME: Dict[str, str] = {_lemmatize(name): _lemmatize(target) for name, target in _SYNONYMS.items()}
+
+@dataclass(frozen=True)
+class Ingredient:
+    name: str
+    quantity: Optional[float] = None
+    unit: str = ""
+
+    @property
+    def key(self) -> str:
+        """Name with every word reduced to its dictionary lemma, identical for all forms and synonyms of a product."""
+        return _name_key(self.name)
+
+    def __str__(self) -> str:
+        if self.quantity is None:
+            return self.name
+        quantity = str(int(self.quantity)) if self.quantity == int(self.quantity) else f"{self.quantity:g}"
+        return f"{quantity} {self.unit} {self.name}" if self.unit else f"{quantity} {self.name}"
+
+@lru_cache(maxsize=4096)
+def _name_key(name: str) -> str:
+    key = " ".join(_key_word(word) for word in name.split())
+    return _SYNONYM_BY_NAME.get(key, key)
+
+@lru_cache(maxsize=8192)
+def parse_ingredient(text: str) -> Optional[Ingredient]:
+    """
+    Parse one recognized ingredient into a structured item with a canonical name.
+
+    Args:
+        text: Ingredient as returned by the recognizer, e.g. "5 шт яєць"
+
+    Returns:
+        Ingredient, e.g. Ingredient("яйця", 5.0, "шт"), or None if the text holds no name
+        (e.g. a bare "10" or "200 г")
+    """
+    text = text.strip(_STRIP_CHARS).lower()
+    quantity, unit = None, ""
+    match = _QUANTITY_RE.match(text)
+    if match and (match.group("quantity") or match.group("unit")):
+        if match.group("quantity"):
+            quantity = float(match.group("quantity").replace(",", "."))
+            # A bare count ("5 яєць") is a number of pieces
+            unit = "шт"
+        if match.group("unit"):
+            unit = _UNITS[re.sub(r"\s+", " ", match.group("unit"))]
+        text = match.group("name").strip(_STRIP_CHARS)
+    if not _NAME_RE.search(text) or text in _UNITS:
+        return None
+
+    name = _lemmatize(text)
+    name = _SYNONYM_BY_NAME.get(name, name)
+    return Ingredient(name, quantity, unit)
+
+def _to_base(quantity: float, unit: str) -> Tuple[float, str]:
+    base = _BASE_UNITS.get(unit)
+    return (quantity * base[1], base[0]) if base else (quantity, unit)
+
+def normalize_ingredients(items: Iterable[Union[str, Ingredient]]) -> List[Ingredient]:
+    """
+    Parse ingredients and merge the ones that refer to the same product.
+
+    Quantities of merged items are added up when their units agree (кг/г and л/мл
+    are converted), e.g. "3 шт яйця" and "2 шт яєць" become Ingredient("яйця", 5.0, "шт").
+    Quantities that cannot be converted into each other are kept as separate items
+    of the same product, e.g. "1500 г картопля" and "2 шт картопля".
+
+    Args:
+        items: Ingredient strings or already parsed ingredients
+
+    Returns:
+        Deduplicated ingredients in first-seen order
+    """
+    merged: Dict[str, List[Ingredient]] = {}
+    for item in items:
+        ingredient = item if isinstance(item, Ingredient) else parse_ingredient(item)
+        if ingredient is None:
+            continue
+        entries = merged.setdefault(ingredient.key, [])
+        if not entries:
+            entries.append(ingredient)
+            continue
+        if ingredient.quantity is None:
+            continue
+        name = entries[0].name
+        other, other_unit = _to_base(ingredient.quantity, ingredient.unit)
+        for index, existing in enumerate(entries):
+            if existing.quantity is None:
+                entries[index] = Ingredient(name, ingredient.quantity, ingredient.unit)
+                break
+            if existing.unit == ingredient.unit:
+                entries[index] = Ingredient(name, existing.quantity + ingredient.quantity, existing.unit)
+                break
+            quantity, unit = _to_base(existing.quantity, existing.unit)
+            if unit == other_unit:
+                entries[index] = Ingredient(name, quantity + other, unit)
+                break
+        else:
+            entries.append(Ingredient(name, ingredient.quantity, ingredient.unit))
+    return [ingredient for entries in merged.values() for ingredient in entries]
+
+def format_ingredients(ingredients: Iterable[Ingredient]) -> List[str]:
+    """
+    Format structured ingredients in the recognizer's text format.
+
+    Args:
+        ingredients: Parsed ingredients
+
+    Returns:
+        Strings such as "5 шт яйця" or "масло"
+    """
+    return [str(ingredient) for ingredient in ingredients]
+
+def ingredient_key(item: Union[str, Ingredient]) -> str:
+    """
+    Reduce an ingredient to a key that ignores quantity, casing, inflection and synonyms.
+
+    Args:
+        item: Ingredient string or parsed ingredient
+
+    Returns:
+        Key of the product, or an empty string if the item holds no name
+    """
+    ingredient = item if isinstance(item, Ingredient) else parse_ingredient(item)
+    return ingredient.key if ingredient is not None else ""
@@ -1,48 +1,26 @@
-from google.generativeai import GenerativeModel
-import google.generativeai as genai
-import base64
-from typing import List
-from pydantic import BaseModel
+import asyncio
+from datetime import timedelta
+from typing import Any, List, Optional, Sequence
 import logging
 import os
+import time
+from recognition_cache import RecognitionCache, image_digest
+from resilience import ResiliencePolicy, ResilientCaller
+from scheduler import estimate_image_tokens, estimate_text_tokens, model_scheduler
+from singleflight import SingleFlight
+import metrics
+from ingredient_normalization import format_ingredients, normalize_ingredients
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-class RecognitionResponse(BaseModel):
-    ingredients: List[str]
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_BATCH_CONCURRENCY = 4
 
-class IngredientRecognizer:
-    def __init__(self, api_key=None):
-        """
-        Initialize the IngredientRecognizer with Gemini API.
-        
-        Args:
-            api_key: Gemini API key (optional, will use env var if not provided)
-        """
-        self.api_key = api_key or os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
-            raise ValueError("Gemini API key is required. Provide it directly or set GEMINI_API_KEY environment variable.")
-        
-        genai.configure(api_key=self.api_key)
-        
-        self.model = GenerativeModel(model_name="gemini-2.0-flash")
-        
-    async def recognize_from_image_bytes(self, image_bytes: bytes) -> List[str]:
-        """
-        Recognize ingredients from raw image bytes using Gemini.
-        
-        Args:
-            image_bytes: Raw image data
-            
-        Returns:
-            List of recognized ingredients
-        """
-        try:
-            # Convert image bytes to base64
-            base64_image = base64.b64encode(image_bytes).decode("utf-8")
-            
-            prompt = """Ти експерт з розпізнавання продуктів харчування на фотографіях.
+RECOGNITION_MODEL = "gemini-2.0-flash"
+
+# Identical for every image: sent as system instructions (or from a context cache)
+# so that only the image and a short request vary between calls
+RECOGNITION_PROMPT = """Ти експерт з розпізнавання продуктів харчування на фотографіях.
 
 ЗАВДАННЯ: Ідентифікувати всі продукти на фото і вказати точну кількість згідно правил.
 
@@ -106,35 +84,254 @@ class IngredientRecognizer:
 
 Перевір свою відповідь перед відправкою."""
 
-            response = self.model.generate_content(
-                contents=[
-                    {
-                        "role": "user",
-                        "parts": [
-                            {"text": prompt},
-                            {"inline_data": {
-                                "mime_type": "image/jpeg",
-                                "data": base64_image
-                            }}
-                        ]
-                    }
-                ],
-                generation_config={"temperature": 0.0}
-            )
+RECOGNITION_REQUEST = "Визнач продукти на цьому фото."
+
+# Upper estimate of the answer length, charged against the token quota before the call
+RECOGNITION_OUTPUT_TOKENS = 150
+# Cached instructions still count against the token quota
+RECOGNITION_PROMPT_TOKENS = estimate_text_tokens(RECOGNITION_PROMPT) + estimate_text_tokens(RECOGNITION_REQUEST)
+
+def _image_tokens(image_bytes: bytes) -> int:
+    from image_ingest import inspect_image
+    
+    try:
+        info = inspect_image(image_bytes)
+    except Exception:
+        # Assume a photo of the largest size sent to Gemini
+        return estimate_image_tokens(1536, 1536)
+    return estimate_image_tokens(info.width, info.height)
+
+def merge_ingredients(ingredient_lists: Sequence[List[str]]) -> List[str]:
+    """
+    Merge ingredient lists recognized on several photos into one deduplicated list.
+    
+    Items that refer to the same product are combined and their quantities added up
+    when they use the same unit, e.g. "3 шт яйця" and "2 шт яєць" become "5 шт яйця".
+    
+    Args:
+        ingredient_lists: Ingredient lists in the recognizer format
+        
+    Returns:
+        Merged list of ingredients in first-seen order
+    """
+    return format_ingredients(normalize_ingredients(item for ingredients in ingredient_lists for item in ingredients))
+
+class IngredientRecognizer:
+    def __init__(self, api_key=None, max_concurrency: Optional[int] = None, cache: Optional[RecognitionCache] = None,
+                 resilience: Optional[ResiliencePolicy] = None, context_cache: Optional[bool] = None,
+                 context_cache_ttl: Optional[float] = None):
+        """
+        Initialize the IngredientRecognizer with Gemini API.
+        
+        Args:
+            api_key: Gemini API key (optional, will use env var if not provided)
+            max_concurrency: Maximum number of simultaneous Gemini calls
+                (optional, will use GEMINI_MAX_CONCURRENCY env var if not provided)
+            cache: Cache of recognition results keyed by image content (optional)
+            resilience: Timeout, retry, hedging and circuit breaker policy for Gemini calls
+                (optional, will use GEMINI_* env vars if not provided)
+            context_cache: Whether to keep the recognition instructions in a Gemini context cache
+                (optional, will use GEMINI_CONTEXT_CACHE env var if not provided)
+            context_cache_ttl: Lifetime of the context cache in seconds
+                (optional, will use GEMINI_CONTEXT_CACHE_TTL env var if not provided)
+        """
+        self.api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not self.api_key:
+            raise ValueError("Gemini API key is required. Provide it directly or set GEMINI_API_KEY environment variable.")
+        
+        # The Gemini SDK is imported and configured on first use to keep startup fast
+        self._model = None
+        # Whether RECOGNITION_PROMPT has to be sent in every request
+        self._inline_instructions = True
+        
+        if context_cache is None:
+            context_cache = os.getenv("GEMINI_CONTEXT_CACHE", "0") == "1"
+        self.context_cache = context_cache
+        self.context_cache_ttl = context_cache_ttl or float(os.getenv("GEMINI_CONTEXT_CACHE_TTL", 3600))
+        self._cached_model = None
+        self._cached_model_until = 0.0
+        self._cache_retry_at = 0.0
+        self._cache_lock = asyncio.Lock()
+        
+        self.max_concurrency = max_concurrency or int(os.getenv("GEMINI_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+        # Quotas and queueing are shared with every other caller of the model (GEMINI_RPM, GEMINI_TPM)
+        self.scheduler = model_scheduler(RECOGNITION_MODEL, "gemini", self.max_concurrency)
+        self.cache = cache
+        self._flight = SingleFlight()
+        self.resilience = ResilientCaller("gemini", resilience or ResiliencePolicy.from_env("GEMINI", timeout=30.0, deadline=90.0))
+        
+    @property
+    def model(self) -> Any:
+        """Gemini model, created on first access."""
+        if self._model is None:
+            import google.generativeai as genai
             
-            ingredients_text = response.text.strip()
+            # The async transport keeps a single multiplexed gRPC channel open,
+            # so concurrent calls share one pooled connection to Gemini.
+            genai.configure(api_key=self.api_key, transport="grpc_asyncio")
+            try:
+                self._model = genai.GenerativeModel(model_name=RECOGNITION_MODEL, system_instruction=RECOGNITION_PROMPT)
+                self._inline_instructions = False
+            except TypeError:
+                # google-generativeai < 0.5 has no system instructions; the prompt stays the first part
+                self._model = genai.GenerativeModel(model_name=RECOGNITION_MODEL)
+                self._inline_instructions = True
+        return self._model
+    
+    @model.setter
+    def model(self, model: Any) -> None:
+        # A model supplied from outside (e.g. a test double) is used as is, with inline instructions
+        self._model = model
+        self._inline_instructions = True
+        self._cached_model = None
+        self.context_cache = False
+    
+    def _create_cached_model(self) -> Any:
+        import google.generativeai as genai
+        
+        self.model  # configures the SDK
+        caching = getattr(genai, "caching", None)
+        if caching is None:
+            raise RuntimeError("context caching requires google-generativeai >= 0.7")
+        content = caching.CachedContent.create(
+            model=f"models/{RECOGNITION_MODEL}",
+            system_instruction=RECOGNITION_PROMPT,
+            ttl=timedelta(seconds=self.context_cache_ttl)
+        )
+        return genai.GenerativeModel.from_cached_content(cached_content=content)
+    
+    async def _get_cached_model(self) -> Optional[Any]:
+        """
+        Get a model bound to a context cache holding the recognition instructions.
+        
+        The cache is created on first use and recreated shortly before it expires.
+        
+        Returns:
+            Model using the cached instructions, or None if context caching is off or unavailable
+        """
+        now = time.time()
+        if self._cached_model is not None and now < self._cached_model_until:
+            return self._cached_model
+        if now < self._cache_retry_at:
+            return None
+        async with self._cache_lock:
+            if self._cached_model is not None and time.time() < self._cached_model_until:
+                return self._cached_model
+            try:
+                self._cached_model = await asyncio.to_thread(self._create_cached_model)
+                self._cached_model_until = time.time() + max(self.context_cache_ttl - 60, self.context_cache_ttl / 2)
+            except Exception as e:
+                # e.g. an old SDK, or instructions below the provider's minimum cacheable size
+                logger.warning(f"Gemini context caching unavailable, using system instructions: {str(e)}")
+                self._cached_model = None
+                self._cache_retry_at = time.time() + self.context_cache_ttl
+                return None
+        return self._cached_model
+    
+    async def recognize_from_image_bytes(self, image_bytes: bytes) -> List[str]:
+        """
+        Recognize ingredients from raw image bytes using Gemini.
+        
+        Args:
+            image_bytes: Raw image data
             
-            if "," in ingredients_text:
-                ingredients = [item.strip().lower() for item in ingredients_text.split(",")]
+        Returns:
+            List of recognized ingredients
+        """
+        if self.cache is not None:
+            cached = self.cache.get(image_bytes)
+            metrics.record_cache("recognition", cached is not None)
+            if cached is not None:
+                logger.info("Recognition cache hit")
+                return cached
+        
+        # Concurrent requests for the same image share a single Gemini call
+        ingredients = await self._flight.do(image_digest(image_bytes), lambda: self._recognize(image_bytes))
+        return list(ingredients)
+    
+    async def _recognize(self, image_bytes: bytes) -> List[str]:
+        try:
+            model = await self._get_cached_model() if self.context_cache else None
+            if model is None:
+                model = self.model
+                inline_instructions = self._inline_instructions
             else:
-                ingredients = [item.strip().lower() for item in ingredients_text.split("\n") if item.strip()]
-                if not ingredients:
-                    ingredients = [ingredients_text.lower()]
+                inline_instructions = False
+            
+            parts = [{"text": RECOGNITION_PROMPT}] if inline_instructions else [{"text": RECOGNITION_REQUEST}]
+            parts.append({"inline_data": {"mime_type": "image/jpeg", "data": image_bytes}})
+            contents = [{"role": "user", "parts": parts}]
+            
+            if metrics.enabled():
+                metrics.record_bytes("gemini_request", len(image_bytes) + len(parts[0]["text"].encode("utf-8")))
+            
+            # Hedged duplicates and retries run within the same scheduler slot
+            estimate = RECOGNITION_PROMPT_TOKENS + _image_tokens(image_bytes) + RECOGNITION_OUTPUT_TOKENS
+            async with self.scheduler.slot(estimate) as ticket, metrics.stage("gemini_call"):
+                response = await self.resilience.call(
+                    lambda: ticket.run(
+                        lambda: model.generate_content_async(contents=contents, generation_config={"temperature": 0.0})
+                    )
+                )
+                ticket.used_tokens = getattr(getattr(response, "usage_metadata", None), "total_token_count", None)
             
-            ingredients = [ing[:-1] if ing.endswith('.') else ing for ing in ingredients]
+            ingredients_text = response.text.strip()
+            
+            if metrics.enabled():
+                metrics.record_bytes("gemini_response", len(ingredients_text.encode("utf-8")))
+                usage = getattr(response, "usage_metadata", None)
+                prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+                cached_tokens = getattr(usage, "cached_content_token_count", None) or 0
+                logger.debug(f"Gemini prompt tokens: {prompt_tokens} ({cached_tokens} cached, {prompt_tokens - cached_tokens} uncached)")
+                metrics.record_tokens(
+                    "gemini",
+                    prompt=prompt_tokens,
+                    completion=getattr(usage, "candidates_token_count", None),
+                    cached=cached_tokens,
+                    uncached=prompt_tokens - cached_tokens
+                )
+            
+            # Inflected forms, synonyms and duplicates are merged, e.g. "5 шт яєць" -> "5 шт яйця"
+            items = ingredients_text.split(",") if "," in ingredients_text else ingredients_text.split("\n")
+            ingredients = format_ingredients(normalize_ingredients(items))
+            
+            if self.cache is not None:
+                self.cache.put(image_bytes, ingredients)
             
             return ingredients
             
         except Exception as e:
             logger.error(f"Error recognizing ingredients: {str(e)}")
-            raise Exception(f"Error recognizing ingredients with Gemini: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Error recognizing ingredients with Gemini: {str(e)}")
+    
+    async def recognize_many(self, images: Sequence[bytes], max_concurrency: Optional[int] = None) -> List[str]:
+        """
+        Recognize ingredients on several photos concurrently and merge the results.
+        
+        The same photo uploaded more than once is recognized and counted once.
+        
+        Args:
+            images: Raw image data of each photo
+            max_concurrency: Maximum number of photos of this batch recognized at once
+            
+        Returns:
+            Merged, deduplicated list of recognized ingredients
+        """
+        # Otherwise the quantities of a duplicate photo would be added up by merge_ingredients
+        images = list({image_digest(image_bytes): image_bytes for image_bytes in images}.values())
+        semaphore = asyncio.Semaphore(max_concurrency or DEFAULT_BATCH_CONCURRENCY)
+        
+        async def recognize(image_bytes: bytes) -> List[str]:
+            async with semaphore:
+                return await self.recognize_from_image_bytes(image_bytes)
+        
+        results = await asyncio.gather(*(recognize(image_bytes) for image_bytes in images), return_exceptions=True)
+        
+        ingredient_lists = [result for result in results if not isinstance(result, BaseException)]
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            if not ingredient_lists:
+                raise errors[0]
+            logger.warning(f"Failed to recognize {len(errors)} of {len(results)} images: {str(errors[0])}")
+        
+        return merge_ingredients(ingredient_lists)
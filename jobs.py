@@ -0,0 +1,529 @@
+"""
+Persistent job queue for long-running recipe jobs.
+
+Jobs are stored in SQLite, so they survive restarts and can be shared between
+the API processes that submit them and any number of worker processes:
+
+    python jobs.py          # standalone worker pool (JOBS_DB, JOB_WORKERS)
+"""
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+class RetryableJobError(Exception):
+    """Raised by a job handler when the job should be retried later."""
+
+def webhook_hosts() -> FrozenSet[str]:
+    """
+    Read the hosts job webhooks may be sent to from the JOB_WEBHOOK_HOSTS env var.
+
+    Returns:
+        Lowercase host names; an entry starting with a dot also allows its subdomains
+    """
+    return frozenset(host.strip().lower() for host in os.getenv("JOB_WEBHOOK_HOSTS", "").split(",") if host.strip())
+
+def is_webhook_allowed(url: str, hosts: Iterable[str]) -> bool:
+    """
+    Check whether a webhook URL may be called, so that a client cannot make the
+    workers send requests to internal services.
+
+    Args:
+        url: Webhook URL given by the client
+        hosts: Allowed hosts as returned by webhook_hosts()
+
+    Returns:
+        True for an https URL whose host is in the allowlist
+    """
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+        parts.port  # raises ValueError for an invalid port
+    except ValueError:
+        return False
+    if parts.scheme != "https" or not host:
+        return False
+    return any(host == allowed or (allowed.startswith(".") and host.endswith(allowed)) for allowed in hosts)
+
+@dataclass
+class Job:
+    id: str
+    difficulty: str
+    attempts: int
+    webhook_url: Optional[str]
+    images: List[bytes]
+
+class JobStore:
+    def __init__(self, db_path: str, result_ttl: float = 86400, max_attempts: int = 3, lease: float = 300):
+        """
+        Initialize an SQLite-backed job store.
+
+        Args:
+            db_path: Path to the SQLite database
+            result_ttl: How long finished jobs are kept, in seconds
+            max_attempts: Maximum number of attempts before a job is marked as failed
+            lease: Seconds a worker may go without renewing its lease before the job is
+                handed to another worker
+        """
+        self.result_ttl = result_ttl
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, difficulty TEXT NOT NULL, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL, available_at REAL NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, lease_expires REAL, webhook_url TEXT, "
+            "result TEXT, error TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, available_at)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS job_images ("
+            "job_id TEXT NOT NULL, position INTEGER NOT NULL, data BLOB NOT NULL, "
+            "PRIMARY KEY (job_id, position))"
+        )
+
+    def submit(self, images: List[bytes], difficulty: str, webhook_url: Optional[str] = None) -> str:
+        """
+        Add a job to the queue.
+
+        Args:
+            images: Uploaded photos
+            difficulty: Difficulty level as shown in the UI
+            webhook_url: URL notified with the job result when it finishes (optional)
+
+        Returns:
+            Job ID
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "INSERT INTO jobs (id, status, difficulty, created_at, updated_at, available_at, webhook_url) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, QUEUED, difficulty, now, now, now, webhook_url)
+                )
+                self._db.executemany(
+                    "INSERT INTO job_images (job_id, position, data) VALUES (?, ?, ?)",
+                    [(job_id, i, sqlite3.Binary(data)) for i, data in enumerate(images)]
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def claim(self) -> Optional[Job]:
+        """
+        Take the oldest available job, including jobs whose worker lease has expired.
+
+        Returns:
+            The claimed job, or None if the queue is empty
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                # A job whose lease expired on its last attempt is left to fail_abandoned()
+                row = self._db.execute(
+                    "SELECT id, difficulty, attempts, webhook_url FROM jobs "
+                    "WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires < ? AND attempts < ?) "
+                    "ORDER BY available_at LIMIT 1",
+                    (QUEUED, now, RUNNING, now, self.max_attempts)
+                ).fetchone()
+                if row is None:
+                    self._db.execute("COMMIT")
+                    return None
+                job_id, difficulty, attempts, webhook_url = row
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_expires = ?, updated_at = ? WHERE id = ?",
+                    (RUNNING, now + self.lease, now, job_id)
+                )
+                images = [bytes(data) for (data,) in self._db.execute(
+                    "SELECT data FROM job_images WHERE job_id = ? ORDER BY position", (job_id,)
+                )]
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return Job(id=job_id, difficulty=difficulty, attempts=attempts + 1, webhook_url=webhook_url, images=images)
+
+    def renew(self, job: Job) -> bool:
+        """
+        Extend the lease of a running job, so that a slow attempt is not handed to another worker.
+
+        Args:
+            job: Job returned by claim()
+
+        Returns:
+            False if the job is no longer held by this attempt
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND status = ? AND attempts = ?",
+                (now + self.lease, now, job.id, RUNNING, job.attempts)
+            )
+        return cursor.rowcount > 0
+
+    def fail_abandoned(self) -> List[Tuple[str, Optional[str]]]:
+        """
+        Mark jobs as failed whose worker lease expired on their last attempt,
+        so that a job which keeps crashing its worker is not redelivered forever.
+
+        Returns:
+            IDs and webhook URLs of the jobs marked as failed
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT id, webhook_url FROM jobs WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                    (RUNNING, now, self.max_attempts)
+                ).fetchall()
+                for job_id, _ in rows:
+                    self._db.execute(
+                        "UPDATE jobs SET status = ?, error = ?, lease_expires = NULL, updated_at = ? WHERE id = ?",
+                        (FAILED, "Worker stopped responding while processing the job", now, job_id)
+                    )
+                    self._db.execute("DELETE FROM job_images WHERE job_id = ?", (job_id,))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return rows
+
+    def complete(self, job: Job, result: Dict[str, Any]) -> bool:
+        """
+        Store the result of a finished job and drop its images.
+
+        Args:
+            job: Job returned by claim()
+            result: JSON-serializable job result
+
+        Returns:
+            False if the attempt had lost the job to another worker and the result was discarded
+        """
+        return self._finish(job, DONE, result=json.dumps(result, ensure_ascii=False))
+
+    def fail(self, job: Job, error: str, retry_delay: float) -> Optional[str]:
+        """
+        Record a failed attempt and either requeue the job or mark it as failed.
+
+        Args:
+            job: Job returned by claim()
+            error: Error description
+            retry_delay: Base delay before the next attempt, in seconds
+
+        Returns:
+            QUEUED if the job will be retried, FAILED if it has no attempts left,
+            or None if the attempt had lost the job to another worker
+        """
+        if job.attempts >= self.max_attempts:
+            return FAILED if self._finish(job, FAILED, error=error) else None
+        # Exponential backoff with jitter
+        delay = retry_delay * (2 ** (job.attempts - 1)) * random.uniform(0.5, 1.5)
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, lease_expires = NULL, error = ?, updated_at = ? "
+                "WHERE id = ? AND status = ? AND attempts = ?",
+                (QUEUED, now + delay, error, now, job.id, RUNNING, job.attempts)
+            )
+        return QUEUED if cursor.rowcount else None
+
+    def _finish(self, job: Job, status: str, result: Optional[str] = None, error: Optional[str] = None) -> bool:
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                # Only the attempt that holds the job may finish it
+                cursor = self._db.execute(
+                    "UPDATE jobs SET status = ?, result = ?, error = ?, lease_expires = NULL, updated_at = ? "
+                    "WHERE id = ? AND status = ? AND attempts = ?",
+                    (status, result, error, now, job.id, RUNNING, job.attempts)
+                )
+                if cursor.rowcount:
+                    self._db.execute("DELETE FROM job_images WHERE job_id = ?", (job.id,))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return cursor.rowcount > 0
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up the state of a job.
+
+        Args:
+            job_id: Job ID
+
+        Returns:
+            Job status with its result or error, or None if the job is unknown or expired
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, attempts, created_at, updated_at, result, error FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, attempts, created_at, updated_at, result, error = row
+        return {
+            "job_id": job_id,
+            "status": status,
+            "attempts": attempts,
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "result": json.loads(result) if result else None,
+            "error": error if status == FAILED else None,
+        }
+
+    def purge_expired(self) -> int:
+        """
+        Delete finished jobs older than the result TTL.
+
+        Returns:
+            Number of deleted jobs
+        """
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (DONE, FAILED, cutoff)
+            )
+        return cursor.rowcount
+
+JobHandler = Callable[[List[bytes], str], Awaitable[Dict[str, Any]]]
+
+class JobWorkerPool:
+    def __init__(self, store: JobStore, handler: JobHandler, concurrency: int = 4,
+                 poll_interval: float = 0.5, retry_delay: float = 2.0, purge_interval: float = 600,
+                 webhook_hosts: Iterable[str] = ()):
+        """
+        Initialize a pool of async workers that process queued jobs.
+
+        Args:
+            store: Job store to take jobs from
+            handler: Coroutine function processing (images, difficulty) into a result dictionary
+            concurrency: Number of jobs processed at once
+            poll_interval: Delay between polls of an empty queue, in seconds
+            retry_delay: Base delay before a failed job is retried, in seconds
+            purge_interval: How often expired results are deleted, in seconds
+            webhook_hosts: Hosts webhooks may be sent to (see is_webhook_allowed); none disables webhooks
+        """
+        self.store = store
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.purge_interval = purge_interval
+        self.webhook_hosts = frozenset(webhook_hosts)
+        self._tasks: List[asyncio.Task] = []
+        self._http = None
+
+    def start(self) -> None:
+        """Start the worker tasks on the running event loop."""
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._purger()))
+        logger.info(f"Started {self.concurrency} job workers")
+
+    async def stop(self) -> None:
+        """Cancel the worker tasks; jobs in progress are picked up again after their lease expires."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            try:
+                job = await asyncio.to_thread(self.store.claim)
+                if job is not None:
+                    await self._process(job)
+                    continue
+            except Exception as e:
+                # E.g. "database is locked" under contention: the job stays in the queue
+                # (or is redelivered after its lease) and the worker keeps polling
+                logger.warning(f"Job worker {index} failed: {str(e)}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _heartbeat(self, job: Job) -> None:
+        # The pipeline can legitimately take longer than the lease (provider deadlines plus
+        # time queued behind the quota scheduler), so the lease is renewed while the job runs
+        while True:
+            await asyncio.sleep(self.store.lease / 3)
+            try:
+                if not await asyncio.to_thread(self.store.renew, job):
+                    logger.warning(f"Job {job.id} attempt {job.attempts} lost its lease")
+                    return
+            except Exception as e:
+                logger.warning(f"Renewing the lease of job {job.id} failed: {str(e)}")
+
+    async def _process(self, job: Job) -> None:
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            result = await self.handler(job.images, job.difficulty)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            status = await asyncio.to_thread(self.store.fail, job, str(e), self.retry_delay)
+            logger.warning(f"Job {job.id} attempt {job.attempts} failed{' (will retry)' if status == QUEUED else ''}: {str(e)}")
+            if status == FAILED:
+                await self._notify(job.id, job.webhook_url, await asyncio.to_thread(self.store.get, job.id))
+            return
+        finally:
+            heartbeat.cancel()
+        if not await asyncio.to_thread(self.store.complete, job, result):
+            logger.warning(f"Job {job.id} attempt {job.attempts} finished after losing its lease, result discarded")
+            return
+        await self._notify(job.id, job.webhook_url, await asyncio.to_thread(self.store.get, job.id))
+
+    async def _notify(self, job_id: str, webhook_url: Optional[str], payload: Optional[Dict[str, Any]]) -> None:
+        if not webhook_url or payload is None:
+            return
+        if not is_webhook_allowed(webhook_url, self.webhook_hosts):
+            logger.warning(f"Webhook for job {job_id} skipped: {webhook_url} is not in JOB_WEBHOOK_HOSTS")
+            return
+        import httpx
+
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=10)
+        try:
+            await self._http.post(webhook_url, json=payload)
+        except Exception as e:
+            logger.warning(f"Webhook for job {job_id} failed: {str(e)}")
+
+    async def _purger(self) -> None:
+        # Abandoned jobs are checked once per lease, expired results once per purge_interval
+        interval = min(self.purge_interval, self.store.lease)
+        last_purge = None
+        while True:
+            try:
+                for job_id, webhook_url in await asyncio.to_thread(self.store.fail_abandoned):
+                    logger.warning(f"Job {job_id} failed: its lease expired on the last attempt")
+                    await self._notify(job_id, webhook_url, await asyncio.to_thread(self.store.get, job_id))
+                if last_purge is None or time.monotonic() - last_purge >= self.purge_interval:
+                    last_purge = time.monotonic()
+                    purged = await asyncio.to_thread(self.store.purge_expired)
+                    if purged:
+                        logger.info(f"Purged {purged} expired jobs")
+            except sqlite3.Error as e:
+                logger.warning(f"Job store maintenance failed: {str(e)}")
+            await asyncio.sleep(interval)
+
+async def run_recipe_job(images: List[bytes], difficulty: str) -> Dict[str, Any]:
+    """
+    Recognize ingredients on the job's photos and generate a recipe.
+
+    Args:
+        images: Uploaded photos
+        difficulty: Difficulty level as shown in the UI
+
+    Returns:
+        Result in the same shape as the /api/recipes response
+    """
+    from image_ingest import prepare_image_bytes
+    from scheduler import BACKGROUND, priority
+    from services import (
+        ingredient_recognizer, recipe_generator, difficulty_map, max_image_edge, jpeg_quality, batch_concurrency
+    )
+
+    prepared = [
+        (await asyncio.to_thread(prepare_image_bytes, image, max_image_edge, jpeg_quality)).image_bytes
+        for image in images
+    ]
+    # Jobs yield provider quota to interactive requests served by the same process
+    with priority(BACKGROUND):
+        if len(prepared) == 1:
+            ingredients = await ingredient_recognizer.recognize_from_image_bytes(prepared[0])
+        else:
+            ingredients = await ingredient_recognizer.recognize_many(prepared, max_concurrency=batch_concurrency)
+
+    if not ingredients:
+        return {
+            "ingredients": [],
+            "difficulty": difficulty,
+            "message": "На зображенні не вдалося розпізнати жодних продуктів харчування."
+        }
+
+    with priority(BACKGROUND):
+        recipe_data = await recipe_generator.generate_recipes(ingredients, difficulty_map.get(difficulty, "середній"))
+    if "compatible" not in recipe_data and not recipe_data.get("recipes"):
+        # The generator reports provider errors as a message without a result
+        raise RetryableJobError(recipe_data.get("message", "Recipe generation failed"))
+
+    recipes = recipe_data.get("recipes") or []
+    return {
+        "ingredients": ingredients,
+        "difficulty": difficulty,
+        "compatible": recipe_data.get("compatible"),
+        "recipe": recipes[0] if recipes else None,
+        "message": recipe_data.get("message"),
+    }
+
+def create_store() -> JobStore:
+    """
+    Create the job store configured by the JOBS_DB, JOB_RESULT_TTL and JOB_MAX_ATTEMPTS env vars.
+
+    Returns:
+        Job store instance
+    """
+    return JobStore(
+        os.getenv("JOBS_DB", "jobs.sqlite"),
+        result_ttl=float(os.getenv("JOB_RESULT_TTL", 86400)),
+        max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+    )
+
+def create_worker_pool(store: JobStore, concurrency: Optional[int] = None) -> JobWorkerPool:
+    """
+    Create a worker pool configured by the JOB_WORKERS, JOB_RETRY_DELAY and JOB_WEBHOOK_HOSTS env vars.
+
+    Args:
+        store: Job store to take jobs from
+        concurrency: Number of jobs processed at once (JOB_WORKERS if omitted)
+
+    Returns:
+        Worker pool instance (not started)
+    """
+    return JobWorkerPool(
+        store,
+        run_recipe_job,
+        concurrency=concurrency or int(os.getenv("JOB_WORKERS", 4)),
+        retry_delay=float(os.getenv("JOB_RETRY_DELAY", 2)),
+        webhook_hosts=webhook_hosts()
+    )
+
+async def _main() -> None:
+    pool = create_worker_pool(create_store())
+    pool.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await pool.stop()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -0,0 +1,338 @@
+"""
+Per-stage latency, payload and token instrumentation with Prometheus text exposition.
+
+Instrumentation is off unless METRICS_ENABLED=1 (or configure(True) is called).
+While disabled, stage() returns a shared no-op context manager and the record_*
+helpers return after a single flag check, so instrumented code pays next to nothing.
+"""
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Dict, Optional, Sequence, Tuple
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 2097152, 5242880, 10485760)
+
+_enabled = os.getenv("METRICS_ENABLED", "0") == "1"
+_NOOP = nullcontext()
+
+def configure(enabled: bool) -> None:
+    """
+    Turn instrumentation on or off.
+
+    Args:
+        enabled: Whether metrics are collected
+    """
+    global _enabled
+    _enabled = enabled
+
+def enabled() -> bool:
+    return _enabled
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return "\n".join(lines)
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, 'le="%g"' % bound)
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {state[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-2]:g}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return "\n".join(lines)
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram("recipe_stage_duration_seconds", "Duration of pipeline stages.", ["stage"])
+PAYLOAD_BYTES = registry.histogram("recipe_payload_bytes", "Size of payloads per stage.", ["stage"], BYTES_BUCKETS)
+PROVIDER_TOKENS = registry.counter("provider_tokens_total", "Tokens reported by the providers.", ["provider", "kind"])
+CACHE_LOOKUPS = registry.counter("cache_lookups_total", "Cache lookups by result.", ["cache", "result"])
+RESILIENCE_EVENTS = registry.counter(
+    "provider_resilience_events_total", "Retries, timeouts, hedged calls, rate limits and circuit breaker events.", ["provider", "event"]
+)
+PRESCREEN_RESULTS = registry.counter(
+    "image_prescreen_total", "Photos flagged or rejected by the local pre-screen.", ["reason", "action"]
+)
+REQUESTS = registry.counter("recipe_requests_total", "Finished requests by outcome.", ["outcome"])
+REQUEST_SECONDS = registry.histogram("recipe_request_duration_seconds", "End-to-end request duration.")
+
+class RequestContext:
+    __slots__ = ("request_id", "started", "stages", "payloads", "tokens")
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.payloads: Dict[str, int] = {}
+        self.tokens: Dict[str, int] = {}
+
+_request: ContextVar[Optional[RequestContext]] = ContextVar("metrics_request", default=None)
+
+def current_request_id() -> Optional[str]:
+    context = _request.get()
+    return context.request_id if context is not None else None
+
+def start_request(request_id: Optional[str] = None) -> Optional[RequestContext]:
+    """
+    Begin collecting per-request data in the current context.
+
+    Args:
+        request_id: Identifier to use (a random one is generated if omitted)
+
+    Returns:
+        The request context, or None when instrumentation is disabled
+    """
+    if not _enabled:
+        return None
+    context = RequestContext(request_id or uuid.uuid4().hex[:16])
+    _request.set(context)
+    return context
+
+def finish_request(outcome: str, context: Optional[RequestContext] = None) -> None:
+    """
+    Record the end of a request and emit its structured log line.
+
+    Args:
+        outcome: Short outcome label, e.g. "ok" or "error"
+        context: Context returned by start_request (defaults to the one active in the current context)
+    """
+    if not _enabled:
+        return
+    context = context or _request.get()
+    if context is None:
+        return
+    total = time.perf_counter() - context.started
+    REQUESTS.inc(outcome=outcome)
+    REQUEST_SECONDS.observe(total)
+    logger.info(json.dumps({
+        "request_id": context.request_id,
+        "outcome": outcome,
+        "total_ms": round(total * 1000, 1),
+        "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in context.stages.items()},
+        "bytes": context.payloads,
+        "tokens": context.tokens,
+    }, ensure_ascii=False))
+
+class _StageTimer:
+    """Times a block as a pipeline stage; usable with both `with` and `async with`."""
+
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = 0.0
+
+    def __enter__(self) -> "_StageTimer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        record_duration(self.name, time.perf_counter() - self.started)
+
+    async def __aenter__(self) -> "_StageTimer":
+        return self.__enter__()
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.__exit__(*exc_info)
+
+def stage(name: str):
+    """
+    Time a block of code as a pipeline stage.
+
+    Args:
+        name: Stage name
+
+    Returns:
+        Context manager (a shared no-op one when instrumentation is disabled)
+    """
+    if not _enabled:
+        return _NOOP
+    return _StageTimer(name)
+
+def record_duration(name: str, seconds: float) -> None:
+    if not _enabled:
+        return
+    STAGE_SECONDS.observe(seconds, stage=name)
+    context = _request.get()
+    if context is not None:
+        context.stages[name] = context.stages.get(name, 0.0) + seconds
+
+def record_bytes(name: str, size: int) -> None:
+    if not _enabled:
+        return
+    PAYLOAD_BYTES.observe(size, stage=name)
+    context = _request.get()
+    if context is not None:
+        context.payloads[name] = context.payloads.get(name, 0) + size
+
+def record_tokens(provider: str, **counts: Optional[int]) -> None:
+    """
+    Record token usage reported by a provider.
+
+    Args:
+        provider: Provider name, e.g. "gemini" or "openai"
+        counts: Token counts by kind (prompt, completion, cached...); None values are skipped
+    """
+    if not _enabled:
+        return
+    context = _request.get()
+    for kind, count in counts.items():
+        if not count:
+            continue
+        PROVIDER_TOKENS.inc(count, provider=provider, kind=kind)
+        if context is not None:
+            key = f"{provider}_{kind}"
+            context.tokens[key] = context.tokens.get(key, 0) + count
+
+def record_cache(cache: str, hit: bool) -> None:
+    if not _enabled:
+        return
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+def record_resilience(provider: str, event: str) -> None:
+    """
+    Count a resilience event of a provider call.
+
+    Args:
+        provider: Provider name, e.g. "gemini" or "openai"
+        event: One of retry, timeout, hedge, hedge_won, circuit_open, rejected, rate_limited
+    """
+    if not _enabled:
+        return
+    RESILIENCE_EVENTS.inc(provider=provider, event=event)
+
+def record_prescreen(reason: str, action: str) -> None:
+    """
+    Count a photo flagged by the local pre-screen.
+
+    Args:
+        reason: Check that failed, e.g. "blurry" or "dark"
+        action: "rejected" or "flagged" (passed on in warn mode)
+    """
+    if not _enabled:
+        return
+    PRESCREEN_RESULTS.inc(reason=reason, action=action)
+
+def render() -> str:
+    """
+    Render all metrics in the Prometheus text exposition format.
+
+    Returns:
+        Metrics text
+    """
+    return registry.render()
+
+def start_http_server(port: int, host: str = "0.0.0.0") -> "ThreadingHTTPServer":
+    """
+    Serve /metrics from a background thread.
+
+    Args:
+        port: Port to listen on
+        host: Interface to bind
+
+    Returns:
+        The running server
+    """
+    # Imported here: http.server is slow to import and only needed by the standalone endpoint
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return server
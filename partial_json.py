@@ -0,0 +1,78 @@
+from typing import Any, List, Optional
+import json
+import re
+
+# Trailing fragments that cannot be closed into valid JSON: a dangling comma or
+# colon, an object key without a value, or a half-written literal or number.
+_TRAILING_FRAGMENTS = (
+    re.compile(r"[,:]\s*$"),
+    re.compile(r'"(?:[^"\\]|\\.)*"\s*$'),
+    re.compile(r"(?:t(?:r(?:ue?)?)?|f(?:a(?:l(?:se?)?)?)?|n(?:u(?:ll?)?)?|-?[\d.eE+-]+)\s*$"),
+)
+_INCOMPLETE_UNICODE_ESCAPE = re.compile(r"\\u[0-9a-fA-F]{0,3}$")
+
+class IncrementalJSONParser:
+    """
+    Parse a JSON document while it is still being streamed.
+
+    Bracket and string state is tracked incrementally as chunks arrive, so each
+    snapshot only costs one json.loads of the text received so far.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._closers: List[str] = []
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> None:
+        """
+        Append a chunk of the streamed document.
+
+        Args:
+            chunk: Next piece of JSON text
+        """
+        for ch in chunk:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._closers.append("}")
+            elif ch == "[":
+                self._closers.append("]")
+            elif ch in "}]" and self._closers:
+                self._closers.pop()
+        self.text += chunk
+
+    def snapshot(self) -> Optional[Any]:
+        """
+        Parse the text received so far, closing any unterminated strings, arrays and objects.
+
+        Returns:
+            Parsed value, or None if nothing meaningful has arrived yet
+        """
+        candidate = self.text
+        if self._in_string:
+            candidate = candidate[:-1] if self._escape else _INCOMPLETE_UNICODE_ESCAPE.sub("", candidate)
+            candidate += '"'
+        closing = "".join(reversed(self._closers))
+
+        for _ in range(2 * len(_TRAILING_FRAGMENTS)):
+            try:
+                return json.loads(candidate + closing)
+            except json.JSONDecodeError:
+                pass
+            for pattern in _TRAILING_FRAGMENTS:
+                trimmed = pattern.sub("", candidate)
+                if trimmed != candidate:
+                    candidate = trimmed
+                    break
+            else:
+                return None
+        return None
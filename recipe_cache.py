@@ -0,0 +1,150 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import copy
+import logging
+import threading
+import time
+
+from ingredient_normalization import Ingredient, ingredient_key
+
+logger = logging.getLogger(__name__)
+
+def canonical_ingredient(ingredient: Union[str, Ingredient]) -> str:
+    """
+    Reduce an ingredient to a canonical form that ignores quantity, casing, inflection and synonyms.
+
+    Args:
+        ingredient: Ingredient as returned by the recognizer, e.g. "5 шт яєць", or a parsed Ingredient
+
+    Returns:
+        Canonical ingredient key, e.g. "яйця"
+    """
+    return ingredient_key(ingredient)
+
+def canonical_key(ingredients: Iterable[Union[str, Ingredient]], difficulty: Optional[str]) -> str:
+    """
+    Build a cache key from an ingredient set and a difficulty level.
+
+    Args:
+        ingredients: List of ingredients
+        difficulty: Difficulty level
+
+    Returns:
+        Key that is identical for the same set of ingredients in any order, casing or quantity
+    """
+    names = sorted({name for name in (canonical_ingredient(i) for i in ingredients) if name})
+    return f"{(difficulty or '').lower()}|{','.join(names)}"
+
+@dataclass
+class RecipeCacheStats:
+    hits: int = 0
+    misses: int = 0
+    refreshes: int = 0
+
+    def as_dict(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+@dataclass
+class _Entry:
+    updated_at: float
+    variants: List[Dict[str, Any]] = field(default_factory=list)
+    served: int = 0
+    cursor: int = 0
+
+class RecipeCache:
+    def __init__(self, max_entries: int = 512, ttl: float = 86400, serve_limit: int = 0, max_variants: int = 3):
+        """
+        Initialize an LRU/TTL cache of generated recipes keyed by canonical ingredients and difficulty.
+
+        Args:
+            max_entries: Maximum number of ingredient sets kept in the cache
+            ttl: Time to live of an entry in seconds (0 disables expiry)
+            serve_limit: Number of times cached variants are served before a new one is
+                generated for the same key (0 always serves from cache)
+            max_variants: Maximum number of recipe variants kept per key
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.serve_limit = serve_limit
+        self.max_variants = max(1, max_variants)
+        self.stats = RecipeCacheStats()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached recipe, rotating between the stored variants.
+
+        Args:
+            key: Key built with canonical_key
+
+        Returns:
+            Copy of a cached recipe data dictionary, or None when a fresh recipe should be generated
+        """
+        return self.lookup(key)[0]
+
+    def lookup(self, key: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """
+        Look up a cached recipe like get(), also telling a plain miss from a refresh.
+
+        Args:
+            key: Key built with canonical_key
+
+        Returns:
+            Tuple of (copy of a cached recipe data dictionary or None, whether the key is cached
+            but its variants were served serve_limit times and a new one should be generated)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl and time.time() - entry.updated_at > self.ttl):
+                if entry is not None:
+                    del self._entries[key]
+                self.stats.misses += 1
+                return None, False
+
+            if self.serve_limit and entry.served >= self.serve_limit:
+                # Let the caller generate a new variant, then start counting again
+                entry.served = 0
+                self.stats.misses += 1
+                self.stats.refreshes += 1
+                return None, True
+
+            variant = entry.variants[entry.cursor % len(entry.variants)]
+            entry.cursor += 1
+            entry.served += 1
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return copy.deepcopy(variant), False
+
+    def put(self, key: str, recipe_data: Dict[str, Any]) -> None:
+        """
+        Add a generated recipe as a new variant for the key.
+
+        Args:
+            key: Key built with canonical_key
+            recipe_data: Recipe data dictionary returned by the generator
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(updated_at=time.time())
+            entry.variants.append(copy.deepcopy(recipe_data))
+            del entry.variants[:-self.max_variants]
+            entry.updated_at = time.time()
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
@@ -1,50 +1,35 @@
-from openai import OpenAI
-from typing import List, Dict, Any
+from typing import TYPE_CHECKING, List, Dict, Any, AsyncIterator, Optional, Union
+import copy
 import logging
 import json
 import os
+import time
+from recipe_cache import RecipeCache, canonical_key
+from recipe_store import RecipeStore
+from ingredient_normalization import Ingredient
+from partial_json import IncrementalJSONParser
+from singleflight import SingleFlight
+from resilience import ResiliencePolicy, ResilientCaller, iterate_with_timeout
+from scheduler import estimate_text_tokens, model_scheduler
+import metrics
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-class RecipeGenerator:
-    def __init__(self, openai_client=None):
-        """
-        Initialize the RecipeGenerator.
-        
-        Args:
-            openai_client: OpenAI client instance (optional, will create new one if not provided)
-        """
-        if openai_client:
-            self.client = openai_client
-        else:
-            api_key = os.getenv("OPENAI_API_KEY")
-            if not api_key:
-                raise ValueError("OpenAI API key is required. Please set OPENAI_API_KEY environment variable.")
-            self.client = OpenAI(api_key=api_key)
-    
-    async def generate_recipes(self, ingredients: List[str], difficulty: str = None) -> Dict[str, Any]:
-        """
-        Generate recipes based on the provided ingredients.
-        
-        Args:
-            ingredients: List of ingredients to use in recipes
-            difficulty: Optional difficulty level (легкий, середній, складний)
-            
-        Returns:
-            Dictionary containing recipe data
-        """
-        try:
-            difficulty_guides = {
-                "легкий": "прості рецепти, 3-5 кроків, до 30 хвилин, базові техніки приготування",
-                "середній": "середня складність, 5-7 кроків, до 60 хвилин, різноманітніші техніки",
-                "складний": "складні техніки, 7+ кроків, понад 60 хвилин, комплексні методи приготування"
-            }
-            
-            diff_guide = difficulty_guides.get(difficulty.lower(), difficulty_guides["середній"])
-            
-            prompt = f"""
-Ти досвідчений шеф-кухар. Створи смачний рецепт зі списку інгредієнтів: {', '.join(ingredients)}.
+DEFAULT_MAX_CONCURRENCY = 8
+
+RECIPE_MODEL = "o4-mini"
+
+DIFFICULTY_GUIDES = {
+    "легкий": "прості рецепти, 3-5 кроків, до 30 хвилин, базові техніки приготування",
+    "середній": "середня складність, 5-7 кроків, до 60 хвилин, різноманітніші техніки",
+    "складний": "складні техніки, 7+ кроків, понад 60 хвилин, комплексні методи приготування"
+}
+
+# Identical for every request, so it forms the cacheable prompt prefix
+RECIPE_SYSTEM_PROMPT = """Ти досвідчений шеф-кухар. Створи смачний рецепт зі списку інгредієнтів, який надасть користувач.
 
 ЗАВДАННЯ: Створити смачну страву, використовуючи логічну підмножину доступних інгредієнтів.
 
@@ -60,7 +45,7 @@ class RecipeGenerator:
 1) Молоко + риба або молоко + огірки(свіжі або консервовані) 
 2) Будь-які експериментальні поєднання, що суперечать кулінарній логіці
 
-СКЛАДНІСТЬ РЕЦЕПТУ - {difficulty}: {diff_guide}
+СКЛАДНІСТЬ РЕЦЕПТУ: дотримуйся рівня складності, вказаного користувачем.
 
 ВИМОГИ ДО ФОРМАТУ:
 1) Вказуй реалістичний час приготування для кожного етапу
@@ -68,49 +53,239 @@ class RecipeGenerator:
 3) Обов'язково включи невикористані інгредієнти до списку "unused_ingredients"
 
 ФОРМАТ ВІДПОВІДІ (JSON):
-{{
+{
   "compatible": true,
   "recipes": [
-    {{
+    {
       "name": "Назва рецепту",
       "ingredients": ["2 шт яйця", "300 г картоплі", "1 шт цибуля", "2 ст.л. олії", "..."],
       "instructions": "1. Перший крок.\\n2. Другий крок.\\n3. Третій крок.",
       "total_time": час у хвилинах,
       "servings": кількість порцій,
-      "difficulty": "{difficulty}",
+      "difficulty": "рівень складності з запиту",
       "serving_suggestions": "Порада щодо подачі.",
       "unused_ingredients": ["помідори", "шинка"]
-    }}
+    }
   ],
   "message": "Короткий коментар чому деякі інгредієнти не використані."
-}}
+}
 
 Якщо створення рецепту неможливе через несумісність усіх інгредієнтів, відповідай СТРОГО у такому форматі:
-{{
+{
   "compatible": false,
   "recipes": [],
   "message": "З цих інгредієнтів неможливо створити смачну страву. Спробуйте завантажити фото з іншими продуктами."
-}}"""
+}"""
+
+def create_openai_client(api_key: str, max_connections: int = DEFAULT_MAX_CONCURRENCY) -> "AsyncOpenAI":
+    """
+    Create an AsyncOpenAI client backed by a pooled keep-alive HTTP connection pool.
+    
+    Args:
+        api_key: OpenAI API key
+        max_connections: Size of the HTTP connection pool
+        
+    Returns:
+        AsyncOpenAI client instance
+    """
+    import httpx
+    from openai import AsyncOpenAI
+    
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    )
+    # Retries are made by ResilientCaller, which also counts them and bounds them by the deadline
+    return AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+# Expected reasoning and answer tokens, charged against the token quota before the call
+# and corrected by the reported usage afterwards
+RECIPE_COMPLETION_TOKENS = 2500
+
+def _estimate_tokens(completion_params: Dict[str, Any]) -> int:
+    return sum(estimate_text_tokens(message["content"]) for message in completion_params["messages"]) + RECIPE_COMPLETION_TOKENS
+
+def _request_bytes(completion_params: Dict[str, Any]) -> int:
+    return sum(len(message["content"].encode("utf-8")) for message in completion_params["messages"])
+
+async def _close_stream(stream: Any) -> None:
+    close = getattr(stream, "close", None)
+    if close is not None:
+        await close()
+
+class RecipeGenerator:
+    def __init__(self, openai_client=None, max_concurrency: Optional[int] = None, cache: Optional[RecipeCache] = None,
+                 resilience: Optional[ResiliencePolicy] = None, store: Optional[RecipeStore] = None):
+        """
+        Initialize the RecipeGenerator.
+        
+        Args:
+            openai_client: AsyncOpenAI client instance (optional, will create one on first use if not provided)
+            max_concurrency: Maximum number of simultaneous OpenAI calls
+                (optional, will use OPENAI_MAX_CONCURRENCY env var if not provided)
+            cache: Cache of generated recipes keyed by canonical ingredients and difficulty (optional)
+            resilience: Timeout, retry, hedging and circuit breaker policy for OpenAI calls
+                (optional, will use OPENAI_* env vars if not provided)
+            store: Store of known recipes served without an OpenAI call when one matches well enough (optional)
+        """
+        self.max_concurrency = max_concurrency or int(os.getenv("OPENAI_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+        # Quotas and queueing are shared with every other caller of the model (OPENAI_RPM, OPENAI_TPM)
+        self.scheduler = model_scheduler(RECIPE_MODEL, "openai", self.max_concurrency)
+        self.cache = cache
+        self.store = store
+        self._flight = SingleFlight()
+        # o4-mini reasons before answering, so its calls get a longer deadline than Gemini's
+        self.resilience = ResilientCaller("openai", resilience or ResiliencePolicy.from_env("OPENAI", timeout=90.0, deadline=240.0))
+        
+        self._client = openai_client
+        if not openai_client:
+            self._api_key = os.getenv("OPENAI_API_KEY")
+            if not self._api_key:
+                raise ValueError("OpenAI API key is required. Please set OPENAI_API_KEY environment variable.")
+    
+    @property
+    def client(self) -> Any:
+        """AsyncOpenAI client, created on first access."""
+        if self._client is None:
+            self._client = create_openai_client(self._api_key, self.max_concurrency)
+        return self._client
+    
+    @client.setter
+    def client(self, client: Any) -> None:
+        self._client = client
+    
+    def saturated(self) -> bool:
+        """
+        Check whether a new OpenAI call would have to wait.
+        
+        Returns:
+            True if all call slots are in use, callers are queued or the model is rate limited
+        """
+        return self.scheduler.saturated()
+    
+    def _record_usage(self, usage: Any) -> None:
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        prompt = getattr(usage, "prompt_tokens", None) or 0
+        cached = getattr(details, "cached_tokens", None) or 0
+        logger.debug(f"OpenAI prompt tokens: {prompt} ({cached} cached, {prompt - cached} uncached)")
+        metrics.record_tokens(
+            "openai",
+            prompt=prompt,
+            completion=getattr(usage, "completion_tokens", None),
+            cached=cached,
+            uncached=prompt - cached
+        )
+    
+    def _build_completion_params(self, ingredients: List[Union[str, Ingredient]], difficulty: str) -> Dict[str, Any]:
+        """
+        Build the chat completion request for the provided ingredients.
+        
+        The static instructions go first as the system message so that OpenAI can
+        reuse its cached prefix; only the short user message changes per request.
+        
+        Args:
+            ingredients: List of ingredients to use in recipes
+            difficulty: Difficulty level (легкий, середній, складний)
+            
+        Returns:
+            Keyword arguments for chat.completions.create
+        """
+        diff_guide = DIFFICULTY_GUIDES.get((difficulty or "").lower(), DIFFICULTY_GUIDES["середній"])
+        
+        completion_params = {
+            "model": RECIPE_MODEL,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": RECIPE_SYSTEM_PROMPT,
+                },
+                {
+                    "role": "user",
+                    "content": f"Інгредієнти: {', '.join(map(str, ingredients))}.\n"
+                               f"Складність рецепту - {difficulty}: {diff_guide}.",
+                },
+            ],
+            "response_format": {"type": "json_object"}  
+        }
+        
+        return completion_params
+    
+    def _lookup(self, key: str, ingredients: List[Union[str, Ingredient]], difficulty: str) -> Optional[Dict[str, Any]]:
+        """
+        Find a recipe that does not need an OpenAI call, in the cache first and then in the recipe store.
+        
+        Returns:
+            Recipe data, or None if a new recipe has to be generated
+        """
+        if self.cache is not None:
+            cached, refresh = self.cache.lookup(key)
+            metrics.record_cache("recipe", cached is not None)
+            if cached is not None:
+                logger.info("Recipe cache hit")
+                return cached
+            if refresh:
+                # A new variant is due; the store would answer with one it learned from the cache's variants
+                return None
+        if self.store is not None:
+            with metrics.stage("recipe_store_lookup"):
+                stored = self.store.find(ingredients, difficulty)
+            metrics.record_cache("recipe_store", stored is not None)
+            if stored is not None:
+                logger.info("Recipe store hit")
+                return stored
+        return None
+    
+    def _remember(self, key: str, difficulty: str, recipe_data: Dict[str, Any]) -> None:
+        if "compatible" not in recipe_data:
+            return
+        if self.cache is not None:
+            self.cache.put(key, recipe_data)
+        if self.store is not None:
+            self.store.add_result(recipe_data, difficulty)
+    
+    async def generate_recipes(self, ingredients: List[Union[str, Ingredient]], difficulty: str = None) -> Dict[str, Any]:
+        """
+        Generate recipes based on the provided ingredients.
+        
+        Args:
+            ingredients: List of ingredients to use in recipes (strings or parsed Ingredient items)
+            difficulty: Optional difficulty level (легкий, середній, складний)
             
-            model = "o4-mini"
+        Returns:
+            Dictionary containing recipe data
+        """
+        key = canonical_key(ingredients, difficulty)
+        known = self._lookup(key, ingredients, difficulty)
+        if known is not None:
+            return known
+        
+        # Concurrent requests for the same ingredient set and difficulty share a single o4-mini call
+        recipe_data = await self._flight.do(key, lambda: self._generate(ingredients, difficulty, key))
+        return copy.deepcopy(recipe_data)
+    
+    async def _generate(self, ingredients: List[Union[str, Ingredient]], difficulty: str, key: str) -> Dict[str, Any]:
+        try:
+            completion_params = self._build_completion_params(ingredients, difficulty)
             
-            completion_params = {
-                "model": model,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    },
-                ],
-                "response_format": {"type": "json_object"}  
-            }
+            if metrics.enabled():
+                metrics.record_bytes("openai_request", _request_bytes(completion_params))
             
-            completion = self.client.chat.completions.create(**completion_params)
+            async with self.scheduler.slot(_estimate_tokens(completion_params)) as ticket, metrics.stage("openai_call"):
+                completion = await self.resilience.call(
+                    lambda: ticket.run(lambda: self.client.chat.completions.create(**completion_params))
+                )
+                ticket.used_tokens = getattr(getattr(completion, "usage", None), "total_tokens", None)
             
             text = completion.choices[0].message.content.strip()
             
+            if metrics.enabled():
+                metrics.record_bytes("openai_response", len(text.encode("utf-8")))
+                self._record_usage(getattr(completion, "usage", None))
+            
             try:
                 recipe_data = json.loads(text)
+                self._remember(key, difficulty, recipe_data)
                 return recipe_data
             except json.JSONDecodeError as e:
                 logger.error(f"Error parsing recipe JSON: {e}")
@@ -124,4 +299,86 @@ class RecipeGenerator:
             return {
                 "message": f"На жаль, не вдалося створити рецепт з цих інгредієнтів: {str(e)}", 
                 "recipes": []
-            }
\ No newline at end of file
+            }
+    
+    async def stream_recipes(self, ingredients: List[Union[str, Ingredient]], difficulty: str = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Generate recipes and yield partially parsed recipe data while the model is still writing it.
+        
+        Args:
+            ingredients: List of ingredients to use in recipes (strings or parsed Ingredient items)
+            difficulty: Optional difficulty level (легкий, середній, складний)
+            
+        Yields:
+            Snapshots of the recipe data dictionary; the last one is complete
+        """
+        key = canonical_key(ingredients, difficulty)
+        known = self._lookup(key, ingredients, difficulty)
+        if known is not None:
+            yield known
+            return
+        
+        # Identical concurrent requests subscribe to the same stream; a subscriber
+        # that disconnects does not stop generation for the others
+        async for snapshot in self._flight.stream(key, lambda: self._stream(ingredients, difficulty, key)):
+            yield snapshot
+    
+    async def _stream(self, ingredients: List[Union[str, Ingredient]], difficulty: str, key: str) -> AsyncIterator[Dict[str, Any]]:
+        try:
+            completion_params = self._build_completion_params(ingredients, difficulty)
+            parser = IncrementalJSONParser()
+            last_snapshot = None
+            
+            if metrics.enabled():
+                metrics.record_bytes("openai_request", _request_bytes(completion_params))
+            started = time.perf_counter()
+            
+            async with self.scheduler.slot(_estimate_tokens(completion_params)) as ticket, metrics.stage("openai_call"):
+                # Retries and hedging cover opening the stream; once content flows, a stalled
+                # stream fails after the per-call timeout instead of holding the user
+                stream = await self.resilience.call(
+                    lambda: ticket.run(lambda: self.client.chat.completions.create(
+                        **completion_params, stream=True, stream_options={"include_usage": True}
+                    )),
+                    discard=_close_stream
+                )
+                # A stalled or failed stream is closed so its connection returns to the pool
+                try:
+                    async for chunk in iterate_with_timeout(stream, self.resilience.policy.timeout):
+                        if getattr(chunk, "usage", None) is not None:
+                            ticket.used_tokens = getattr(chunk.usage, "total_tokens", None)
+                            self._record_usage(chunk.usage)
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if not delta:
+                            continue
+                        if not parser.text:
+                            metrics.record_duration("openai_first_token", time.perf_counter() - started)
+                        parser.feed(delta)
+                        snapshot = parser.snapshot()
+                        if isinstance(snapshot, dict) and snapshot != last_snapshot:
+                            last_snapshot = snapshot
+                            yield snapshot
+                finally:
+                    await _close_stream(stream)
+            
+            metrics.record_bytes("openai_response", len(parser.text.encode("utf-8")))
+            
+            try:
+                recipe_data = json.loads(parser.text.strip())
+            except json.JSONDecodeError as e:
+                logger.error(f"Error parsing recipe JSON: {e}")
+                yield {
+                    "message": f"На жаль, не вдалося створити рецепт з цих інгредієнтів: {str(e)}",
+                    "recipes": []
+                }
+                return
+            
+            self._remember(key, difficulty, recipe_data)
+            yield recipe_data
+                
+        except Exception as e:
+            logger.error(f"Error generating recipes: {str(e)}")
+            yield {
+                "message": f"На жаль, не вдалося створити рецепт з цих інгредієнтів: {str(e)}", 
+                "recipes": []
+            }
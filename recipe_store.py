@@ -0,0 +1,245 @@
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple, Union
+import copy
+import json
+import logging
+import math
+import threading
+
+from ingredient_normalization import Ingredient, ingredient_key, parse_ingredient
+
+logger = logging.getLogger(__name__)
+
+# Basic products the recipe prompt allows without them being recognized
+STAPLES = frozenset(ingredient_key(name) for name in ("сіль", "перець", "цукор", "олія", "вода"))
+
+DIFFICULTY_LEVELS = ("легкий", "середній", "складний")
+
+@dataclass
+class RecipeStoreStats:
+    hits: int = 0
+    misses: int = 0
+    learned: int = 0
+
+    def as_dict(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "learned": self.learned,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+@dataclass
+class _StoredRecipe:
+    recipe: Dict[str, Any]
+    keys: FrozenSet[str]
+    difficulty: str
+
+def _recipe_keys(recipe: Dict[str, Any]) -> FrozenSet[str]:
+    keys = (ingredient_key(item) for item in recipe.get("ingredients") or [] if isinstance(item, str))
+    return frozenset(key for key in keys if key and key not in STAPLES)
+
+def _difficulty_factor(recipe_difficulty: str, difficulty: Optional[str]) -> float:
+    if not difficulty or recipe_difficulty == difficulty:
+        return 1.0
+    if recipe_difficulty in DIFFICULTY_LEVELS and difficulty in DIFFICULTY_LEVELS:
+        distance = abs(DIFFICULTY_LEVELS.index(recipe_difficulty) - DIFFICULTY_LEVELS.index(difficulty))
+        return 0.5 if distance == 1 else 0.0
+    return 0.0
+
+class RecipeStore:
+    def __init__(self, threshold: float = 0.9, coverage_weight: float = 0.8, learn: bool = True,
+                 persist_path: Optional[str] = None):
+        """
+        Initialize an in-memory store of known recipes with an inverted ingredient index.
+
+        A recipe scores (coverage_weight * coverage + (1 - coverage_weight) * usage) * difficulty_factor,
+        where coverage is the share of the recipe's ingredients (staples excluded) the user has,
+        usage is the share of the user's ingredients the recipe uses, and difficulty_factor is 1
+        for the requested difficulty, 0.5 for a neighbouring one and 0 otherwise.
+
+        Args:
+            threshold: Minimum score of a recipe to be served instead of generating one
+            coverage_weight: Weight of coverage against usage in the score
+            learn: Whether recipes produced by RecipeGenerator are added to the store
+            persist_path: JSON Lines file that learned recipes are appended to (optional)
+        """
+        self.threshold = threshold
+        self.coverage_weight = coverage_weight
+        self.learn = learn
+        self.persist_path = persist_path
+        # Lowest coverage that can still reach the threshold (usage and difficulty at their best)
+        self.min_coverage = min(1.0, max(0.0, (threshold - (1 - coverage_weight)) / coverage_weight))
+        self.stats = RecipeStoreStats()
+        self._recipes: List[_StoredRecipe] = []
+        # (difficulty, ingredient key) -> ids of recipes anchored on that ingredient
+        self._index: Dict[Tuple[str, str], List[int]] = {}
+        self._frequency: Counter = Counter()
+        self._seen = set()
+        self._difficulties = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._recipes)
+
+    def _prefix_length(self, size: int) -> int:
+        # A recipe with at least `required` of its `size` ingredients present shares at least one
+        # of any `size - required + 1` of them with the query, so only those need to be indexed
+        required = max(1, math.ceil(self.min_coverage * size - 1e-9))
+        return size - required + 1
+
+    def _add(self, recipe: Dict[str, Any], difficulty: Optional[str]) -> bool:
+        keys = _recipe_keys(recipe)
+        if not keys or not recipe.get("name"):
+            return False
+        difficulty = (difficulty or "").lower()
+        identity = (recipe["name"].strip().lower(), difficulty, keys)
+        if identity in self._seen:
+            return False
+        self._seen.add(identity)
+
+        recipe_id = len(self._recipes)
+        self._difficulties.add(difficulty)
+        self._recipes.append(_StoredRecipe(recipe, keys, difficulty))
+        # Rarest ingredients first keeps the posting lists that lookups scan short
+        anchors = sorted(keys, key=lambda key: (self._frequency[key], key))[:self._prefix_length(len(keys))]
+        for key in anchors:
+            self._index.setdefault((difficulty, key), []).append(recipe_id)
+        return True
+
+    def add(self, recipe: Dict[str, Any], difficulty: Optional[str] = None) -> bool:
+        """
+        Add a single recipe in the format of RecipeGenerator's "recipes" items.
+
+        Args:
+            recipe: Recipe dictionary with at least "name" and "ingredients"
+            difficulty: Difficulty used when the recipe does not state one (optional)
+
+        Returns:
+            True if the recipe was added, False if it is a duplicate or has no usable ingredients
+        """
+        with self._lock:
+            self._frequency.update(_recipe_keys(recipe))
+            return self._add(recipe, recipe.get("difficulty") or difficulty)
+
+    def add_many(self, recipes: Iterable[Dict[str, Any]]) -> int:
+        """
+        Bulk-add recipes, choosing index anchors from the ingredient frequencies of the whole batch.
+
+        Args:
+            recipes: Recipe dictionaries
+
+        Returns:
+            Number of recipes added
+        """
+        recipes = [recipe for recipe in recipes if isinstance(recipe, dict)]
+        with self._lock:
+            for recipe in recipes:
+                self._frequency.update(_recipe_keys(recipe))
+            return sum(self._add(recipe, recipe.get("difficulty")) for recipe in recipes)
+
+    def load(self, path: str) -> int:
+        """
+        Load curated recipes from a JSON file (a list, or an object with a "recipes" list)
+        or a JSON Lines file with one recipe per line.
+
+        Args:
+            path: Path to the file
+
+        Returns:
+            Number of recipes added
+        """
+        with open(path, encoding="utf-8") as f:
+            if path.endswith(".json"):
+                data = json.load(f)
+                recipes = data.get("recipes", []) if isinstance(data, dict) else data
+            else:
+                recipes = [json.loads(line) for line in f if line.strip()]
+        added = self.add_many(recipes)
+        logger.info(f"Loaded {added} recipes into the recipe store from {path}")
+        return added
+
+    def add_result(self, recipe_data: Dict[str, Any], difficulty: Optional[str] = None) -> int:
+        """
+        Learn the recipes of a RecipeGenerator result.
+
+        Args:
+            recipe_data: Dictionary returned by RecipeGenerator
+            difficulty: Requested difficulty level
+
+        Returns:
+            Number of recipes added
+        """
+        if not self.learn or not recipe_data.get("compatible"):
+            return 0
+        added = []
+        for recipe in recipe_data.get("recipes") or []:
+            # Indexed under the requested level: the model's own "difficulty" is free text
+            # that may not match any level lookups use
+            if not isinstance(recipe, dict):
+                continue
+            stored = {**recipe, "difficulty": difficulty or recipe.get("difficulty")}
+            if self.add(stored):
+                added.append(stored)
+        if added and self.persist_path:
+            try:
+                with open(self.persist_path, "a", encoding="utf-8") as f:
+                    for recipe in added:
+                        f.write(json.dumps(recipe, ensure_ascii=False) + "\n")
+            except OSError as e:
+                logger.warning(f"Could not persist learned recipes: {str(e)}")
+        self.stats.learned += len(added)
+        return len(added)
+
+    def find(self, ingredients: Iterable[Union[str, Ingredient]], difficulty: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Find the best known recipe for the ingredients.
+
+        Args:
+            ingredients: Recognized ingredients
+            difficulty: Difficulty level (легкий, середній, складний)
+
+        Returns:
+            Recipe data in the RecipeGenerator format, or None if no recipe reaches the threshold
+        """
+        names = {}
+        for item in ingredients:
+            ingredient = item if isinstance(item, Ingredient) else parse_ingredient(item)
+            if ingredient is not None and ingredient.key not in names:
+                names[ingredient.key] = ingredient.name
+        query = frozenset(names) - STAPLES
+        difficulty = (difficulty or "").lower()
+
+        best, best_score = None, 0.0
+        if query:
+            # Difficulties whose factor alone keeps a recipe below the threshold are not scanned
+            difficulties = [level for level in self._difficulties if _difficulty_factor(level, difficulty) >= self.threshold]
+            usage_weight = (1 - self.coverage_weight) / len(query)
+            with self._lock:
+                for level in difficulties:
+                    factor = _difficulty_factor(level, difficulty)
+                    candidates = set()
+                    for key in query:
+                        postings = self._index.get((level, key))
+                        if postings:
+                            candidates.update(postings)
+                    for recipe_id in candidates:
+                        stored = self._recipes[recipe_id]
+                        matched = len(stored.keys & query)
+                        coverage = matched / len(stored.keys)
+                        if coverage < self.min_coverage:
+                            continue
+                        score = (self.coverage_weight * coverage + usage_weight * matched) * factor
+                        if score > best_score:
+                            best, best_score = stored, score
+
+        if best is None or best_score < self.threshold:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+
+        recipe = copy.deepcopy(best.recipe)
+        recipe["unused_ingredients"] = [name for key, name in names.items() if key not in best.keys and key not in STAPLES]
+        return {"compatible": True, "recipes": [recipe]}
@@ -0,0 +1,271 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+import hashlib
+import io
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# A 64-bit perceptual hash is split into this many 16-bit bands. By the
+# pigeonhole principle two hashes within distance < PHASH_BANDS share at
+# least one identical band, so the on-disk tier only needs indexed lookups.
+PHASH_BANDS = 4
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    near_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.near_hits + self.disk_hits + self.misses
+        return (total - self.misses) / total if total else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+        }
+
+def image_digest(image_bytes: bytes) -> str:
+    """
+    Compute the exact content hash of an image.
+
+    Args:
+        image_bytes: Raw image data
+
+    Returns:
+        Hex-encoded SHA-256 digest
+    """
+    return hashlib.sha256(image_bytes).hexdigest()
+
+def perceptual_hash(image_bytes: bytes) -> Optional[int]:
+    """
+    Compute a 64-bit difference hash (dHash) that is stable across re-encoding and small resizes.
+
+    Args:
+        image_bytes: Raw image data
+
+    Returns:
+        Hash as an integer, or None if the image cannot be decoded
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            # Draft mode lets the JPEG decoder skip most of the pixels
+            img.draft("L", (64, 64))
+            pixels = list(img.convert("L").resize((9, 8), Image.BILINEAR).getdata())
+    except Exception as e:
+        logger.warning(f"Could not compute perceptual hash: {str(e)}")
+        return None
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+def _bands(phash: int) -> List[int]:
+    return [(phash >> (16 * i)) & 0xFFFF for i in range(PHASH_BANDS)]
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+class RecognitionCache:
+    def __init__(self, max_entries: int = 256, ttl: float = 3600, db_path: Optional[str] = None,
+                 perceptual: bool = False, max_distance: int = 3, max_disk_entries: int = 100000):
+        """
+        Initialize a content-addressed cache for ingredient recognition results.
+
+        Args:
+            max_entries: Maximum number of entries kept in the in-memory LRU tier
+            ttl: Time to live of an entry in seconds (0 disables expiry)
+            db_path: Path to an SQLite database for the persistent tier (optional)
+            perceptual: Whether to match near-duplicate images by perceptual hash
+            max_distance: Maximum Hamming distance between perceptual hashes of near-duplicates
+            max_disk_entries: Maximum number of entries kept in the persistent tier
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.perceptual = perceptual
+        self.max_distance = min(max_distance, PHASH_BANDS - 1)
+        self.max_disk_entries = max_disk_entries
+        self.stats = CacheStats()
+
+        # digest -> (created_at, phash, ingredients)
+        self._memory: "OrderedDict[str, Tuple[float, Optional[int], List[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = self._open_db(db_path) if db_path else None
+
+    def _open_db(self, db_path: str) -> sqlite3.Connection:
+        db = sqlite3.connect(db_path, timeout=5, check_same_thread=False, isolation_level=None)
+        # WAL lets several worker processes read while one of them writes
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS recognition_cache ("
+            "digest TEXT PRIMARY KEY, created_at REAL NOT NULL, phash INTEGER, "
+            "b0 INTEGER, b1 INTEGER, b2 INTEGER, b3 INTEGER, ingredients TEXT NOT NULL)"
+        )
+        for i in range(PHASH_BANDS):
+            db.execute(f"CREATE INDEX IF NOT EXISTS recognition_cache_b{i} ON recognition_cache (b{i})")
+        db.execute("CREATE INDEX IF NOT EXISTS recognition_cache_created ON recognition_cache (created_at)")
+        return db
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return bool(self.ttl) and now - created_at > self.ttl
+
+    def get(self, image_bytes: bytes) -> Optional[List[str]]:
+        """
+        Look up a cached recognition result for an image.
+
+        Args:
+            image_bytes: Raw image data
+
+        Returns:
+            Cached list of ingredients, or None on a miss
+        """
+        digest = image_digest(image_bytes)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(digest)
+            if entry is not None:
+                if not self._expired(entry[0], now):
+                    self._memory.move_to_end(digest)
+                    self.stats.hits += 1
+                    return list(entry[2])
+                del self._memory[digest]
+
+        if self._db is not None:
+            ingredients = self._db_get_exact(digest, now)
+            if ingredients is not None:
+                self._remember(digest, now, None, ingredients)
+                with self._lock:
+                    self.stats.disk_hits += 1
+                return list(ingredients)
+
+        if self.perceptual:
+            phash = perceptual_hash(image_bytes)
+            if phash is not None:
+                ingredients = self._near_lookup(phash, now)
+                if ingredients is not None:
+                    self._remember(digest, now, phash, ingredients)
+                    with self._lock:
+                        self.stats.near_hits += 1
+                    return list(ingredients)
+
+        with self._lock:
+            self.stats.misses += 1
+        return None
+
+    def put(self, image_bytes: bytes, ingredients: List[str]) -> None:
+        """
+        Store a recognition result for an image.
+
+        Args:
+            image_bytes: Raw image data
+            ingredients: Recognized ingredients
+        """
+        digest = image_digest(image_bytes)
+        now = time.time()
+        phash = perceptual_hash(image_bytes) if self.perceptual else None
+        self._remember(digest, now, phash, list(ingredients))
+
+        if self._db is not None:
+            try:
+                bands = _bands(phash) if phash is not None else [None] * PHASH_BANDS
+                with self._lock:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO recognition_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (digest, now, _to_signed(phash) if phash is not None else None, *bands,
+                         json.dumps(ingredients, ensure_ascii=False))
+                    )
+                    self._prune_db(now)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not write recognition cache entry: {str(e)}")
+
+    def _remember(self, digest: str, now: float, phash: Optional[int], ingredients: List[str]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._memory[digest] = (now, phash, ingredients)
+            self._memory.move_to_end(digest)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _db_get_exact(self, digest: str, now: float) -> Optional[List[str]]:
+        try:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT created_at, ingredients FROM recognition_cache WHERE digest = ?", (digest,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read recognition cache: {str(e)}")
+            return None
+        if row is None or self._expired(row[0], now):
+            return None
+        return json.loads(row[1])
+
+    def _near_lookup(self, phash: int, now: float) -> Optional[List[str]]:
+        with self._lock:
+            for created_at, candidate, ingredients in reversed(self._memory.values()):
+                if candidate is not None and not self._expired(created_at, now) \
+                        and bin(candidate ^ phash).count("1") <= self.max_distance:
+                    return ingredients
+
+        if self._db is None:
+            return None
+
+        bands = _bands(phash)
+        where = " OR ".join(f"b{i} = ?" for i in range(PHASH_BANDS))
+        try:
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT created_at, phash, ingredients FROM recognition_cache WHERE {where}", bands
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read recognition cache: {str(e)}")
+            return None
+
+        best = None
+        for created_at, candidate, ingredients in rows:
+            if self._expired(created_at, now):
+                continue
+            distance = bin(_to_unsigned(candidate) ^ phash).count("1")
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, ingredients)
+        return json.loads(best[1]) if best else None
+
+    def _prune_db(self, now: float) -> None:
+        if self.ttl:
+            self._db.execute("DELETE FROM recognition_cache WHERE created_at < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM recognition_cache WHERE digest IN ("
+            "SELECT digest FROM recognition_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,)
+        )
+
+    def clear(self) -> None:
+        """Remove all entries from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM recognition_cache")
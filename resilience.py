@@ -0,0 +1,341 @@
+"""
+Deadlines, retries, hedged requests and circuit breaking for provider calls.
+
+Each provider gets a ResilientCaller configured by a ResiliencePolicy
+(see ResiliencePolicy.from_env for the environment variables).
+"""
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+import asyncio
+import logging
+import os
+import random
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while its circuit breaker is open."""
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Decide whether a failed provider call may succeed if repeated.
+
+    Timeouts, connection errors, rate limits and 5xx responses are retryable;
+    other client errors (bad request, authentication...) are not.
+
+    Args:
+        error: Exception raised by the provider SDK
+
+    Returns:
+        True if the call should be retried
+    """
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    # openai exposes status_code, google.api_core exceptions expose code
+    status = getattr(error, "status_code", None)
+    if not isinstance(status, int):
+        status = getattr(error, "code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS_CODES
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name or "Unavailable" in name
+
+@dataclass
+class ResiliencePolicy:
+    timeout: float = 60.0
+    deadline: float = 180.0
+    max_attempts: int = 3
+    backoff: float = 0.5
+    max_backoff: float = 8.0
+    hedge: bool = False
+    hedge_quantile: float = 0.95
+    hedge_min_delay: float = 1.0
+    failure_threshold: int = 5
+    reset_timeout: float = 30.0
+
+    @classmethod
+    def from_env(cls, prefix: str, **defaults: Any) -> "ResiliencePolicy":
+        """
+        Build a policy from environment variables, e.g. for prefix "GEMINI":
+        GEMINI_TIMEOUT, GEMINI_DEADLINE, GEMINI_MAX_ATTEMPTS, GEMINI_RETRY_BACKOFF,
+        GEMINI_HEDGE, GEMINI_HEDGE_QUANTILE, GEMINI_CIRCUIT_THRESHOLD, GEMINI_CIRCUIT_RESET.
+
+        Args:
+            prefix: Environment variable prefix
+            defaults: Field values used when a variable is not set
+
+        Returns:
+            Policy instance
+        """
+        policy = cls(**defaults)
+
+        def read(name: str, current: Any, cast: Callable[[str], Any]) -> Any:
+            value = os.getenv(f"{prefix}_{name}")
+            return cast(value) if value not in (None, "") else current
+
+        policy.timeout = read("TIMEOUT", policy.timeout, float)
+        policy.deadline = read("DEADLINE", policy.deadline, float)
+        policy.max_attempts = max(1, read("MAX_ATTEMPTS", policy.max_attempts, int))
+        policy.backoff = read("RETRY_BACKOFF", policy.backoff, float)
+        policy.hedge = read("HEDGE", policy.hedge, lambda value: value == "1")
+        policy.hedge_quantile = read("HEDGE_QUANTILE", policy.hedge_quantile, float)
+        policy.failure_threshold = read("CIRCUIT_THRESHOLD", policy.failure_threshold, int)
+        policy.reset_timeout = read("CIRCUIT_RESET", policy.reset_timeout, float)
+        return policy
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Initialize a breaker that opens after consecutive failures.
+
+        While open, calls fail immediately. After reset_timeout a single probe call
+        is let through: success closes the breaker, failure opens it again.
+
+        Args:
+            failure_threshold: Consecutive failures that open the breaker (0 disables it)
+            reset_timeout: Seconds the breaker stays open before a probe is allowed
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """
+        Check whether a call may be made now.
+
+        Returns:
+            False while the breaker is open or a half-open probe is already running
+        """
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> bool:
+        """
+        Count a failed call.
+
+        Returns:
+            True if this failure opened the breaker
+        """
+        self.failures += 1
+        was_open = self.opened_at is not None
+        if self._probing or (self.failure_threshold and self.failures >= self.failure_threshold):
+            self.opened_at = time.monotonic()
+            self._probing = False
+            return not was_open
+        return False
+
+class LatencyTracker:
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        """
+        Keep recent call durations to estimate latency quantiles.
+
+        Args:
+            window: Number of recent samples kept
+            min_samples: Samples required before quantile() returns an estimate
+        """
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class ResilientCaller:
+    def __init__(self, provider: str, policy: Optional[ResiliencePolicy] = None):
+        """
+        Initialize the resilience layer for one provider.
+
+        Args:
+            provider: Provider name used in logs and metrics, e.g. "gemini"
+            policy: Timeouts, retry, hedging and circuit breaker settings
+        """
+        self.provider = provider
+        self.policy = policy or ResiliencePolicy()
+        self.breaker = CircuitBreaker(self.policy.failure_threshold, self.policy.reset_timeout)
+        self.latency = LatencyTracker()
+        self.calls = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedges_won = 0
+        self.rejected = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedges_won": self.hedges_won,
+            "rejected": self.rejected,
+            "circuit": self.breaker.state,
+        }
+
+    def _event(self, event: str) -> None:
+        metrics.record_resilience(self.provider, event)
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.policy.hedge:
+            return None
+        estimate = self.latency.quantile(self.policy.hedge_quantile)
+        return max(self.policy.hedge_min_delay, estimate) if estimate is not None else None
+
+    async def call(self, fn: Callable[[], Awaitable[T]],
+                   discard: Optional[Callable[[T], Awaitable[Any]]] = None) -> T:
+        """
+        Call the provider with a per-attempt timeout, retries, optional hedging and circuit breaking.
+
+        Args:
+            fn: Function starting one provider call
+            discard: Coroutine function releasing the result of a losing hedged call (optional)
+
+        Returns:
+            Result of the first successful call
+
+        Raises:
+            CircuitOpenError: The provider is considered down
+            Exception: The last error once attempts or the deadline are exhausted
+        """
+        policy = self.policy
+        self.calls += 1
+        deadline = time.monotonic() + policy.deadline
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.rejected += 1
+                self._event("rejected")
+                raise CircuitOpenError(f"{self.provider} is temporarily unavailable")
+
+            attempt += 1
+            started = time.monotonic()
+            timeout = min(policy.timeout, deadline - started)
+            try:
+                result = await asyncio.wait_for(self._hedged(fn, discard), timeout)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.timeouts += 1
+                    self._event("timeout")
+                    e = asyncio.TimeoutError(f"{self.provider} call timed out after {timeout:.1f}s")
+                retryable = is_retryable(e)
+                if retryable and self.breaker.record_failure():
+                    self._event("circuit_open")
+                    logger.warning(f"Circuit breaker for {self.provider} opened after {self.breaker.failures} failures")
+                elif not retryable:
+                    # The provider answered, so it is up even though the request was rejected
+                    self.breaker.record_success()
+
+                delay = random.uniform(0, min(policy.max_backoff, policy.backoff * 2 ** (attempt - 1)))
+                if not retryable or attempt >= policy.max_attempts or time.monotonic() + delay >= deadline:
+                    raise e
+                self.retries += 1
+                self._event("retry")
+                logger.warning(f"{self.provider} call failed (attempt {attempt}), retrying in {delay:.2f}s: {str(e)}")
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            self.latency.observe(time.monotonic() - started)
+            return result
+
+    async def _hedged(self, fn: Callable[[], Awaitable[T]],
+                      discard: Optional[Callable[[T], Awaitable[Any]]]) -> T:
+        delay = self._hedge_delay()
+        if delay is None:
+            return await fn()
+
+        primary = asyncio.ensure_future(fn())
+        tasks = [primary]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                # The call is slower than usual: race a duplicate against it
+                self.hedges += 1
+                self._event("hedge")
+                tasks.append(asyncio.ensure_future(fn()))
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        if task is not primary:
+                            self.hedges_won += 1
+                            self._event("hedge_won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            if len(tasks) > 1:
+                asyncio.ensure_future(self._discard_losers(tasks, winner, discard))
+
+    @staticmethod
+    async def _discard_losers(tasks, winner, discard) -> None:
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if discard is None:
+            return
+        # Release results of calls that also succeeded but were not returned to the caller
+        for task in tasks:
+            if task is winner or task.cancelled() or task.exception() is not None:
+                continue
+            try:
+                await discard(task.result())
+            except Exception as e:
+                logger.debug(f"Could not release a hedged {task!r}: {str(e)}")
+
+async def iterate_with_timeout(iterable: Any, timeout: float):
+    """
+    Iterate over an async iterable, failing if the next item takes longer than timeout.
+
+    Args:
+        iterable: Async iterable, e.g. a streamed completion
+        timeout: Maximum wait for each item in seconds
+
+    Yields:
+        Items of the iterable
+    """
+    iterator = iterable.__aiter__()
+    while True:
+        try:
+            item = await asyncio.wait_for(iterator.__anext__(), timeout)
+        except StopAsyncIteration:
+            return
+        yield item
@@ -0,0 +1,472 @@
+"""
+Quota-aware scheduling of provider calls.
+
+Each model gets a ModelScheduler (see model_scheduler) that admits a call once a
+concurrency slot is free and its request and token buckets, refilled from the
+per-minute quotas, hold enough for the call's estimated cost. Waiting callers are
+served by priority (interactive before background) and in arrival order within a
+priority. A 429 response pauses the model for the provider's Retry-After and
+lowers the admitted rate until calls succeed again.
+
+Quotas are read from <PREFIX>_RPM and <PREFIX>_TPM, e.g. GEMINI_RPM and GEMINI_TPM
+(0 or unset means no limit; 429 responses are still honoured).
+"""
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, TypeVar
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import os
+import time
+import weakref
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Tokens Gemini bills per 768x768 image tile (and for an image that fits in 384x384)
+IMAGE_TILE_TOKENS = 258
+IMAGE_TILE_SIZE = 768
+
+# Each 429 cuts the admitted rate by this factor, each successful call restores a step of it
+RATE_DECREASE = 0.75
+RATE_RECOVERY = 0.02
+MIN_RATE_FACTOR = 0.25
+MAX_PAUSE = 60.0
+
+class PriorityLevel:
+    def __init__(self, level: int):
+        """
+        Priority shared by a block of code and every task started from it.
+
+        Tasks copy the context they are created in, so a call made in a task that
+        was started from the block (e.g. the shared call of a SingleFlight) sees the
+        same object, and promote() reaches it even while it is queued.
+
+        Args:
+            level: INTERACTIVE or BACKGROUND
+        """
+        self.level = level
+        self._schedulers: "weakref.WeakSet[ModelScheduler]" = weakref.WeakSet()
+
+    def promote(self, level: int = INTERACTIVE) -> None:
+        """
+        Raise the priority, including for calls already waiting in a scheduler,
+        e.g. once a user is waiting for background work.
+
+        Args:
+            level: New priority
+        """
+        if level >= self.level:
+            return
+        self.level = level
+        for scheduler in list(self._schedulers):
+            scheduler._reprioritize()
+
+_priority: ContextVar[PriorityLevel] = ContextVar("scheduler_priority", default=PriorityLevel(INTERACTIVE))
+
+@contextmanager
+def priority(level: int) -> Iterator[PriorityLevel]:
+    """
+    Run provider calls made within the block (and tasks started from it) at the given priority.
+
+    Args:
+        level: INTERACTIVE or BACKGROUND
+
+    Yields:
+        The priority level, which can be promoted later
+    """
+    shared = PriorityLevel(level)
+    token = _priority.set(shared)
+    try:
+        yield shared
+    finally:
+        _priority.reset(token)
+
+def current_priority() -> int:
+    return _priority.get().level
+
+def estimate_text_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens of a text without a tokenizer.
+
+    Ukrainian text takes about three characters per token with both providers'
+    tokenizers; English takes about four, so the estimate errs on the high side.
+    """
+    return len(text) // 3 + 1
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """
+    Estimate the number of prompt tokens of an image sent to Gemini.
+
+    Args:
+        width: Image width in pixels
+        height: Image height in pixels
+
+    Returns:
+        258 tokens for a small image, otherwise 258 per 768x768 tile
+    """
+    if width <= IMAGE_TILE_SIZE // 2 and height <= IMAGE_TILE_SIZE // 2:
+        return IMAGE_TILE_TOKENS
+    return IMAGE_TILE_TOKENS * math.ceil(width / IMAGE_TILE_SIZE) * math.ceil(height / IMAGE_TILE_SIZE)
+
+def is_rate_limited(error: BaseException) -> bool:
+    """
+    Check whether a provider call failed because a quota was exceeded.
+
+    Args:
+        error: Exception raised by the provider SDK
+
+    Returns:
+        True for 429 responses (openai.RateLimitError, google ResourceExhausted)
+    """
+    status = getattr(error, "status_code", None)
+    if not isinstance(status, int):
+        status = getattr(error, "code", None)
+    if isinstance(status, int):
+        return status == 429
+    return type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests")
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """
+    Read how long the provider asked to wait before the next call.
+
+    Args:
+        error: Exception raised by the provider SDK
+
+    Returns:
+        Delay in seconds, or None if the provider did not say
+    """
+    # openai errors carry the HTTP response
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers is not None:
+        try:
+            value = headers.get("retry-after-ms")
+            if value:
+                return float(value) / 1000
+            value = headers.get("retry-after")
+            if value:
+                try:
+                    return float(value)
+                except ValueError:
+                    return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    # google.api_core errors carry google.rpc.RetryInfo among their details
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None and hasattr(delay, "seconds"):
+            return delay.seconds + getattr(delay, "nanos", 0) / 1e9
+    return None
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        """
+        Initialize a bucket holding up to one minute of quota, refilled continuously.
+
+        Args:
+            per_minute: Quota per minute (0 means unlimited)
+        """
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount: float, now: float, factor: float = 1.0) -> float:
+        """
+        Compute how long until the bucket holds the amount.
+
+        A request larger than the whole bucket is admitted once the bucket is full.
+
+        Args:
+            amount: Quota the call needs
+            now: Current time.monotonic()
+            factor: Share of the nominal refill rate currently admitted
+
+        Returns:
+            Seconds to wait, 0 if the amount can be taken now
+        """
+        if not self.capacity:
+            return 0.0
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate * factor)
+        self.updated = now
+        missing = min(amount, self.capacity) - self.level
+        return missing / (self.rate * factor) if missing > 0 else 0.0
+
+    def take(self, amount: float) -> None:
+        # The level may go negative when a call turns out to cost more than estimated
+        if self.capacity:
+            self.level = min(self.capacity, self.level - amount)
+
+class Ticket:
+    def __init__(self, scheduler: "ModelScheduler", tokens: int):
+        """
+        Admission of one logical provider call; released when the call is done.
+
+        Args:
+            scheduler: Scheduler that admitted the call
+            tokens: Estimated tokens charged on admission
+        """
+        self.scheduler = scheduler
+        self.estimated_tokens = tokens
+        # Set by the caller from the provider's usage report to correct the estimate
+        self.used_tokens: Optional[int] = None
+        self.attempts = 0
+        self._released = False
+
+    async def run(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Make one attempt of the call.
+
+        Repeated attempts (retries, hedged duplicates) are charged a request
+        and wait out a rate limit pause first.
+
+        Args:
+            fn: Function starting the provider call
+
+        Returns:
+            Result of the call
+        """
+        if self.attempts:
+            await self.scheduler._wait_for_attempt()
+        self.attempts += 1
+        try:
+            result = await fn()
+        except Exception as e:
+            if is_rate_limited(e):
+                self.scheduler.rate_limited(retry_after(e))
+            raise
+        self.scheduler._succeeded()
+        return result
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.scheduler._release(self.estimated_tokens, self.used_tokens)
+
+class ModelScheduler:
+    def __init__(self, model: str, provider: str, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 max_concurrency: int = 8):
+        """
+        Initialize the scheduler of one model.
+
+        Args:
+            model: Model name
+            provider: Provider name used in logs and metrics, e.g. "gemini"
+            requests_per_minute: Request quota of the model (0 means unlimited)
+            tokens_per_minute: Token quota of the model (0 means unlimited)
+            max_concurrency: Maximum number of calls in flight
+        """
+        self.model = model
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.rate_factor = 1.0
+        self.paused_until = 0.0
+        self.active = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rate_limits = 0
+        self._strikes = 0
+        self._waiters: List[list] = []
+        self._order = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def concurrency(self) -> int:
+        """Calls admitted at once, reduced while the provider is rate limiting."""
+        return max(1, int(self.max_concurrency * self.rate_factor))
+
+    def saturated(self) -> bool:
+        """
+        Check whether a new call would have to wait.
+
+        Returns:
+            True if all slots are in use, callers are queued or the model is paused
+        """
+        return self.active >= self.concurrency or bool(self._waiters) or time.monotonic() < self.paused_until
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rate_limits": self.rate_limits,
+            "rate_factor": round(self.rate_factor, 3),
+        }
+
+    def _wait_time(self, tokens: int) -> float:
+        now = time.monotonic()
+        return max(
+            self.paused_until - now,
+            self.requests.wait_time(1, now, self.rate_factor),
+            self.tokens.wait_time(tokens, now, self.rate_factor),
+        )
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._waiters:
+            _, _, tokens, future, _ = self._waiters[0]
+            if future.done():
+                # The caller gave up waiting
+                heapq.heappop(self._waiters)
+                continue
+            if self.active >= self.concurrency:
+                # A released slot dispatches again
+                return
+            wait = self._wait_time(tokens)
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.active += 1
+            self.admitted += 1
+            future.set_result(None)
+
+    async def acquire(self, tokens: int, priority: Optional[int] = None) -> Ticket:
+        """
+        Wait until the call may be sent.
+
+        Args:
+            tokens: Estimated prompt and completion tokens of the call
+            priority: INTERACTIVE or BACKGROUND (defaults to the priority of the current context)
+
+        Returns:
+            Ticket to release once the call is done
+        """
+        shared = None
+        if priority is None:
+            shared = _priority.get()
+            priority = shared.level
+            if priority > INTERACTIVE:
+                shared._schedulers.add(self)
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [priority, next(self._order), tokens, future, shared])
+        self._dispatch()
+        if not future.done():
+            self.queued += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the caller was cancelled: hand the slot back
+                self._release(tokens, 0)
+            else:
+                self._dispatch()
+            raise
+        metrics.record_duration(f"{self.provider}_queue", time.monotonic() - started)
+        return Ticket(self, tokens)
+
+    def _reprioritize(self) -> None:
+        # Called when a PriorityLevel of queued callers was promoted
+        for waiter in self._waiters:
+            if waiter[4] is not None:
+                waiter[0] = min(waiter[0], waiter[4].level)
+        heapq.heapify(self._waiters)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, tokens: int, priority: Optional[int] = None) -> AsyncIterator[Ticket]:
+        """
+        Hold admission for one logical call, including its retries and hedged duplicates.
+
+        Args:
+            tokens: Estimated prompt and completion tokens of the call
+            priority: INTERACTIVE or BACKGROUND (defaults to the priority of the current context)
+
+        Yields:
+            Ticket whose run() makes each attempt of the call
+        """
+        ticket = await self.acquire(tokens, priority)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    async def _wait_for_attempt(self) -> None:
+        while True:
+            wait = self._wait_time(0)
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        self.requests.take(1)
+
+    def _release(self, estimated: int, used: Optional[int]) -> None:
+        self.active -= 1
+        if used is not None:
+            # Charge the difference once the provider reported the actual usage
+            self.tokens.take(used - estimated)
+        self._dispatch()
+
+    def _succeeded(self) -> None:
+        self._strikes = 0
+        if self.rate_factor < 1.0:
+            self.rate_factor = min(1.0, self.rate_factor + RATE_RECOVERY)
+
+    def rate_limited(self, delay: Optional[float] = None) -> None:
+        """
+        Back off after the provider rejected a call with 429.
+
+        Args:
+            delay: Retry-After reported by the provider (exponential backoff is used if None)
+        """
+        self.rate_limits += 1
+        self._strikes += 1
+        if delay is None:
+            delay = 2.0 ** (self._strikes - 1)
+        delay = min(MAX_PAUSE, delay)
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        # The quota granted right now is below the configured one
+        self.rate_factor = max(MIN_RATE_FACTOR, self.rate_factor * RATE_DECREASE)
+        metrics.record_resilience(self.provider, "rate_limited")
+        logger.warning(f"{self.model} is rate limited, pausing calls for {delay:.1f}s "
+                       f"(admitting {self.rate_factor:.0%} of the configured rate)")
+
+_schedulers: Dict[str, ModelScheduler] = {}
+
+def model_scheduler(model: str, provider: str, max_concurrency: int = 8) -> ModelScheduler:
+    """
+    Get the scheduler shared by all callers of a model, creating it on first use.
+
+    Quotas come from the <PROVIDER>_RPM and <PROVIDER>_TPM env vars.
+
+    Args:
+        model: Model name
+        provider: Provider name, also the env var prefix in upper case
+        max_concurrency: Maximum number of calls in flight (the largest requested value is used)
+
+    Returns:
+        Scheduler instance
+    """
+    scheduler = _schedulers.get(model)
+    if scheduler is None:
+        prefix = provider.upper()
+        scheduler = _schedulers[model] = ModelScheduler(
+            model,
+            provider,
+            requests_per_minute=float(os.getenv(f"{prefix}_RPM") or 0),
+            tokens_per_minute=float(os.getenv(f"{prefix}_TPM") or 0),
+            max_concurrency=max_concurrency
+        )
+    else:
+        scheduler.max_concurrency = max(scheduler.max_concurrency, max_concurrency)
+    return scheduler
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    return {model: scheduler.stats() for model, scheduler in _schedulers.items()}
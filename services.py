@@ -0,0 +1,135 @@
+"""
+Спільні налаштування та екземпляри сервісів для Gradio-інтерфейсу (app.py) та HTTP API (api.py).
+"""
+import logging
+import os
+from dotenv import load_dotenv
+from ingredient_recognition import IngredientRecognizer
+from recognition_cache import RecognitionCache
+from recipe_generator import RecipeGenerator
+from recipe_cache import RecipeCache
+from recipe_store import RecipeStore
+from image_ingest import inspect_image
+from prescreen import ImagePrescreener, load_classifier
+from speculation import SpeculativePrecomputer
+
+logger = logging.getLogger(__name__)
+
+# Завантаження змінних середовища з .env файлу
+load_dotenv()
+
+# Перевірка наявності API ключів
+gemini_api_key = os.getenv("GEMINI_API_KEY")
+openai_api_key = os.getenv("OPENAI_API_KEY")
+
+if not gemini_api_key:
+    logger.error("GEMINI_API_KEY не знайдено в .env файлі")
+    raise ValueError("GEMINI_API_KEY не знайдено. Додайте ключ у .env файл")
+
+if not openai_api_key:
+    logger.error("OPENAI_API_KEY не знайдено в .env файлі")
+    raise ValueError("OPENAI_API_KEY не знайдено. Додайте ключ у .env файл")
+
+# Ліміти одночасних запитів до кожного провайдера
+gemini_max_concurrency = int(os.getenv("GEMINI_MAX_CONCURRENCY", 8))
+openai_max_concurrency = int(os.getenv("OPENAI_MAX_CONCURRENCY", 8))
+
+# Максимальна довжина більшої сторони зображення, що надсилається в Gemini
+max_image_edge = int(os.getenv("MAX_IMAGE_EDGE", 1536))
+jpeg_quality = int(os.getenv("JPEG_QUALITY", 90))
+
+# Максимальна кількість фото в одному запиті та скільки з них розпізнаються одночасно
+max_images_per_request = int(os.getenv("MAX_IMAGES_PER_REQUEST", 5))
+batch_concurrency = int(os.getenv("BATCH_RECOGNITION_CONCURRENCY", 4))
+
+# Потокове відображення рецепту під час генерації
+streaming_enabled = os.getenv("RECIPE_STREAMING", "1") == "1"
+
+# Фонова генерація рецептів для інших рівнів складності одразу після розпізнавання
+speculation_enabled = os.getenv("SPECULATIVE_PRECOMPUTE", "0") == "1"
+
+# Кеш результатів розпізнавання за вмістом зображення
+recognition_cache = RecognitionCache(
+    max_entries=int(os.getenv("RECOGNITION_CACHE_SIZE", 256)),
+    ttl=float(os.getenv("RECOGNITION_CACHE_TTL", 3600)),
+    db_path=os.getenv("RECOGNITION_CACHE_DB") or None,
+    perceptual=os.getenv("RECOGNITION_CACHE_PERCEPTUAL", "0") == "1"
+)
+
+# Кеш згенерованих рецептів за канонічним набором інгредієнтів та складністю
+recipe_cache = RecipeCache(
+    max_entries=int(os.getenv("RECIPE_CACHE_SIZE", 512)),
+    ttl=float(os.getenv("RECIPE_CACHE_TTL", 86400)),
+    serve_limit=int(os.getenv("RECIPE_CACHE_SERVE_LIMIT", 3)),
+    max_variants=int(os.getenv("RECIPE_CACHE_VARIANTS", 3))
+)
+
+# Локальна база відомих рецептів, які віддаються без виклику o4-mini (RECIPE_STORE=1)
+recipe_store = None
+if os.getenv("RECIPE_STORE", "0") == "1":
+    recipe_store = RecipeStore(
+        threshold=float(os.getenv("RECIPE_STORE_THRESHOLD", 0.9)),
+        learn=os.getenv("RECIPE_STORE_LEARN", "1") == "1",
+        persist_path=os.getenv("RECIPE_STORE_LEARNED_PATH") or None
+    )
+    for path in (os.getenv("RECIPE_STORE_PATH"), os.getenv("RECIPE_STORE_LEARNED_PATH")):
+        if path and os.path.exists(path):
+            recipe_store.load(path)
+
+# Ініціалізація класів для розпізнавання інгредієнтів та генерації рецептів.
+# Клієнти Gemini та OpenAI (зі спільним пулом HTTP-з'єднань) створюються під час першого запиту.
+ingredient_recognizer = IngredientRecognizer(api_key=gemini_api_key, max_concurrency=gemini_max_concurrency, cache=recognition_cache)  # Gemini для розпізнавання
+recipe_generator = RecipeGenerator(max_concurrency=openai_max_concurrency, cache=recipe_cache, store=recipe_store)  # o4-mini для генерації рецептів
+
+# Обмеження витрат на спекулятивну генерацію
+speculator = SpeculativePrecomputer(
+    recipe_generator,
+    max_calls=int(os.getenv("SPECULATIVE_MAX_CALLS", 100)),
+    window=float(os.getenv("SPECULATIVE_WINDOW", 3600)),
+    max_concurrency=int(os.getenv("SPECULATIVE_MAX_CONCURRENCY", 1))
+)
+
+# Функція для перевірки зображення (читає лише заголовок файлу, без декодування пікселів)
+def validate_image(image_path):
+    if image_path is None:
+        return False, "Будь ласка, завантажте зображення продуктів.", None
+    try:
+        info = inspect_image(image_path)
+    except Exception:
+        return False, "Зображення має бути у форматі JPEG (.jpg, .jpeg).", None
+    if info.format != "JPEG":
+        return False, "Зображення має бути у форматі JPEG (.jpg, .jpeg).", None
+    if info.file_size > 5 * 1024 * 1024:
+        return False, f"Розмір зображення ({info.file_size/1024/1024:.2f} MB) перевищує 5 MB.", None
+    width, height = info.width, info.height
+    if not ((width >= 720 and height >= 1280) or (width >= 1280 and height >= 720)):
+        return False, f"Розмір зображення ({width}x{height}) менший за 720×1280 або 1280×720.", None
+    return True, "Зображення відповідає вимогам.", info
+
+# Локальна перевірка фото (експозиція, контраст, різкість, кольоровість) до виклику Gemini:
+# reject - відхиляти, warn - лише рахувати та логувати, off - вимкнено
+prescreen_classifier = os.getenv("PRESCREEN_CLASSIFIER")
+prescreener = ImagePrescreener(
+    mode=os.getenv("PRESCREEN", "warn"),
+    min_brightness=float(os.getenv("PRESCREEN_MIN_BRIGHTNESS", 25)),
+    max_brightness=float(os.getenv("PRESCREEN_MAX_BRIGHTNESS", 235)),
+    min_contrast=float(os.getenv("PRESCREEN_MIN_CONTRAST", 8)),
+    min_sharpness=float(os.getenv("PRESCREEN_MIN_SHARPNESS", 15)),
+    min_colorfulness=float(os.getenv("PRESCREEN_MIN_COLORFULNESS", 4)),
+    classifier=load_classifier(prescreen_classifier) if prescreen_classifier else None,
+    min_food_score=float(os.getenv("PRESCREEN_MIN_FOOD_SCORE", 0.2))
+)
+
+# Функція для швидкої перевірки вмісту фото після validate_image (декодує лише зменшену копію)
+def prescreen_image(image_path):
+    if not prescreener.enabled:
+        return True, ""
+    result = prescreener.check(image_path)
+    return result.passed, result.message
+
+# Відповідність складності з інтерфейсу до складності в промпті
+difficulty_map = {
+    "Легкий": "легкий",
+    "Середній": "середній",
+    "Важкий": "складний"
+}
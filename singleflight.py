@@ -0,0 +1,143 @@
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, TypeVar
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+def _consume_exception(task: asyncio.Task) -> None:
+    # Mark the exception as retrieved even if every waiter has gone away
+    if not task.cancelled():
+        task.exception()
+
+class SharedStream:
+    """
+    Run one async iterator in a background task and replay its items to any number of subscribers.
+
+    Subscribers that stop iterating (or are cancelled) do not affect the producer
+    or the other subscribers.
+    """
+
+    def __init__(self, source: AsyncIterator[Any]):
+        self.items: List[Any] = []
+        self.done = False
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._pump(source))
+        self.task.add_done_callback(_consume_exception)
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self, source: AsyncIterator[Any]) -> None:
+        try:
+            async for item in source:
+                self.items.append(item)
+                self._notify()
+        finally:
+            self.done = True
+            self._notify()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        """
+        Iterate over all items produced so far and then over new items as they arrive.
+
+        Yields:
+            Items of the source iterator
+        """
+        index = 0
+        while True:
+            while index < len(self.items):
+                yield self.items[index]
+                index += 1
+            if self.done:
+                if not self.task.cancelled() and self.task.exception() is not None:
+                    raise self.task.exception()
+                return
+            await self._changed.wait()
+
+    async def result(self) -> Any:
+        """
+        Wait for the source to finish.
+
+        Returns:
+            Last item produced by the source, or None if it produced nothing
+        """
+        await asyncio.shield(self.task)
+        return self.items[-1] if self.items else None
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Initialize a group that coalesces concurrent calls sharing the same key into one in-flight call.
+        """
+        self._inflight: Dict[Hashable, Any] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _forget(self, key: Hashable, entry: Any) -> None:
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run fn, or wait for the identical call that is already in flight.
+
+        The shared call runs in its own task, so cancelling one waiter never cancels it for the others.
+
+        Args:
+            key: Identity of the call
+            fn: Factory of the awaitable to run when no identical call is in flight
+
+        Returns:
+            Result of the shared call
+        """
+        entry = self._inflight.get(key)
+        if isinstance(entry, SharedStream):
+            self.coalesced += 1
+            return await entry.result()
+
+        if entry is None:
+            self.leaders += 1
+            entry = asyncio.ensure_future(fn())
+            entry.add_done_callback(_consume_exception)
+            entry.add_done_callback(lambda _, key=key, entry=entry: self._forget(key, entry))
+            self._inflight[key] = entry
+        else:
+            self.coalesced += 1
+            logger.debug(f"Joining in-flight call {key}")
+
+        return await asyncio.shield(entry)
+
+    async def stream(self, key: Hashable, fn: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """
+        Iterate over fn(), or subscribe to the identical stream that is already in flight.
+
+        Args:
+            key: Identity of the call
+            fn: Factory of the async iterator to run when no identical call is in flight
+
+        Yields:
+            Items of the shared stream; if an identical non-streaming call is in flight, only its result
+        """
+        entry = self._inflight.get(key)
+        if isinstance(entry, asyncio.Future):
+            self.coalesced += 1
+            yield await asyncio.shield(entry)
+            return
+
+        if entry is None:
+            self.leaders += 1
+            entry = SharedStream(fn())
+            entry.task.add_done_callback(lambda _, key=key, entry=entry: self._forget(key, entry))
+            self._inflight[key] = entry
+        else:
+            self.coalesced += 1
+            logger.debug(f"Joining in-flight stream {key}")
+
+        async for item in entry.subscribe():
+            yield item
@@ -0,0 +1,159 @@
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+import asyncio
+import logging
+import time
+
+from recipe_cache import canonical_key
+from scheduler import BACKGROUND, PriorityLevel, priority
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class SpeculationStats:
+    started: int = 0
+    completed: int = 0
+    used: int = 0
+    failed: int = 0
+    cancelled: int = 0
+    skipped_budget: int = 0
+    deferred: int = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "started": self.started,
+            "completed": self.completed,
+            "used": self.used,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "skipped_budget": self.skipped_budget,
+            "deferred": self.deferred,
+            "use_rate": round(self.used / self.started, 4) if self.started else 0.0,
+        }
+
+class SpeculativePrecomputer:
+    def __init__(self, generator, max_calls: int = 100, window: float = 3600, max_concurrency: int = 1):
+        """
+        Initialize background precomputation of recipes for difficulty levels the user has not asked for yet.
+
+        Args:
+            generator: RecipeGenerator used for speculative calls
+            max_calls: Maximum number of speculative generation calls per window
+            window: Length of the budget window in seconds
+            max_concurrency: Maximum number of speculative calls running at once
+        """
+        self.generator = generator
+        self.max_calls = max_calls
+        self.window = window
+        self.stats = SpeculationStats()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._calls: deque = deque()
+        # Tasks past the semaphore and the saturation back-off, i.e. inside the generator, with their priority
+        self._generating: Dict[asyncio.Task, PriorityLevel] = {}
+
+    def _take_budget(self) -> bool:
+        now = time.monotonic()
+        while self._calls and now - self._calls[0] > self.window:
+            self._calls.popleft()
+        if len(self._calls) >= self.max_calls:
+            return False
+        self._calls.append(now)
+        return True
+
+    def schedule(self, session: Dict[str, Any], ingredients: List[str], difficulties: Iterable[str]) -> None:
+        """
+        Start background generation of recipes for the given difficulty levels and attach them to the session.
+
+        Args:
+            session: Per-user session state
+            ingredients: Recognized ingredients
+            difficulties: Difficulty levels to precompute
+        """
+        tasks = session.setdefault("speculative", {})
+        for difficulty in difficulties:
+            key = canonical_key(ingredients, difficulty)
+            if key in tasks:
+                continue
+            if not self._take_budget():
+                self.stats.skipped_budget += 1
+                continue
+            self.stats.started += 1
+            tasks[key] = asyncio.create_task(self._run(list(ingredients), difficulty))
+
+    async def _run(self, ingredients: List[str], difficulty: str) -> Optional[Dict[str, Any]]:
+        async with self._semaphore:
+            # Interactive requests go first: back off while the provider is saturated
+            if self.generator.saturated():
+                self.stats.deferred += 1
+                while self.generator.saturated():
+                    await asyncio.sleep(0.5)
+            task = asyncio.current_task()
+            try:
+                # Queued behind interactive calls whenever the OpenAI quota runs short
+                with priority(BACKGROUND) as level:
+                    self._generating[task] = level
+                    recipe_data = await self.generator.generate_recipes(ingredients, difficulty)
+            except asyncio.CancelledError:
+                self.stats.cancelled += 1
+                raise
+            except Exception as e:
+                self.stats.failed += 1
+                logger.warning(f"Speculative recipe generation failed: {str(e)}")
+                return None
+            finally:
+                self._generating.pop(task, None)
+        if not recipe_data.get("recipes") and "compatible" not in recipe_data:
+            self.stats.failed += 1
+            return None
+        self.stats.completed += 1
+        return recipe_data
+
+    async def take(self, session: Dict[str, Any], ingredients: List[str], difficulty: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a precomputed recipe for the session, waiting for it if it is still being generated.
+
+        Background work the user now waits for must not stay behind the background back-off:
+        a task that has not reached the generator yet is cancelled (the caller generates the
+        recipe itself), and a task already in the generator is promoted to interactive priority,
+        together with the provider call it started.
+
+        Args:
+            session: Per-user session state
+            ingredients: Recognized ingredients
+            difficulty: Requested difficulty level
+
+        Returns:
+            Recipe data dictionary, or None if nothing usable was precomputed
+        """
+        task = session.get("speculative", {}).pop(canonical_key(ingredients, difficulty), None)
+        if task is None:
+            return None
+        if not task.done():
+            level = self._generating.get(task)
+            if level is None:
+                task.cancel()
+                self.stats.cancelled += 1
+                return None
+            level.promote()
+        try:
+            # Shielded so that a user cancelling the request does not throw away the precomputed recipe
+            recipe_data = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return None
+            raise
+        if recipe_data is not None:
+            self.stats.used += 1
+        return recipe_data
+
+    def discard(self, session: Dict[str, Any]) -> None:
+        """
+        Cancel speculative work attached to the session, e.g. after new photos were uploaded.
+
+        Args:
+            session: Per-user session state
+        """
+        for task in session.pop("speculative", {}).values():
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,48 @@
+import io
+
+from PIL import Image
+
+from image_ingest import inspect_image, prepare_image_bytes
+
+def _jpeg(size, color=(200, 120, 40), exif=None):
+    buffered = io.BytesIO()
+    image = Image.new("RGB", size, color)
+    if exif is not None:
+        image.save(buffered, format="JPEG", quality=90, exif=exif)
+    else:
+        image.save(buffered, format="JPEG", quality=90)
+    return buffered.getvalue()
+
+def test_inspect_reads_the_header_and_rewinds_file_objects():
+    data = _jpeg((1280, 720))
+    source = io.BytesIO(data)
+    info = inspect_image(source)
+    assert (info.format, info.width, info.height, info.file_size) == ("JPEG", 1280, 720, len(data))
+    assert source.tell() == 0
+    assert inspect_image(data) == info
+
+def test_image_within_max_edge_is_passed_through_untouched(tmp_path):
+    data = _jpeg((1280, 720))
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(data)
+    prepared = prepare_image_bytes(str(path), max_edge=1536)
+    assert prepared.image_bytes == data
+    assert not prepared.resized
+    assert prepared.sent_size == prepared.original_size == (1280, 720)
+    assert prepared.bytes_sent == prepared.original_bytes == len(data)
+
+def test_large_image_is_downscaled_to_max_edge():
+    data = _jpeg((4000, 3000))
+    prepared = prepare_image_bytes(io.BytesIO(data), max_edge=1536)
+    assert prepared.resized
+    assert prepared.original_size == (4000, 3000)
+    assert prepared.sent_size == (1536, 1152)
+    assert prepared.original_bytes == len(data)
+    with Image.open(io.BytesIO(prepared.image_bytes)) as img:
+        assert (img.format, img.size) == ("JPEG", (1536, 1152))
+
+def test_downscaled_image_follows_exif_orientation():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Rotated 90° clockwise
+    prepared = prepare_image_bytes(_jpeg((4000, 3000), exif=exif), max_edge=1536)
+    assert prepared.sent_size == (1152, 1536)
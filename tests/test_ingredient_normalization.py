@@ -0,0 +1,53 @@
+from ingredient_normalization import (
+    Ingredient,
+    format_ingredients,
+    ingredient_key,
+    normalize_ingredients,
+    parse_ingredient,
+)
+
+def test_parse_quantity_unit_and_word_form():
+    assert parse_ingredient("5 шт яєць") == Ingredient("яйця", 5.0, "шт")
+    assert parse_ingredient("2 яйця") == Ingredient("яйця", 2.0, "шт")
+    assert parse_ingredient("0,5 кг картоплі") == Ingredient("картопля", 0.5, "кг")
+    assert parse_ingredient("твердого сиру") == Ingredient("твердий сир")
+
+def test_parse_keeps_words_that_are_not_dictionary_forms():
+    # Their stems collide with dictionary entries, but the displayed name must not change
+    assert parse_ingredient("сирий буряк").name == "сирий буряк"
+    assert parse_ingredient("зелена цибуля").name == "зелена цибуля"
+    assert parse_ingredient("зелений горошок").name == "зелений горошок"
+    assert parse_ingredient("4 шт курячі яйця") == Ingredient("курячі яйця", 4.0, "шт")
+
+def test_key_matches_inflected_forms_missing_from_the_dictionary():
+    assert ingredient_key("картоплинами") == ingredient_key("картопля")
+    assert ingredient_key("сирий буряк") != ingredient_key("буряк")
+
+def test_parse_synonyms():
+    assert parse_ingredient("творог").name == "кисломолочний сир"
+    assert parse_ingredient("вершкове масло").name == "масло"
+
+def test_parse_text_without_a_name():
+    for text in ("", " - ", "10", "200 г", "10 шт"):
+        assert parse_ingredient(text) is None
+    assert ingredient_key("10") == ""
+
+def test_merge_adds_quantities_of_the_same_product():
+    merged = normalize_ingredients(["3 шт яйця", "2 шт яєць", "Яйце"])
+    assert merged == [Ingredient("яйця", 5.0, "шт")]
+
+def test_merge_converts_compatible_units():
+    assert format_ingredients(normalize_ingredients(["1 кг картоплі", "500 г картоплі"])) == ["1500 г картопля"]
+    assert format_ingredients(normalize_ingredients(["200 мл молока", "1 л молока"])) == ["1200 мл молоко"]
+
+def test_merge_keeps_quantities_that_cannot_be_converted():
+    merged = normalize_ingredients(["1 кг картоплі", "500 г картоплі", "2 шт картопля", "1 шт картоплина"])
+    assert format_ingredients(merged) == ["1500 г картопля", "3 шт картопля"]
+
+def test_merge_keeps_products_whose_words_share_a_stem_apart():
+    merged = normalize_ingredients(["сир", "сирий буряк", "буряк", "зелень", "зелена цибуля"])
+    assert format_ingredients(merged) == ["сир", "сирий буряк", "буряк", "зелень", "зелена цибуля"]
+
+def test_merge_fills_in_a_missing_quantity_and_keeps_first_seen_order():
+    merged = normalize_ingredients(["масло", "цибуля", "100 г масла", "10"])
+    assert format_ingredients(merged) == ["100 г масло", "цибуля"]
@@ -0,0 +1,153 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from jobs import DONE, FAILED, QUEUED, RUNNING, JobStore, JobWorkerPool, is_webhook_allowed
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite"), max_attempts=2, lease=0.2)
+
+def test_claim_complete(store):
+    job_id = store.submit([b"photo 1", b"photo 2"], "Легкий")
+    assert store.get(job_id)["status"] == QUEUED
+
+    job = store.claim()
+    assert (job.id, job.difficulty, job.attempts, job.images) == (job_id, "Легкий", 1, [b"photo 1", b"photo 2"])
+    assert store.get(job_id)["status"] == RUNNING
+    assert store.claim() is None
+
+    assert store.complete(job, {"recipe": "Омлет"})
+    assert store.get(job_id)["status"] == DONE
+    assert store.get(job_id)["result"] == {"recipe": "Омлет"}
+
+def test_failed_attempt_is_retried_until_max_attempts(store):
+    job_id = store.submit([b"photo"], "Легкий")
+    job = store.claim()
+    assert store.fail(job, "timeout", retry_delay=0) == QUEUED
+    assert store.get(job_id)["status"] == QUEUED
+
+    job = store.claim()
+    assert job.attempts == 2
+    assert store.fail(job, "timeout", retry_delay=0) == FAILED
+    assert store.get(job_id)["status"] == FAILED
+    assert store.get(job_id)["error"] == "timeout"
+    assert store.claim() is None
+
+def test_expired_lease_is_redelivered_and_then_failed(store):
+    job_id = store.submit([b"photo"], "Легкий", "https://hooks.example.com/done")
+    assert store.claim().attempts == 1
+    time.sleep(0.25)
+    assert store.fail_abandoned() == []
+    assert store.claim().attempts == 2
+
+    time.sleep(0.25)
+    # The worker died on the last attempt: the job is failed instead of claimed again
+    assert store.claim() is None
+    assert store.fail_abandoned() == [(job_id, "https://hooks.example.com/done")]
+    assert store.get(job_id)["status"] == FAILED
+    assert store.fail_abandoned() == []
+
+def test_renew_keeps_the_lease_for_the_current_attempt_only(store):
+    store.submit([b"photo"], "Легкий")
+    job = store.claim()
+    time.sleep(0.15)
+    assert store.renew(job)
+    time.sleep(0.1)
+    assert store.claim() is None
+
+    time.sleep(0.15)
+    second = store.claim()
+    assert second.attempts == 2
+    assert not store.renew(job)
+    assert store.renew(second)
+
+def test_attempt_that_lost_its_lease_cannot_finish_the_job(store):
+    job_id = store.submit([b"photo"], "Легкий")
+    stale = store.claim()
+    time.sleep(0.25)
+    current = store.claim()
+
+    assert not store.complete(stale, {"recipe": "stale"})
+    assert store.fail(stale, "timeout", retry_delay=0) is None
+    assert store.get(job_id)["status"] == RUNNING
+
+    assert store.complete(current, {"recipe": "current"})
+    assert store.get(job_id)["result"] == {"recipe": "current"}
+
+def test_worker_survives_store_errors(store, monkeypatch):
+    claim = store.claim
+    failures = [sqlite3.OperationalError("database is locked")]
+
+    def flaky_claim():
+        if failures:
+            raise failures.pop()
+        return claim()
+
+    monkeypatch.setattr(store, "claim", flaky_claim)
+
+    async def main():
+        async def handler(images, difficulty):
+            return {"difficulty": difficulty}
+
+        job_id = store.submit([b"photo"], "Легкий")
+        pool = JobWorkerPool(store, handler, concurrency=1, poll_interval=0.02)
+        pool.start()
+        await asyncio.sleep(0.2)
+        await pool.stop()
+        return store.get(job_id)
+
+    assert asyncio.run(main())["status"] == DONE
+    assert failures == []
+
+def test_pool_fails_abandoned_jobs_on_the_maintenance_timer(store):
+    async def main():
+        async def handler(images, difficulty):
+            raise AssertionError("an exhausted job must not be processed again")
+
+        job_id = store.submit([b"photo"], "Легкий")
+        store.claim()
+        time.sleep(0.25)
+        store.claim()
+        time.sleep(0.25)
+        pool = JobWorkerPool(store, handler, concurrency=1, poll_interval=0.02)
+        pool.start()
+        await asyncio.sleep(0.1)
+        await pool.stop()
+        return store.get(job_id)
+
+    assert asyncio.run(main())["status"] == FAILED
+
+def test_worker_pool_renews_the_lease_of_a_slow_job(store):
+    async def main():
+        calls = 0
+
+        async def handler(images, difficulty):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.6)
+            return {"difficulty": difficulty}
+
+        job_id = store.submit([b"photo"], "Важкий")
+        pool = JobWorkerPool(store, handler, concurrency=2, poll_interval=0.02)
+        pool.start()
+        await asyncio.sleep(0.8)
+        await pool.stop()
+        return calls, store.get(job_id)
+
+    calls, job = asyncio.run(main())
+    assert calls == 1
+    assert job["status"] == DONE and job["attempts"] == 1
+
+def test_webhook_allowlist():
+    hosts = {"hooks.example.com", ".example.org"}
+    assert is_webhook_allowed("https://hooks.example.com/recipes?id=1", hosts)
+    assert is_webhook_allowed("https://api.example.org:8443/hook", hosts)
+    assert not is_webhook_allowed("https://example.org/hook", hosts)
+    assert not is_webhook_allowed("http://hooks.example.com/recipes", hosts)
+    assert not is_webhook_allowed("https://hooks.example.com.attacker.net/", hosts)
+    assert not is_webhook_allowed("https://169.254.169.254/latest/meta-data", hosts)
+    assert not is_webhook_allowed("file:///etc/passwd", hosts)
+    assert not is_webhook_allowed("https://hooks.example.com/", set())
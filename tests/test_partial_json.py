@@ -0,0 +1,53 @@
+import json
+
+from partial_json import IncrementalJSONParser
+
+DOCUMENT = json.dumps({
+    "compatible": True,
+    "recipes": [{
+        "name": "Омлет \"по-домашньому\"",
+        "ingredients": ["3 шт яйця", "50 мл молока"],
+        "instructions": "1. Збити яйця.\\n2. Смажити.",
+        "total_time": 10,
+        "vegetarian": False,
+        "note": None,
+    }],
+}, ensure_ascii=False)
+
+def _parse(text, chunk_size=1):
+    parser = IncrementalJSONParser()
+    for start in range(0, len(text), chunk_size):
+        parser.feed(text[start:start + chunk_size])
+    return parser
+
+def test_complete_document_parses_exactly():
+    for chunk_size in (1, 7, len(DOCUMENT)):
+        assert _parse(DOCUMENT, chunk_size).snapshot() == json.loads(DOCUMENT)
+
+def test_every_prefix_gives_a_snapshot_of_the_document_so_far():
+    parser = IncrementalJSONParser()
+    previous = None
+    for ch in DOCUMENT:
+        parser.feed(ch)
+        snapshot = parser.snapshot()
+        assert snapshot is None or isinstance(snapshot, dict)
+        if snapshot is not None:
+            previous = snapshot
+    assert previous == json.loads(DOCUMENT)
+
+def test_unterminated_string_is_closed():
+    assert _parse('{"recipes": [{"name": "Омл').snapshot() == {"recipes": [{"name": "Омл"}]}
+
+def test_dangling_key_and_partial_literals_are_dropped():
+    assert _parse('{"a": 1, "b"').snapshot() == {"a": 1}
+    assert _parse('{"a": 1, "b": tr').snapshot() == {"a": 1}
+    assert _parse('{"a": [1, 2,').snapshot() == {"a": [1, 2]}
+
+def test_escapes_split_across_chunks():
+    assert _parse('{"a": "x\\').snapshot() == {"a": "x"}
+    assert _parse('{"a": "x\\u04').snapshot() == {"a": "x"}
+    assert _parse('{"a": "\\"}"').snapshot() == {"a": '"}'}
+
+def test_nothing_meaningful_yet():
+    assert _parse("").snapshot() is None
+    assert _parse("  ").snapshot() is None
@@ -0,0 +1,61 @@
+import io
+
+import numpy as np
+from PIL import Image, ImageFilter
+import pytest
+
+from prescreen import REJECT, WARN, ImagePrescreener
+
+def _jpeg(pixels):
+    buffered = io.BytesIO()
+    Image.fromarray(pixels.astype(np.uint8)).save(buffered, format="JPEG", quality=95)
+    return buffered.getvalue()
+
+def _products(height=720, width=1280, seed=0):
+    # Colored blocks with sharp edges stand in for products on a table
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(30, 230, (height // 40, width // 40, 3))
+    return np.kron(blocks, np.ones((40, 40, 1)))
+
+def _blur(pixels, radius=25):
+    return np.asarray(Image.fromarray(pixels.astype(np.uint8)).filter(ImageFilter.GaussianBlur(radius)))
+
+def test_a_photo_of_products_passes():
+    result = ImagePrescreener(mode=REJECT).check(_jpeg(_products()))
+    assert result.passed and result.reasons == [] and result.message == ""
+    assert set(result.scores) == {"brightness", "contrast", "sharpness", "colorfulness"}
+
+@pytest.mark.parametrize("pixels, reason", [
+    (_products() * 0.08, "dark"),
+    (np.full((720, 1280, 3), 250), "overexposed"),
+    (np.full((720, 1280, 3), (120, 90, 60)), "flat"),
+    (_blur(_products()), "blurry"),
+    (_products().mean(axis=2, keepdims=True).repeat(3, axis=2), "not_food"),
+])
+def test_reject_mode_refuses_flagged_photos(pixels, reason):
+    result = ImagePrescreener(mode=REJECT).check(_jpeg(pixels))
+    assert not result.passed
+    assert result.reasons[0] == reason
+    assert result.message
+
+def test_warn_mode_lets_flagged_photos_through_and_counts_them():
+    prescreener = ImagePrescreener(mode=WARN)
+    result = prescreener.check(_jpeg(_products() * 0.08))
+    assert result.passed and result.reasons == ["dark"]
+    prescreener.check(_jpeg(_products()))
+    stats = prescreener.stats.as_dict()
+    assert (stats["checked"], stats["flagged"], stats["rejected"]) == (2, 1, 0)
+    assert stats["reasons"] == {"dark": 1}
+
+def test_classifier_score_below_threshold_is_not_food():
+    prescreener = ImagePrescreener(mode=REJECT, classifier=lambda pixels: 0.1, min_food_score=0.2)
+    result = prescreener.check(_jpeg(_products()))
+    assert result.reasons == ["not_food"] and result.scores["food"] == pytest.approx(0.1)
+
+def test_file_object_is_rewound_and_unreadable_files_pass():
+    prescreener = ImagePrescreener(mode=REJECT)
+    source = io.BytesIO(_jpeg(_products()))
+    assert prescreener.check(source).passed
+    assert source.tell() == 0
+    assert prescreener.check(b"not a jpeg").passed
+    assert prescreener.stats.errors == 1
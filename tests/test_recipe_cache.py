@@ -0,0 +1,40 @@
+import recipe_cache
+from recipe_cache import RecipeCache, canonical_key
+
+def test_key_ignores_order_quantity_casing_and_word_form():
+    key = canonical_key(["5 шт яєць", "Молоко", "100 г масла"], "Легкий")
+    assert key == canonical_key(["вершкове масло", "2 яйця", "молоко"], "легкий")
+    assert key != canonical_key(["яйця", "молоко"], "легкий")
+    assert key != canonical_key(["5 шт яєць", "Молоко", "100 г масла"], "складний")
+    assert canonical_key(["10", "сир"], None) == "|сир"
+
+def test_get_returns_copies_and_evicts_the_least_recently_used():
+    cache = RecipeCache(max_entries=2)
+    cache.put("a", {"recipes": [{"name": "Омлет"}]})
+    cache.put("b", {"recipes": [{"name": "Сирники"}]})
+    cache.get("a")["recipes"].clear()
+    assert cache.get("a") == {"recipes": [{"name": "Омлет"}]}
+    cache.put("c", {"recipes": [{"name": "Деруни"}]})
+    assert cache.get("b") is None
+    assert cache.stats.as_dict() == {"hits": 2, "misses": 1, "refreshes": 0, "hit_rate": 0.6667}
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(recipe_cache.time, "time", lambda: now[0])
+    cache = RecipeCache(ttl=60)
+    cache.put("a", {"name": "Омлет"})
+    now[0] += 61
+    assert cache.lookup("a") == (None, False)
+
+def test_serve_limit_asks_for_a_new_variant_and_rotates_between_variants():
+    cache = RecipeCache(serve_limit=2, max_variants=2)
+    cache.put("a", {"name": "Омлет"})
+    assert cache.lookup("a") == ({"name": "Омлет"}, False)
+    assert cache.lookup("a") == ({"name": "Омлет"}, False)
+    assert cache.lookup("a") == (None, True)
+
+    cache.put("a", {"name": "Фриттата"})
+    cache.put("a", {"name": "Шакшука"})
+    # Only the newest max_variants are kept, served in turn
+    assert [cache.get("a")["name"] for _ in range(2)] == ["Фриттата", "Шакшука"]
+    assert cache.stats.refreshes == 1
@@ -0,0 +1,76 @@
+import random
+
+import pytest
+
+from recipe_store import STAPLES, RecipeStore, _difficulty_factor, _recipe_keys
+
+PRODUCTS = ["яйця", "молоко", "картопля", "цибуля", "морква", "сир", "курятина", "рис", "гречка", "помідори",
+            "огірки", "капуста", "буряк", "гриби", "масло", "сметана", "борошно", "яблука", "риба", "шинка"]
+LEVELS = ["легкий", "середній", "складний"]
+
+def _score(store, stored, query, difficulty):
+    matched = len(stored.keys & query)
+    return (store.coverage_weight * matched / len(stored.keys)
+            + (1 - store.coverage_weight) * matched / len(query)) * _difficulty_factor(stored.difficulty, difficulty)
+
+def _best_score(store, query, difficulty):
+    # Score every stored recipe, as find() would without the index
+    best = max((_score(store, stored, query, difficulty) for stored in store._recipes), default=0.0)
+    return best if best >= store.threshold else None
+
+def test_find_serves_a_covered_recipe_and_lists_unused_ingredients():
+    store = RecipeStore(threshold=0.8)
+    store.add({"name": "Омлет", "ingredients": ["3 шт яйця", "50 мл молока", "сіль"]}, "легкий")
+    found = store.find(["5 шт яєць", "молоко", "2 шт огірки"], "легкий")
+    assert found["compatible"] is True
+    assert found["recipes"][0]["name"] == "Омлет"
+    assert found["recipes"][0]["unused_ingredients"] == ["огірки"]
+    assert store.find(["яйця"], "легкий") is None
+    assert store.stats.as_dict()["hits"] == 1
+
+def test_find_respects_difficulty():
+    store = RecipeStore(threshold=0.9)
+    store.add({"name": "Омлет", "ingredients": ["яйця", "молоко"]}, "легкий")
+    assert store.find(["яйця", "молоко"], "легкий") is not None
+    assert store.find(["яйця", "молоко"], "складний") is None
+
+def test_only_a_prefix_of_each_recipe_is_indexed():
+    store = RecipeStore(threshold=0.9, coverage_weight=0.8)
+    recipe = {"name": "Суп", "ingredients": ["картопля", "цибуля", "морква", "курятина", "рис", "сіль"]}
+    store.add(recipe, "середній")
+    keys = _recipe_keys(recipe)
+    assert not keys & STAPLES
+    anchors = [key for (_, key) in store._index]
+    # min_coverage is 0.875, so 5 of the 5 keys must match and any single key is enough as anchor
+    assert len(anchors) == store._prefix_length(len(keys)) == 1
+    assert store.find(["картопля", "цибуля", "морква", "курятина", "рис"], "середній") is not None
+
+def test_prefix_filtering_matches_a_full_scan():
+    rng = random.Random(7)
+    for threshold, weight in ((0.9, 0.8), (0.7, 0.8), (0.6, 0.5)):
+        store = RecipeStore(threshold=threshold, coverage_weight=weight)
+        store.add_many(
+            {"name": f"Рецепт {i}", "ingredients": rng.sample(PRODUCTS, rng.randint(2, 7)), "difficulty": rng.choice(LEVELS)}
+            for i in range(300)
+        )
+        for _ in range(200):
+            ingredients = rng.sample(PRODUCTS, rng.randint(1, 9))
+            difficulty = rng.choice(LEVELS)
+            found = store.find(ingredients, difficulty)
+            query = frozenset(_recipe_keys({"ingredients": ingredients}))
+            score = None
+            if found:
+                name = found["recipes"][0]["name"]
+                stored = next(stored for stored in store._recipes if stored.recipe["name"] == name)
+                score = _score(store, stored, query, difficulty)
+            # Recipes with equal scores may be found in either order
+            assert score == pytest.approx(_best_score(store, query, difficulty)), (threshold, ingredients, difficulty)
+
+def test_add_result_indexes_learned_recipes_under_the_requested_level(tmp_path):
+    path = tmp_path / "learned.jsonl"
+    store = RecipeStore(threshold=0.9, persist_path=str(path))
+    result = {"compatible": True, "recipes": [{"name": "Омлет", "ingredients": ["яйця", "молоко"], "difficulty": "Просто"}]}
+    assert store.add_result(result, "легкий") == 1
+    assert store.add_result(result, "легкий") == 0
+    assert store.find(["яйця", "молоко"], "легкий") is not None
+    assert '"difficulty": "легкий"' in path.read_text(encoding="utf-8")
@@ -0,0 +1,49 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from ingredient_recognition import IngredientRecognizer, merge_ingredients
+from resilience import ResiliencePolicy
+
+class FakeModel:
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = []
+
+    async def generate_content_async(self, contents, generation_config):
+        image_bytes = contents[0]["parts"][-1]["inline_data"]["data"]
+        self.calls.append(image_bytes)
+        await asyncio.sleep(0.01)
+        answer = self.answers[image_bytes]
+        if isinstance(answer, Exception):
+            raise answer
+        return SimpleNamespace(text=answer, usage_metadata=None)
+
+def _recognizer(answers):
+    recognizer = IngredientRecognizer(api_key="test", resilience=ResiliencePolicy(max_attempts=1, failure_threshold=0))
+    recognizer.model = FakeModel(answers)
+    return recognizer, recognizer.model
+
+def test_recognize_many_merges_the_photos():
+    recognizer, model = _recognizer({b"fridge": "4 шт яйця, масло", b"table": "2 шт яєць, 200 мл молока"})
+    ingredients = asyncio.run(recognizer.recognize_many([b"fridge", b"table"]))
+    assert ingredients == ["6 шт яйця", "масло", "200 мл молоко"]
+    assert sorted(model.calls) == [b"fridge", b"table"]
+
+def test_recognize_many_counts_a_photo_uploaded_twice_once():
+    recognizer, model = _recognizer({b"fridge": "4 шт яйця, масло", b"table": "молоко"})
+    ingredients = asyncio.run(recognizer.recognize_many([b"fridge", b"table", b"fridge"]))
+    assert ingredients == ["4 шт яйця", "масло", "молоко"]
+    assert sorted(model.calls) == [b"fridge", b"table"]
+
+def test_recognize_many_keeps_the_photos_that_were_recognized():
+    recognizer, _ = _recognizer({b"fridge": "масло", b"broken": ValueError("bad image")})
+    assert asyncio.run(recognizer.recognize_many([b"broken", b"fridge"])) == ["масло"]
+
+    recognizer, _ = _recognizer({b"broken": ValueError("bad image")})
+    with pytest.raises(Exception, match="bad image"):
+        asyncio.run(recognizer.recognize_many([b"broken"]))
+
+def test_merge_ingredients_adds_up_quantities():
+    assert merge_ingredients([["3 шт яйця"], ["2 шт яєць", "сир"]]) == ["5 шт яйця", "сир"]
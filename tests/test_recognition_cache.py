@@ -0,0 +1,72 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+import recognition_cache
+from recognition_cache import RecognitionCache, perceptual_hash
+
+def _photo(seed=0, size=(1280, 720), quality=90):
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 256, (9, 16, 3))
+    image = Image.fromarray(np.kron(blocks, np.ones((80, 80, 1))).astype(np.uint8)).resize(size, Image.BILINEAR)
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=quality)
+    return buffered.getvalue()
+
+def test_memory_tier_returns_copies_and_evicts_the_least_recently_used():
+    cache = RecognitionCache(max_entries=2)
+    cache.put(b"a", ["яйця"])
+    cache.put(b"b", ["масло"])
+    cache.get(b"a").append("сир")
+    assert cache.get(b"a") == ["яйця"]
+    cache.put(b"c", ["молоко"])
+    assert cache.get(b"b") is None
+    assert cache.get(b"c") == ["молоко"]
+    assert cache.stats.as_dict() == {"hits": 3, "near_hits": 0, "disk_hits": 0, "misses": 1, "hit_rate": 0.75}
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(recognition_cache.time, "time", lambda: now[0])
+    cache = RecognitionCache(ttl=60)
+    cache.put(b"a", ["яйця"])
+    now[0] += 59
+    assert cache.get(b"a") == ["яйця"]
+    now[0] += 2
+    assert cache.get(b"a") is None
+
+def test_disk_tier_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "recognition.sqlite")
+    RecognitionCache(db_path=path).put(b"a", ["яйця", "масло"])
+    cache = RecognitionCache(db_path=path)
+    assert cache.get(b"a") == ["яйця", "масло"]
+    assert cache.get(b"a") == ["яйця", "масло"]
+    assert (cache.stats.disk_hits, cache.stats.hits) == (1, 1)
+
+def test_perceptual_hash_survives_re_encoding_and_resizing():
+    original = perceptual_hash(_photo())
+    assert original is not None
+    assert bin(original ^ perceptual_hash(_photo(quality=60))).count("1") <= 3
+    assert bin(original ^ perceptual_hash(_photo(size=(960, 540)))).count("1") <= 3
+    assert bin(original ^ perceptual_hash(_photo(seed=1))).count("1") > 3
+    assert perceptual_hash(b"not an image") is None
+
+def test_near_duplicate_photo_is_found_in_both_tiers(tmp_path):
+    path = str(tmp_path / "recognition.sqlite")
+    RecognitionCache(db_path=path, perceptual=True).put(_photo(), ["яйця"])
+    # A new instance has an empty memory tier and matches by the bands stored on disk
+    cache = RecognitionCache(db_path=path, perceptual=True)
+    assert cache.get(_photo(quality=60)) == ["яйця"]
+    assert cache.get(_photo(seed=1)) is None
+    assert cache.get(_photo(size=(960, 540))) == ["яйця"]
+    assert cache.stats.near_hits == 2
+
+def test_disk_tier_keeps_the_newest_entries(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(recognition_cache.time, "time", lambda: now[0])
+    path = str(tmp_path / "recognition.sqlite")
+    cache = RecognitionCache(max_entries=0, db_path=path, max_disk_entries=2)
+    for image_bytes in (b"a", b"b", b"c"):
+        now[0] += 1
+        cache.put(image_bytes, [image_bytes.decode()])
+    assert [cache.get(image_bytes) for image_bytes in (b"a", b"b", b"c")] == [None, ["b"], ["c"]]
@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError, ResiliencePolicy, ResilientCaller
+
+def _policy(**overrides):
+    settings = dict(timeout=1.0, deadline=5.0, max_attempts=3, backoff=0.0, failure_threshold=0)
+    settings.update(overrides)
+    return ResiliencePolicy(**settings)
+
+def test_breaker_opens_after_threshold_and_probes_once(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    assert breaker.record_failure() is False
+    assert breaker.allow()
+    assert breaker.record_failure() is True
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    now[0] += 30
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()  # only one probe at a time
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+def test_breaker_failed_probe_reopens(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    now[0] += 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+def test_call_retries_retryable_errors_only():
+    async def main():
+        caller = ResilientCaller("test", _policy())
+        attempts = []
+
+        async def flaky():
+            attempts.append("flaky")
+            if len(attempts) < 3:
+                raise ConnectionError("reset")
+            return "ok"
+
+        result = await caller.call(flaky)
+
+        async def bad_request():
+            attempts.append("bad")
+            raise ValueError("invalid")
+
+        with pytest.raises(ValueError):
+            await caller.call(bad_request)
+        return result, attempts, caller.retries
+
+    result, attempts, retries = asyncio.run(main())
+    assert result == "ok"
+    assert attempts == ["flaky"] * 3 + ["bad"]
+    assert retries == 2
+
+def test_call_times_out_each_attempt():
+    async def main():
+        caller = ResilientCaller("test", _policy(timeout=0.02, max_attempts=2))
+
+        async def hang():
+            await asyncio.sleep(1)
+
+        with pytest.raises(asyncio.TimeoutError):
+            await caller.call(hang)
+        return caller.timeouts
+
+    assert asyncio.run(main()) == 2
+
+def test_open_circuit_rejects_without_calling():
+    async def main():
+        caller = ResilientCaller("test", _policy(max_attempts=1, failure_threshold=1, reset_timeout=60))
+        calls = 0
+
+        async def down():
+            nonlocal calls
+            calls += 1
+            raise ConnectionError("refused")
+
+        with pytest.raises(ConnectionError):
+            await caller.call(down)
+        with pytest.raises(CircuitOpenError):
+            await caller.call(down)
+        return calls, caller.rejected
+
+    assert asyncio.run(main()) == (1, 1)
+
+def test_hedged_duplicate_wins_and_loser_is_discarded():
+    async def main():
+        caller = ResilientCaller("test", _policy(hedge=True, hedge_min_delay=0.01))
+        for _ in range(caller.latency.min_samples):
+            caller.latency.observe(0.01)
+        delays = [0.5, 0.0]
+        discarded = []
+
+        async def call():
+            delay = delays.pop(0)
+            await asyncio.sleep(delay)
+            return f"slept {delay}"
+
+        async def discard(result):
+            discarded.append(result)
+
+        result = await caller.call(call, discard=discard)
+        await asyncio.sleep(0.01)
+        return result, caller.hedges, caller.hedges_won, discarded
+
+    result, hedges, won, discarded = asyncio.run(main())
+    assert result == "slept 0.0"
+    assert (hedges, won) == (1, 1)
+    # The slow primary was cancelled, so there was no second result to release
+    assert discarded == []
+
+def test_no_hedge_before_enough_latency_samples():
+    async def main():
+        caller = ResilientCaller("test", _policy(hedge=True, hedge_min_delay=0.01))
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        return await caller.call(slow), caller.hedges
+
+    assert asyncio.run(main()) == ("ok", 0)
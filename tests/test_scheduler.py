@@ -0,0 +1,110 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from scheduler import (
+    BACKGROUND,
+    INTERACTIVE,
+    ModelScheduler,
+    TokenBucket,
+    is_rate_limited,
+    priority,
+    retry_after,
+)
+
+class RateLimitError(Exception):
+    def __init__(self, headers=None):
+        super().__init__("429 Too Many Requests")
+        self.status_code = 429
+        self.response = SimpleNamespace(headers=headers or {})
+
+def test_interactive_calls_are_admitted_before_background_ones():
+    async def main():
+        scheduler = ModelScheduler("model", "test", max_concurrency=1)
+        order = []
+
+        async def call(name, level):
+            with priority(level):
+                async with scheduler.slot(10):
+                    order.append(name)
+                    await asyncio.sleep(0.01)
+
+        holder = asyncio.create_task(call("holder", INTERACTIVE))
+        await asyncio.sleep(0)
+        waiters = [
+            asyncio.create_task(call("background 1", BACKGROUND)),
+            asyncio.create_task(call("background 2", BACKGROUND)),
+            asyncio.create_task(call("interactive 1", INTERACTIVE)),
+            asyncio.create_task(call("interactive 2", INTERACTIVE)),
+        ]
+        await asyncio.gather(holder, *waiters)
+        return order, scheduler.stats()
+
+    order, stats = asyncio.run(main())
+    assert order == ["holder", "interactive 1", "interactive 2", "background 1", "background 2"]
+    assert stats["active"] == 0 and stats["waiting"] == 0 and stats["admitted"] == 5
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def main():
+        scheduler = ModelScheduler("model", "test", max_concurrency=1)
+        ticket = await scheduler.acquire(10)
+        waiter = asyncio.create_task(scheduler.acquire(10))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        ticket.release()
+        second = await asyncio.wait_for(scheduler.acquire(10), 1)
+        second.release()
+        return scheduler.active
+
+    assert asyncio.run(main()) == 0
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(60)  # one per second
+    now = time.monotonic()
+    assert bucket.wait_time(60, now) == 0
+    bucket.take(60)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now, factor=0.5) == pytest.approx(2.0)
+    assert bucket.wait_time(1, now + 1) == pytest.approx(0.0)
+
+def test_rate_limit_is_recognized_and_retry_after_is_read():
+    assert is_rate_limited(RateLimitError())
+    assert not is_rate_limited(ValueError())
+    assert retry_after(RateLimitError({"retry-after-ms": "1500"})) == 1.5
+    assert retry_after(RateLimitError({"retry-after": "3"})) == 3.0
+    details = [SimpleNamespace(retry_delay=SimpleNamespace(seconds=2, nanos=500_000_000))]
+    assert retry_after(SimpleNamespace(details=details)) == 2.5
+    assert retry_after(RateLimitError()) is None
+
+def test_429_pauses_calls_and_lowers_the_rate_until_success():
+    async def main():
+        scheduler = ModelScheduler("model", "test", max_concurrency=4)
+        attempts = 0
+
+        async def provider():
+            nonlocal attempts
+            attempts += 1
+            if attempts == 1:
+                raise RateLimitError({"retry-after": "0.05"})
+            return "ok"
+
+        async with scheduler.slot(10) as ticket:
+            with pytest.raises(RateLimitError):
+                await ticket.run(provider)
+            assert scheduler.saturated()
+            lowered = (scheduler.rate_factor, scheduler.concurrency)
+            started = time.monotonic()
+            result = await ticket.run(provider)
+            waited = time.monotonic() - started
+        return result, lowered, waited, scheduler.rate_factor, scheduler.stats()["rate_limits"]
+
+    result, (factor, concurrency), waited, recovered, rate_limits = asyncio.run(main())
+    assert result == "ok"
+    assert factor < 1.0 and concurrency < 4
+    assert waited >= 0.04
+    assert recovered > factor
+    assert rate_limits == 1
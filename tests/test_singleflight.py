@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from singleflight import SharedStream, SingleFlight
+
+def test_do_coalesces_concurrent_calls():
+    async def main():
+        group = SingleFlight()
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(group.do("key", fetch) for _ in range(5)))
+        return results, calls, group.stats()
+
+    results, calls, stats = asyncio.run(main())
+    assert results == ["result"] * 5
+    assert calls == 1
+    assert stats == {"leaders": 1, "coalesced": 4, "in_flight": 0}
+
+def test_do_cancelled_waiter_does_not_cancel_shared_call():
+    async def main():
+        group = SingleFlight()
+        finished = asyncio.Event()
+
+        async def fetch():
+            await asyncio.sleep(0.05)
+            finished.set()
+            return "result"
+
+        leader = asyncio.create_task(group.do("key", fetch))
+        follower = asyncio.create_task(group.do("key", fetch))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower, finished.is_set()
+
+    assert asyncio.run(main()) == ("result", True)
+
+def test_do_propagates_errors_and_forgets_the_key():
+    async def main():
+        group = SingleFlight()
+
+        async def fail():
+            raise ValueError("boom")
+
+        async def succeed():
+            return "ok"
+
+        with pytest.raises(ValueError):
+            await group.do("key", fail)
+        return await group.do("key", succeed)
+
+    assert asyncio.run(main()) == "ok"
+
+def test_stream_cancelled_subscriber_does_not_stop_the_others():
+    async def main():
+        group = SingleFlight()
+
+        async def produce():
+            for i in range(5):
+                await asyncio.sleep(0.01)
+                yield i
+
+        async def collect():
+            return [item async for item in group.stream("key", produce)]
+
+        async def give_up():
+            async for item in group.stream("key", produce):
+                if item == 1:
+                    raise asyncio.CancelledError
+
+        leader = asyncio.create_task(collect())
+        await asyncio.sleep(0)
+        quitter = asyncio.create_task(give_up())
+        follower = asyncio.create_task(collect())
+        with pytest.raises(asyncio.CancelledError):
+            await quitter
+        return await leader, await follower, group.stats()
+
+    leader, follower, stats = asyncio.run(main())
+    assert leader == follower == [0, 1, 2, 3, 4]
+    assert stats["leaders"] == 1
+
+def test_shared_stream_late_subscriber_replays_items_and_errors():
+    async def main():
+        async def produce():
+            yield 1
+            yield 2
+            raise RuntimeError("stream broke")
+
+        stream = SharedStream(produce())
+        await asyncio.sleep(0.01)
+        items = []
+        with pytest.raises(RuntimeError):
+            async for item in stream.subscribe():
+                items.append(item)
+        return items
+
+    assert asyncio.run(main()) == [1, 2]
@@ -0,0 +1,94 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from recipe_generator import RecipeGenerator
+from resilience import ResiliencePolicy
+from scheduler import ModelScheduler
+from speculation import SpeculativePrecomputer
+
+class FakeCompletions:
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.calls = []
+
+    async def create(self, **params):
+        self.calls.append(params["messages"][-1]["content"])
+        await asyncio.sleep(self.delay)
+        content = json.dumps({"compatible": True, "recipes": [{"name": f"Рецепт {len(self.calls)}"}]})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+def _generator(max_concurrency=1):
+    completions = FakeCompletions()
+    generator = RecipeGenerator(SimpleNamespace(chat=SimpleNamespace(completions=completions)),
+                                resilience=ResiliencePolicy(failure_threshold=0))
+    generator.scheduler = ModelScheduler("o4-mini", "openai", max_concurrency=max_concurrency)
+    return generator, completions
+
+async def _hold_slot(scheduler, seconds):
+    async with scheduler.slot(1):
+        await asyncio.sleep(seconds)
+
+def test_take_promotes_a_queued_speculative_call_ahead_of_later_interactive_ones():
+    async def main():
+        generator, completions = _generator()
+        speculator = SpeculativePrecomputer(generator)
+        session = {}
+
+        speculator.schedule(session, ["кабачки", "баклажани"], ["складний"])
+        blocker = asyncio.create_task(_hold_slot(generator.scheduler, 0.05))
+        await asyncio.sleep(0.01)
+        # The speculative call now waits at background priority behind the blocker
+        interactive = asyncio.create_task(generator.generate_recipes(["шинка", "банани"], "легкий"))
+        await asyncio.sleep(0.01)
+
+        recipe_data = await speculator.take(session, ["кабачки", "баклажани"], "складний")
+        await asyncio.gather(blocker, interactive)
+        return recipe_data, completions.calls, speculator.stats.as_dict()
+
+    recipe_data, calls, stats = asyncio.run(main())
+    assert recipe_data["recipes"]
+    assert len(calls) == 2
+    assert "кабачки" in calls[0] and "шинка" in calls[1]
+    assert stats["used"] == 1
+
+def test_take_cancels_work_that_has_not_reached_the_generator():
+    async def main():
+        generator, completions = _generator()
+        speculator = SpeculativePrecomputer(generator)
+        session = {}
+
+        blocker = asyncio.create_task(_hold_slot(generator.scheduler, 0.05))
+        await asyncio.sleep(0)
+        # The scheduler is saturated, so the speculative task backs off before generating
+        speculator.schedule(session, ["яйця"], ["складний"])
+        await asyncio.sleep(0.01)
+        recipe_data = await speculator.take(session, ["яйця"], "складний")
+        await blocker
+        await asyncio.sleep(0.01)
+        return recipe_data, completions.calls, speculator.stats.as_dict()
+
+    recipe_data, calls, stats = asyncio.run(main())
+    assert recipe_data is None
+    assert calls == []
+    assert stats["cancelled"] == 1 and stats["deferred"] == 1
+
+def test_take_returns_a_finished_recipe_and_discard_cancels_the_rest():
+    async def main():
+        generator, completions = _generator(max_concurrency=4)
+        speculator = SpeculativePrecomputer(generator, max_calls=1)
+        session = {}
+
+        speculator.schedule(session, ["яйця"], ["легкий", "складний"])
+        await asyncio.sleep(0.05)
+        recipe_data = await speculator.take(session, ["Яйце"], "легкий")
+        missing = await speculator.take(session, ["яйця"], "складний")
+        speculator.schedule(session, ["сир"], ["середній"])
+        speculator.discard(session)
+        return recipe_data, missing, session, speculator.stats.as_dict()
+
+    recipe_data, missing, session, stats = asyncio.run(main())
+    assert recipe_data["recipes"] and missing is None
+    assert "speculative" not in session
+    # The budget allows one call per window
+    assert stats["started"] == 1 and stats["skipped_budget"] == 2